@@ -0,0 +1,185 @@
+"""
+Common base class for the pipeline agents.
+"""
+from typing import List
+
+from autogen import AssistantAgent
+from llm.dispatcher import PRIORITY_DEFAULT, get_dispatcher
+from llm.ollama_client import get_ollama_client
+from llm.parsing import StructuredOutputError
+from llm.prompts import PromptSection, fit_prompt, prompt_budget
+from llm.structured import repair_prompt
+from llm.tokens import get_token_counter
+from llm_config import get_prompt_config, get_structured_output_config
+from planning.tracing import record_llm_call, record_prompt_fit, record_retry, record_stream_timing
+from state.response_cache import ResponseCache, get_response_cache
+
+class PipelineAgent(AssistantAgent):
+    # Dispatcher priority for this agent's calls; lower runs first
+    priority = PRIORITY_DEFAULT
+
+    def __init__(self, name: str, system_message: str, llm_config: dict, use_cache: bool = True,
+                 stream: bool = False):
+        super().__init__(
+            name=name,
+            system_message=system_message,
+            llm_config=llm_config
+        )
+        self.pipeline_llm_config = llm_config
+        self.use_cache = use_cache
+        # Stream replies when ask() is given an extractor that can end them early
+        self.stream = stream
+        structured = get_structured_output_config()
+        self.structured_output = structured["enabled"]
+        self.max_repairs = structured["max_repairs"]
+
+    @property
+    def model_name(self) -> str:
+        return self.pipeline_llm_config["config_list"][0]["model"]
+
+    def build_prompt(self, sections: List[PromptSection]) -> str:
+        """Join `sections` into a prompt, trimming the least important until it fits this model's budget."""
+        counter = get_token_counter()
+        model = self.model_name
+        budget = prompt_budget(model, counter.count(model, self.system_message))
+        fitted = fit_prompt(sections, budget, lambda text: counter.count(model, text))
+        record_prompt_fit(bool(fitted.trimmed), fitted.over_budget)
+        return fitted.text
+
+    def ask(self, prompt: str, extractor=None, response_format=None, options=None) -> str:
+        """
+        Send a single user prompt to the model and return the reply text.
+
+        Replies are served from the persistent response cache when the same
+        model, system message, prompt and temperature were seen before.
+
+        With `extractor` (an object with `feed(chunk) -> bool`, such as
+        llm.streaming.SQLStreamExtractor) and streaming enabled, the reply is
+        streamed and the request is cut off as soon as the extractor is done.
+        The extractor is fed cached replies too, so its result is always set.
+
+        `response_format` (a JSON schema) is passed to Ollama as `format` to
+        constrain the reply; other backends ignore it. `options` (for example
+        a sampling temperature and seed) override the configured Ollama
+        options for this call and are part of the cache key.
+        """
+        cache = get_response_cache() if self.use_cache else None
+        if cache is not None and cache.is_bypassed(self.name):
+            cache = None
+
+        key = None
+        if cache is not None:
+            key = ResponseCache.make_key(
+                self.model_name,
+                self.system_message,
+                prompt,
+                self.pipeline_llm_config.get("temperature"),
+                response_format,
+                options
+            )
+            cached = cache.get(key, self.name)
+            if cached is not None:
+                record_llm_call(len(prompt), cached=True)
+                if extractor is not None:
+                    extractor.feed(cached)
+                return cached
+
+        content, usage = self._complete(prompt, extractor, response_format, options)
+        record_llm_call(len(prompt), usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0),
+                        estimated=usage.get("estimated", False))
+        if not usage.get("estimated"):
+            # Estimates come from the counter itself and would not calibrate it
+            get_token_counter().observe(self.model_name, len(self.system_message) + len(prompt),
+                                        usage.get("prompt_tokens", 0))
+
+        if cache is not None and content:
+            cache.put(key, self.name, self.model_name, content)
+        return content
+
+    def _complete(self, prompt: str, extractor=None, response_format=None, options=None):
+        """Return the reply text and a usage dict with prompt/completion token counts and whether they are estimates."""
+        config = self.pipeline_llm_config["config_list"][0]
+        if config.get("api_type") == "ollama":
+            # Talk to Ollama over the shared keep-alive client instead of a per-agent one
+            base_url = config.get("base_url", "http://localhost:11434")
+            client = get_ollama_client(base_url)
+            temperature = self.pipeline_llm_config.get("temperature")
+            messages = [
+                {"role": "system", "content": self.system_message},
+                {"role": "user", "content": prompt}
+            ]
+            options = {**({"temperature": temperature} if temperature is not None else {}), **(options or {})}
+            prompt_config = get_prompt_config()
+            if prompt_config["set_num_ctx"]:
+                options.setdefault("num_ctx", prompt_config["context_windows"].get(self.model_name)
+                                   or prompt_config["context_window"])
+            options = options or None
+            timeout = self.pipeline_llm_config.get("timeout")
+            extra = {"format": response_format} if response_format is not None else {}
+            if self.stream and extractor is not None:
+                call = lambda: client.chat_stream(self.model_name, messages, options, timeout,
+                                                  stop_when=extractor.feed, **extra)
+            else:
+                call = lambda: client.chat(self.model_name, messages, options, timeout, **extra)
+
+            # Queue behind other agents' calls so the server is not made to swap models
+            dispatcher = get_dispatcher(base_url)
+            response = dispatcher.run(self.model_name, call, self.priority) if dispatcher else call()
+
+            if self.stream and extractor is not None:
+                record_stream_timing(response["time_to_first_token"], response["elapsed"], response["stopped_early"])
+            else:
+                content = response.get("message", {}).get("content") or ""
+                if extractor is not None:
+                    extractor.feed(content)
+            usage = {
+                "prompt_tokens": response.get("prompt_eval_count", 0),
+                "completion_tokens": response.get("eval_count", 0),
+                # Counted from the text, not by the server, for streams stopped early
+                "estimated": bool(response.get("prompt_eval_count_estimated") or response.get("eval_count_estimated"))
+            }
+            return response.get("message", {}).get("content") or "", usage
+
+        response = self.generate_reply(messages=[{"role": "user", "content": prompt}])
+        content = response.get("content") if isinstance(response, dict) else response
+        content = "" if content is None else str(content)
+        if extractor is not None:
+            extractor.feed(content)
+        # autogen does not report per-call usage through generate_reply
+        return content, {}
+
+    def ask_structured(self, prompt: str, parse, response_format=None):
+        """
+        Ask for a JSON reply and return `parse(reply)`.
+
+        With structured output enabled, `response_format` constrains decoding.
+        When `parse` raises StructuredOutputError, up to `max_repairs` short
+        follow-up calls send back only the failing fragment and its error, and
+        the fixed fragment is merged with whatever did parse. If the repairs
+        fail too, that parsed part is returned, or the last error raised.
+        """
+        response_format = response_format if self.structured_output else None
+        try:
+            return parse(self.ask(prompt, response_format=response_format))
+        except StructuredOutputError as e:
+            error = e
+
+        for _ in range(self.max_repairs):
+            record_retry()
+            try:
+                repaired = parse(self.ask(repair_prompt(error), response_format=response_format))
+            except StructuredOutputError as e:
+                if error.partial is not None:
+                    e.partial = error.partial.merge(e.partial) if e.partial is not None else error.partial
+                error = e
+                continue
+            return error.partial.merge(repaired) if error.partial is not None else repaired
+        if error.partial is not None:
+            # Still broken after the repairs; settle for the part that did parse
+            return error.partial
+        raise error
+
+    def invalidate_cache(self) -> int:
+        """Drop every cached reply produced by this agent."""
+        cache = get_response_cache()
+        return cache.invalidate(self.name) if cache is not None else 0
@@ -1,12 +1,19 @@
-from autogen import AssistantAgent
+from agents.base_agent import PipelineAgent
+from catalog.dialects import get_dialect
+from control.transpile import transpile_output
+from llm.dispatcher import PRIORITY_FALLBACK
 import json
-import re
+from llm.parsing import extract_sql
+from llm.prompts import PromptSection, schema_section, values_section
+from llm.streaming import SQLStreamExtractor
 
-class FallbackSQLGenerator(AssistantAgent):
-    def __init__(self, llm_config):
+class FallbackSQLGenerator(PipelineAgent):
+    priority = PRIORITY_FALLBACK
+
+    def __init__(self, llm_config, use_cache=True, stream=True):
         system_message = """You are a fallback SQL query generator. Your task is to:
-1. Read the previous analysis and failed SQL query feedback
-2. Generate a corrected MySQL query that:
+1. Read the failed SQL query, its validation feedback, the schema and the analysis
+2. Generate a corrected query, in the SQL dialect named in the request, that:
    - Resolves issues from the previous validation
    - Uses identified tables, columns, and conditions
 3. Explain each part using inline comments
@@ -15,65 +22,56 @@ class FallbackSQLGenerator(AssistantAgent):
         super().__init__(
             name="FallbackSQLGenerator",
             system_message=system_message,
-            llm_config=llm_config
+            llm_config=llm_config,
+            use_cache=use_cache,
+            stream=stream
         )
 
     def run(self, state: dict) -> dict:
-        analysis = state.get("analysis")
+        """Write one corrected query from the failed SQL and its validation feedback; validation is the caller's."""
         validation = state.get("validation_result")
+        failed_sql = state.get("sql_query")
+        if not validation or validation.get("is_valid", True) or not failed_sql:
+            raise ValueError("Fallback requires a failed query and its validation result.")
 
-        if not analysis or not validation or validation.get("is_valid", True):
-            raise ValueError("Fallback requires failed validation and existing analysis.")
+        feedback = list(validation.get("suggestions") or [])
+        if validation.get("error") and validation["error"] not in feedback:
+            feedback.insert(0, f"Database error: {validation['error']}")
+        dialect = get_dialect(state.get("generation_dialect") or state.get("dialect"))
+        feedback_lines = "\n".join(f"- {item}" for item in feedback)
 
-        prompt = f"""The previous SQL query was invalid. Use the following analysis and suggestions to regenerate a valid MySQL query.
+        prompt = self.build_prompt([
+            PromptSection(f"""The previous SQL query was invalid. Fix it using the feedback, the schema and the analysis below.
+Write the corrected query for {dialect.label}:
+{dialect.prompt_rules()}
 
-Analysis:
-{json.dumps(analysis, indent=2)}
+Question:
+{state.get("question", "")}
 
-Suggestions:
-{json.dumps(validation.get("suggestions", []), indent=2)}
+""", "instructions"),
+            schema_section(state, "Schema:\n", "\n\n"),
+            values_section(state, "Stored values the question mentions (use this spelling in literals):\n"),
+            PromptSection(f"""Analysis:
+{json.dumps(state.get("analysis") or {}, separators=(",", ":"))}
 
-Respond with the new SQL query in triple backticks:
+""", "analysis", priority=2, optional=True),
+            PromptSection(f"""Previous SQL query:
 ```sql
-SELECT ...
-```"""
-
-        response = self.generate_reply(messages=[{"role": "user", "content": prompt}])
-        content = response if isinstance(response, str) else json.dumps(response)
-
-        match = re.search(r"```sql\n(.*?)\n```", content, re.DOTALL)
-        if not match:
-            raise ValueError("Failed to extract fallback SQL query.")
-        
-        new_sql = match.group(1).strip()
-
-        # Reuse validator logic
-        schema = state.get("schema", "")
-        validator_prompt = f"""You are given a SQL query and the PostgreSQL schema. Validate the SQL query.
-
-SQL Query:
-```sql
-{new_sql}
+{failed_sql}
 ```
 
-Schema:
-```sql
-{schema}
-```
+Feedback:
+{feedback_lines}
 
-Respond in this format:
-{{
-  "is_valid": true,
-  "final_query": "...",
-  "suggestions": []
-}}"""
+Respond with the corrected SQL query in triple backticks:
+```sql
+SELECT ...
+```""", "request")
+        ])
 
-        validation_response = self.generate_reply(messages=[{"role": "user", "content": validator_prompt}])
-        try:
-            parsed = json.loads(validation_response if isinstance(validation_response, str) else json.dumps(validation_response))
-            if parsed.get("is_valid"):
-                return {"final_query": parsed.get("final_query") or new_sql}
-            else:
-                raise ValueError(f"Fallback SQL validation failed: {parsed.get('suggestions')}")
-        except Exception as e:
-            raise ValueError(f"Failed to validate fallback SQL: {e}")
+        extractor = SQLStreamExtractor()
+        content = self.ask(prompt, extractor)
+        new_sql = extractor.sql or extract_sql(content)
+        if not new_sql:
+            raise ValueError("Failed to extract fallback SQL query.")
+        return {"sql_query": transpile_output(new_sql, state)}
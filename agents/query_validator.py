@@ -1,11 +1,18 @@
 """
 Query Validator agent that validates and optimizes SQL queries.
 """
-from autogen import AssistantAgent
-import json
+from agents.base_agent import PipelineAgent
+from catalog.dialects import get_dialect
+from llm.dispatcher import PRIORITY_VALIDATION
+from llm.parsing import parse_validation
+from llm.prompts import PromptSection, schema_section
+from llm.structured import VALIDATION_FORMAT
+from control.local_validator import check_sql, needs_semantic_review, INVALID, VALID
 
-class QueryValidator(AssistantAgent):
-    def __init__(self, llm_config):
+class QueryValidator(PipelineAgent):
+    priority = PRIORITY_VALIDATION
+
+    def __init__(self, llm_config, use_cache=True, review_policy="complex", local_only=False):
         system_message = """You are a SQL query validator. Your task is to:
 1. Read the generated SQL query
 2. Validate:
@@ -33,41 +40,56 @@ Example output format:
         super().__init__(
             name="QueryValidator",
             system_message=system_message,
-            llm_config=llm_config
+            llm_config=llm_config,
+            use_cache=use_cache
         )
+        # When locally-valid queries still get an LLM review: "always", "never" or "complex"
+        self.review_policy = review_policy
+        # Never call the model: queries that cannot be checked locally count as invalid
+        self.local_only = local_only
 
     def run(self, state: dict) -> dict:
         sql_query = state.get("sql_query")
-        schema = state.get("schema", "")
 
         if not sql_query:
             raise ValueError("Missing 'sql_query' in state")
 
-        prompt = f"""You are given the following SQL query and the corresponding PostgreSQL schema. Validate the SQL query for syntax, correctness, and logical consistency with the schema. Provide structured feedback as shown in the expected format.
+        # Settle what we can locally before paying for a model call
+        db_id = state.get("db_id")
+        if db_id:
+            local = check_sql(sql_query, db_id, state.get("dialect"))
+            if self.local_only or local["status"] == INVALID or (
+                local["status"] == VALID and not needs_semantic_review(sql_query, self.review_policy)
+            ):
+                return {
+                    "validation_result": local,
+                    "final_query": local.get("final_query")
+                }
+
+        dialect = get_dialect(state.get("dialect"))
+        prompt = self.build_prompt([
+            PromptSection(f"""You are given the following {dialect.label} query and the corresponding database schema. Validate the SQL query for syntax, correctness, and logical consistency with the schema. Provide structured feedback as shown in the expected format.
 
 SQL Query:
 ```sql
 {sql_query}
 ```
 
-Database Schema:
-```sql
-{schema}
-```
-
-Respond in the following JSON format:
-{{
+""", "query"),
+            schema_section(state, "Database Schema:\n```sql\n", "\n```\n\n"),
+            PromptSection("""Respond in the following JSON format:
+{
     "is_valid": true,
     "optimizations": [],
     "suggestions": [],
     "final_query": "..."
-}}
-"""
+}
+""", "format")
+        ])
 
-        response = self.generate_reply(messages=[{"role": "user", "content": prompt}])
         try:
-            result = response if isinstance(response, dict) else json.loads(response)
-        except Exception as e:
+            result = self.ask_structured(prompt, parse_validation, VALIDATION_FORMAT).as_dict()
+        except ValueError as e:
             raise ValueError(f"Failed to parse validation result as JSON: {e}")
 
         return {
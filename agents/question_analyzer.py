@@ -1,53 +1,41 @@
 """
 Question analyzer agent that identifies required tables and columns from the question.
 """
-from autogen import AssistantAgent
+from agents.base_agent import PipelineAgent
+from llm.dispatcher import PRIORITY_ANALYSIS
+from llm.parsing import parse_analysis
+from llm.prompts import PromptSection, examples_section, schema_section, values_section
+from llm.structured import analysis_format
+from catalog.schema_catalog import get_schema_catalog
 import json
 
-class QuestionAnalyzer(AssistantAgent):
-    def __init__(self, llm_config):
-        system_message = """As an experienced and professional database administrator, your task is to analyze a user question and a database schema to provide relevant information. The database schema consists of table descriptions, each containing multiple column descriptions. Your goal is to identify the relevant tables and columns based on the user question and evidence provided.
+class QuestionAnalyzer(PipelineAgent):
+    priority = PRIORITY_ANALYSIS
 
-[Instruction]
-1. Discard any table schema that is not related to the user question and evidence.
-2. Sort the columns in each relevant table in descending order of relevance and keep the top 6 columns.
-3. Ensure that at least 3 tables are included in the final output JSON.
-4. The output should be in JSON format.
-5. Do not modify table names or column names from table_names_original and column_names_original at any point in the process.
+    def __init__(self, llm_config, use_cache=True):
+        system_message = """As an experienced and professional database administrator, your task is to analyze a user question and a database schema and identify the tables and columns needed to answer the question.
 
-Important: Never interchange or mix columns between different tables. Only use columns that belong to the specified table. Ensure the SQL query uses correct table-column relationships as defined in the schema.
-
-[Requirements]
-1. If a table has less than or equal to 10 columns, mark it as "keep_all".
-2. If a table is completely irrelevant to the user question and evidence, mark it as "drop_all".
-3. Prioritize the columns in each relevant table based on their relevance.
-
-[Important Notes]
-- The JSON should start and end with curly braces.
-- Ensure that the key-value pairs are correctly formatted with no extra characters or text.
-- If a table is relevant, use "keep_all", and if it's irrelevant, use "drop_all".
-- For the relevant tables, list the columns in an array, and only include the top columns in descending order of relevance.
-- The output should strictly follow the format without any extra text.
+[Instructions]
+1. Mark a table that is not related to the question "drop_all".
+2. Mark a relevant table with 10 or fewer columns "keep_all".
+3. For a larger relevant table, list its most relevant columns, at most 6, in descending order of relevance.
+4. Never modify table or column names, and never move a column to a table it does not belong to.
+5. Reply with only the JSON object, with no other text.
 
 [Answer]
-'''json
+```json
 {
   "account": ["account_id", "district_id", "frequency", "date"],
-  "client": ["client_id", "gender", "birth_date", "district_id"],
-  "district": ["district_id", "A11", "A2", "A4", "A6", "A7"]
+  "client": "keep_all",
+  "loan": "drop_all"
 }
-'''
+```"""
 
-==========
-Here is a new example, please start answering:
-User Question : {{user_question}}
-Schema Details: {{DB_Json}}
-evidence: {{evidence}}"""
-        
         super().__init__(
             name="QuestionAnalyzer",
             system_message=system_message,
-            llm_config=llm_config
+            llm_config=llm_config,
+            use_cache=use_cache
         )
 
     def run(self, state: dict) -> dict:
@@ -56,35 +44,43 @@ evidence: {{evidence}}"""
         if not question or not schema:
             raise ValueError("Missing 'question' or 'schema' in state")
 
-        prompt = f"""Given the following SQL database schema and a natural language question, analyze the question and extract relevant tables, columns, relationships, and conditions.
-
-Schema:
-{schema}
-
-Question:
-{question}
-
-Respond in the structured JSON format as previously instructed.
-"""
-        response = self.generate_reply(messages=[{"role": "user", "content": prompt}])
-        print("\n=== RAW MODEL RESPONSE ===")
-        print(response)
-        print("==========================")
-        import re
+        prompt = self.build_prompt([
+            PromptSection("Given the following SQL database schema and a natural language question, analyze the question "
+                          "and extract relevant tables, columns, relationships, and conditions.\n\n", "instructions"),
+            schema_section(state, "Schema:\n", "\n\n", use_analysis=False),
+            values_section(state, "Values stored in the database that the question mentions:\n"),
+            examples_section(state, "Solved questions on this database, with the SQL that answered them:\n"),
+            PromptSection(f"Question:\n{question}\n\nRespond in the structured JSON format as previously instructed.\n",
+                          "question")
+        ])
+        tables = self._schema_columns(state)
+        known_tables = list(tables) or None
+
+        def parse(response):
+            print("\n=== RAW MODEL RESPONSE ===")
+            print(response)
+            print("==========================")
+            return parse_analysis(response, known_tables)
 
         try:
-            content = response["content"] if isinstance(response, dict) else response
-
-            # Extract JSON block inside ```json ... ```
-            match = re.search(r"```json\s*(.*?)```", content, re.DOTALL)
-            json_str = match.group(1) if match else content
-
-            analysis = json.loads(json_str)
+            # Constrained to the linked tables and their columns when structured output is on
+            analysis = self.ask_structured(prompt, parse, analysis_format(tables)).as_dict()
             print("=== PARSED ANALYSIS ===")
             print(json.dumps(analysis, indent=2))
-        except Exception as e:
+        except ValueError as e:
             print("=== ERROR DURING ANALYSIS ===")
             print(e)
             raise ValueError(f"Failed to parse analysis as JSON: {e}")
 
-        return {"analysis": analysis}
\ No newline at end of file
+        return {"analysis": analysis}
+
+    @staticmethod
+    def _schema_columns(state: dict) -> dict:
+        """Column names of each table in the linked schema, or {} when the tables are not known."""
+        db_id = state.get("db_id")
+        names = state.get("schema_tables")
+        if not db_id or not names:
+            return {}
+        db = get_schema_catalog().get(db_id)
+        tables = [db.table(name) for name in names]
+        return {table.name: [column.name for column in table.columns.values()] for table in tables if table}
\ No newline at end of file
@@ -0,0 +1,57 @@
+"""
+Registry that builds each agent once and hands it out again for later questions.
+"""
+import json
+import threading
+from typing import Any, Dict, Tuple, Type
+
+
+class AgentRegistry:
+    """
+    Caches agent instances per (agent class, model config).
+
+    Instances are kept per thread so concurrent questions never share an agent's
+    conversation history; with a worker pool that means at most one instance
+    per worker per config. Every `get` resets the agent's history.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def _key(agent_cls: Type, llm_config: dict, kwargs: dict) -> Tuple[str, str, str]:
+        return (
+            f"{agent_cls.__module__}.{agent_cls.__qualname__}",
+            json.dumps(llm_config, sort_keys=True, default=str),
+            json.dumps(kwargs, sort_keys=True, default=str)
+        )
+
+    def get(self, agent_cls: Type, llm_config: dict, **kwargs) -> Any:
+        agents: Dict[Tuple[str, str, str], Any] = getattr(self._local, "agents", None)
+        if agents is None:
+            agents = self._local.agents = {}
+
+        key = self._key(agent_cls, llm_config, kwargs)
+        agent = agents.get(key)
+        if agent is None:
+            agent = agents[key] = agent_cls(llm_config, **kwargs)
+            with self._lock:
+                self.created += 1
+        else:
+            agent.reset()
+            with self._lock:
+                self.reused += 1
+        return agent
+
+
+_registry = AgentRegistry()
+
+def get_agent(agent_cls: Type, llm_config: dict, **kwargs) -> Any:
+    """Return a ready-to-use `agent_cls` for `llm_config` from the process-wide registry."""
+    return _registry.get(agent_cls, llm_config, **kwargs)
+
+def get_agent_registry() -> AgentRegistry:
+    return _registry
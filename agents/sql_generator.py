@@ -1,61 +1,87 @@
 """
 SQL Generator agent that creates SQL queries based on the analysis.
 """
-from autogen import AssistantAgent
+from agents.base_agent import PipelineAgent
+from catalog.dialects import get_dialect
+from control.transpile import transpile_output
+from llm.dispatcher import PRIORITY_GENERATION
 import json
-import re
+from llm.parsing import extract_sql
+from llm.prompts import PromptSection, examples_section, schema_section, values_section
+from llm.streaming import SQLStreamExtractor
 
-class SQLGenerator(AssistantAgent):
-    def __init__(self, llm_config):
-        system_message = """You are a SQL generation agent specialized in Postgres. Follow the instructions carefully and use table aliases."""
+class SQLGenerator(PipelineAgent):
+    priority = PRIORITY_GENERATION
+
+    def __init__(self, llm_config, use_cache=True, stream=True):
+        system_message = """You are a SQL generation agent. Write SQL for the dialect named in each request, follow the instructions carefully and use table aliases."""
         
         super().__init__(
             name="SQLGenerator",
             system_message=system_message,
-            llm_config=llm_config
+            llm_config=llm_config,
+            use_cache=use_cache,
+            stream=stream
         )
 
     def run(self, state: dict) -> dict:
+        return {"sql_query": self.generate(state)}
+
+    def generate(self, state: dict, options: dict = None) -> str:
+        """
+        One SQL query for the question in `state`, in the state's target dialect.
+
+        The model is prompted in `generation_dialect` (default: the target)
+        and its query is transpiled to the target when the two differ.
+
+        `options` override the model's sampling options for this call, e.g.
+        {"temperature": 0.7, "seed": 3} to draw one of several distinct samples.
+        """
         question = state.get("question")
         schema = state.get("schema")
         analysis = state.get("analysis")
         if not question or not schema or not analysis:
             raise ValueError("Missing one of: question, schema, or analysis in state")
+        dialect = get_dialect(state.get("generation_dialect") or state.get("dialect"))
 
-        prompt = f"""### Instructions:
-You are an expert Postgres SQL query writer. Your task is to convert a natural language question into a syntactically correct SQL query using a database schema.
+        prompt = self.build_prompt([
+            PromptSection(f"""### Instructions:
+You are an expert {dialect.label} SQL query writer. Your task is to convert a natural language question into a syntactically correct SQL query using a database schema.
 Adhere to these rules:
 - **Deliberately go through the question and database schema word by word** to appropriately answer the question.
 - **Use Table Aliases** to prevent ambiguity. For example, `SELECT t1.col1, t2.col1 FROM t1 JOIN t2 ON t1.id = t2.id`.
 - When creating a ratio, always cast the numerator as float.
+{dialect.prompt_rules()}
 
 ### Input:
 Generate a SQL query that answers the following natural language question:
 \"\"\"{question}\"\"\"
 
-This query will run on a PostgreSQL database. Below is the database schema and extracted analysis to help you:
+This query will run on a {dialect.label} database. Below is the database schema and extracted analysis to help you:
 
-### PostgreSQL Schema:
-{schema}
+""", "instructions"),
+            schema_section(state, f"### {dialect.label} Schema:\n", "\n\n"),
+            PromptSection(f"""### Analysis (relevant tables, columns, and key conditions):
+{json.dumps(analysis, separators=(",", ":"))}
 
-### Analysis (relevant tables, columns, and key conditions):
-{json.dumps(analysis, indent=2)}
-
-### Response:
+""", "analysis", priority=2, optional=True),
+            values_section(state, "### Stored values (use this spelling in literals):\n"),
+            examples_section(state, "### Examples (solved questions on this database):\n"),
+            PromptSection(f"""### Response:
 Based on your instructions, here is the SQL query I have generated to answer the question `{question}`:
 ```sql
-"""
-        response = self.generate_reply(messages=[{"role": "user", "content": prompt}])
-        content = response["content"] if isinstance(response, dict) else str(response)
-
-        # Extract SQL block from model output
-        match = re.search(r"```sql\s*(.*?)```", content, re.DOTALL)
-        if not match:
-            match = re.search(r"```\s*(.*?)```", content, re.DOTALL)
-        if not match:
-            match = re.search(r"(SELECT .*?);", content, re.DOTALL | re.IGNORECASE)
-        if not match:
+""", "response")
+        ])
+        # Stream the reply and stop as soon as the SQL statement is complete
+        extractor = SQLStreamExtractor()
+        content = self.ask(prompt, extractor, options=options)
+        sql = extractor.sql or extractor.finish()
+        if sql:
+            return transpile_output(sql, state)
+
+        sql = extract_sql(content)
+        if not sql:
             print("MODEL RESPONSE:\n", content)
             raise ValueError("Failed to extract SQL from response")
 
-        return {"sql_query": match.group(1).strip()}
\ No newline at end of file
+        return transpile_output(sql, state)
\ No newline at end of file
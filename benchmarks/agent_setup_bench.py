@@ -0,0 +1,75 @@
+"""
+Microbenchmark: per-question agent setup cost with and without the agent registry.
+
+Only agent construction and reset are timed; no model is called.
+
+    python -m benchmarks.agent_setup_bench --questions 200
+"""
+import argparse
+import time
+
+from agents.fallback_sql_generator import FallbackSQLGenerator
+from agents.query_validator import QueryValidator
+from agents.question_analyzer import QuestionAnalyzer
+from agents.registry import AgentRegistry
+from agents.sql_generator import SQLGenerator
+from llm_config import get_llm_config, get_sqlcoder_config
+
+
+def setup_fresh(llm_config, sql_config):
+    # What process_question used to do for every question
+    return [
+        QuestionAnalyzer(llm_config),
+        SQLGenerator(sql_config),
+        QueryValidator(llm_config),
+        QueryValidator(llm_config),
+        FallbackSQLGenerator(sql_config)
+    ]
+
+
+def setup_registry(registry, llm_config, sql_config):
+    return [
+        registry.get(QuestionAnalyzer, llm_config),
+        registry.get(SQLGenerator, sql_config),
+        registry.get(QueryValidator, llm_config),
+        registry.get(QueryValidator, llm_config),
+        registry.get(FallbackSQLGenerator, sql_config)
+    ]
+
+
+def time_per_question(setup, questions):
+    samples = []
+    for _ in range(questions):
+        start = time.perf_counter()
+        setup()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "mean_ms": sum(samples) / len(samples) * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p95_ms": samples[int(len(samples) * 0.95) - 1] * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-question agent setup overhead.")
+    parser.add_argument("--questions", type=int, default=200)
+    args = parser.parse_args()
+
+    llm_config = get_llm_config()
+    sql_config = get_sqlcoder_config()
+    registry = AgentRegistry()
+
+    results = {
+        "fresh agents": time_per_question(lambda: setup_fresh(llm_config, sql_config), args.questions),
+        "registry": time_per_question(lambda: setup_registry(registry, llm_config, sql_config), args.questions)
+    }
+    for name, stats in results.items():
+        print(f"{name:<14} mean {stats['mean_ms']:8.3f} ms   p50 {stats['p50_ms']:8.3f} ms   p95 {stats['p95_ms']:8.3f} ms")
+    speedup = results["fresh agents"]["mean_ms"] / max(results["registry"]["mean_ms"], 1e-9)
+    print(f"Registry is {speedup:.1f}x faster per question "
+          f"({registry.created} agents created, {registry.reused} reused)")
+
+
+if __name__ == "__main__":
+    main()
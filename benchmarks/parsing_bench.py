@@ -0,0 +1,128 @@
+"""
+Benchmark: parse success rate and throughput of llm.parsing against the regex
+chains the agents used before, over captured model replies.
+
+Replies come from benchmarks/data/sample_responses.jsonl (one object per line
+with "agent", "kind" and "response") and, with --from-cache, from the
+responses stored in the LLM response cache.
+
+    python -m benchmarks.parsing_bench --from-cache .llm_cache.sqlite --repeat 200
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+
+from llm.parsing import extract_sql, parse_json_object, parse_validation
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(__file__), "data", "sample_responses.jsonl")
+AGENT_KINDS = {
+    "QuestionAnalyzer": "json",
+    "QueryValidator": "validation",
+    "SQLGenerator": "sql",
+    "FallbackSQLGenerator": "sql"
+}
+_SQL_START = re.compile(r"^\s*(?:--[^\n]*\n\s*)*(SELECT|WITH)\b", re.IGNORECASE)
+
+
+def legacy_json(content):
+    match = re.search(r"```json\s*(.*?)```", content, re.DOTALL)
+    return json.loads(match.group(1) if match else content)
+
+
+def legacy_validation(content):
+    result = json.loads(content)
+    if "is_valid" not in result:
+        raise ValueError("no is_valid")
+    return result
+
+
+def legacy_sql(content):
+    match = re.search(r"```sql\s*(.*?)```", content, re.DOTALL)
+    if not match:
+        match = re.search(r"```\s*(.*?)```", content, re.DOTALL)
+    if not match:
+        match = re.search(r"(SELECT .*?);", content, re.DOTALL | re.IGNORECASE)
+    if not match:
+        raise ValueError("no SQL")
+    return match.group(1).strip()
+
+
+PARSERS = {
+    "json": (legacy_json, parse_json_object),
+    "validation": (legacy_validation, parse_validation),
+    "sql": (legacy_sql, extract_sql)
+}
+
+
+def load_samples(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_cached_responses(path):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("SELECT agent, response FROM responses").fetchall()
+    finally:
+        conn.close()
+    return [{"agent": agent, "kind": AGENT_KINDS[agent], "response": response}
+            for agent, response in rows if agent in AGENT_KINDS]
+
+
+def succeeded(kind, value):
+    if kind == "sql":
+        return bool(value) and bool(_SQL_START.match(value))
+    return value is not None
+
+
+def run_parser(parser, kind, response):
+    try:
+        return succeeded(kind, parser(response))
+    except Exception:
+        return False
+
+
+def measure(samples, repeat):
+    report = {}
+    for kind, (legacy, current) in PARSERS.items():
+        replies = [sample["response"] for sample in samples if sample["kind"] == kind]
+        if not replies:
+            continue
+        row = {"replies": len(replies)}
+        for label, parser in (("legacy", legacy), ("parsing", current)):
+            row[f"{label}_ok"] = sum(run_parser(parser, kind, reply) for reply in replies)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for reply in replies:
+                    run_parser(parser, kind, reply)
+            elapsed = time.perf_counter() - start
+            row[f"{label}_per_s"] = repeat * len(replies) / elapsed if elapsed else float("inf")
+        report[kind] = row
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare model-reply parsing success and throughput.")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES, help="JSONL file of captured replies")
+    parser.add_argument("--from-cache", default=None, metavar="PATH",
+                        help="Also parse every reply stored in this LLM response cache")
+    parser.add_argument("--repeat", type=int, default=200, help="Passes over the replies when timing")
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    if args.from_cache:
+        samples += load_cached_responses(args.from_cache)
+
+    print(f"{len(samples)} replies, {args.repeat} timing passes")
+    print(f"{'kind':<11} {'n':>4} {'legacy ok':>10} {'parsing ok':>11} {'legacy/s':>10} {'parsing/s':>10}")
+    for kind, row in measure(samples, args.repeat).items():
+        print(f"{kind:<11} {row['replies']:>4} "
+              f"{row['legacy_ok'] / row['replies']:>10.0%} {row['parsing_ok'] / row['replies']:>11.0%} "
+              f"{row['legacy_per_s']:>10.0f} {row['parsing_per_s']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Load test: the full pipeline (process_question and the planner) against a
+deterministic mock model server, with regression checks against baselines.
+
+The mock is llm/fake_ollama_server.py with a `MockBackend` responder: replies
+are canned per agent, a configurable share of them are malformed, and each
+reply is delayed by a draw from a latency distribution. Every draw is seeded by
+the request itself, so a scenario behaves the same whatever the concurrency.
+
+For each scenario the report has throughput, p50/p95/p99 question latency, the
+Python heap high-water mark (tracemalloc) and process max RSS, and per-stage
+latency from the tracer. Response and answer caches are off so every question
+reaches the mock.
+
+benchmarks/data/pipeline_baseline.json is the committed baseline for every
+scenario; refresh it with --save-baseline after an intended change, or on
+hardware much faster or slower than the machine that recorded it.
+
+    python -m benchmarks.pipeline_bench --save-baseline
+    python -m benchmarks.pipeline_bench --check --tolerance 0.25
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from control.batch_runner import run_batch
+from llm.fake_ollama_server import FakeOllamaServer, default_responder, first_table, reply_kind
+from planning.router import POLICIES, format_route_stats, get_router
+from planning.tracing import get_tracer, percentile
+from state.answer_cache import disable_answer_cache
+from state.response_cache import disable_response_cache
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "data", "pipeline_baseline.json")
+
+SCENARIOS = {
+    "steady": {"questions": 40, "workers": 8, "latency": "lognormal:0.02:0.3", "malformed": 0.0, "candidates": 1,
+               "route_policy": "off"},
+    "heavy-tail": {"questions": 40, "workers": 8, "latency": "lognormal:0.02:1.0", "malformed": 0.0, "candidates": 1,
+                   "route_policy": "off"},
+    "malformed": {"questions": 40, "workers": 8, "latency": "lognormal:0.02:0.3", "malformed": 0.25, "candidates": 1,
+                  "route_policy": "off"},
+    "sampling": {"questions": 20, "workers": 4, "latency": "lognormal:0.02:0.3", "malformed": 0.1, "candidates": 3,
+                 "route_policy": "off"},
+    "routing": {"questions": 40, "workers": 8, "latency": "lognormal:0.02:0.3", "malformed": 0.1, "candidates": 1,
+                "route_policy": "cascade"}
+}
+
+# Metric -> True when higher is better
+CHECKED_METRICS = {
+    "throughput_qps": True,
+    "latency_p50_s": False,
+    "latency_p95_s": False,
+    "latency_p99_s": False,
+    "heap_peak_mb": False
+}
+# Stages faster than this at p95 are local work, too noisy on a shared machine to gate on
+MIN_STAGE_P95_S = 0.02
+
+MALFORMED = {
+    "analysis": [
+        lambda table: '```json\n{"%s": ["id", "name"' % table,
+        lambda table: "The question is about the %s table, so keep all of its columns." % table
+    ],
+    "validation": [
+        lambda table: "{'is_valid': True, 'suggestions': [], 'final_query': '',}",
+        lambda table: "The query looks correct to me."
+    ],
+    "sql": [
+        lambda table: "I need more information about the schema before I can write this query.",
+        lambda table: "```sql\nSELECT COUNT(*) FROM %s WHERE\n```" % table
+    ]
+}
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    A sampler for "fixed:S", "uniform:LOW:HIGH" or "lognormal:MEDIAN:SIGMA"
+    (all in seconds).
+    """
+    name, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if name == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if name == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if name == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+
+class MockBackend:
+    """Responder for FakeOllamaServer with seeded latency and a share of malformed replies."""
+
+    def __init__(self, latency: str = "fixed:0", malformed: float = 0.0, seed: int = 0):
+        self.sample_latency = parse_latency(latency)
+        self.malformed = malformed
+        self.seed = seed
+        self.replies: Dict[str, int] = {}
+        self.malformed_replies: Dict[str, int] = {}
+
+    def __call__(self, model: str, messages: List[Dict[str, str]]) -> str:
+        # Seeded by the request, not by arrival order, so runs repeat under any concurrency
+        rng = random.Random(f"{self.seed}|{model}|{len(messages)}|{messages[-1]['content'] if messages else ''}")
+        time.sleep(self.sample_latency(rng))
+        kind = reply_kind(messages)
+        self.replies[kind] = self.replies.get(kind, 0) + 1
+        if rng.random() < self.malformed:
+            self.malformed_replies[kind] = self.malformed_replies.get(kind, 0) + 1
+            return rng.choice(MALFORMED[kind])(first_table(messages))
+        if kind == "sql":
+            return "```sql\nSELECT COUNT(*) FROM %s;\n```" % first_table(messages)
+        return default_responder(model, messages)
+
+
+def model_configs(base_url: str):
+    """The pipeline's model configs, pointed at the mock server."""
+    from llm_config import get_llm_config, get_sqlcoder_config
+    configs = []
+    for config in (get_llm_config(), get_sqlcoder_config()):
+        config["config_list"] = [{**entry, "base_url": base_url, "api_type": "ollama"} for entry in config["config_list"]]
+        configs.append(config)
+    return configs
+
+
+def run_scenario(name: str, spec: dict, seed: int) -> dict:
+    from catalog.example_index import get_example_index
+    from llm_config import get_dialect_config, get_sampling_config
+    from run_pipeline import load_questions, run_question
+
+    dialect = get_dialect_config()
+    questions = load_questions(dialect["dialect"])
+    # Loaded up front as the pipeline does, so the first questions do not pay for it
+    get_example_index(dialect["generation_dialect"] or dialect["dialect"])
+    items = [questions[i % len(questions)] for i in range(spec["questions"])]
+    sampling = None
+    if spec["candidates"] > 1:
+        sampling = {**get_sampling_config(), "candidates": spec["candidates"],
+                    "concurrency": spec["candidates"], "evaluator": None}
+
+    backend = MockBackend(spec["latency"], spec["malformed"], seed)
+    router = get_router()
+    router.policy = spec["route_policy"]
+    router.reset()
+    get_tracer().reset()
+    with FakeOllamaServer(backend, parallel=spec["workers"]) as server:
+        llm_config, sql_config = model_configs(server.base_url)
+        tracemalloc.start()
+        start = time.perf_counter()
+        # Agents print every step; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            outcomes = run_batch(items, lambda q: run_question(q, llm_config, sql_config, None, sampling),
+                                 workers=spec["workers"])
+        elapsed = time.perf_counter() - start
+        _, heap_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        swaps = server.swaps
+
+    latencies = sorted(o["elapsed"] for o in outcomes)
+    failed = sum(1 for o in outcomes if o["status"] != "ok" or o["result"]["status"] != "ok")
+    unanswered = sum(1 for o in outcomes if o["status"] == "ok" and not o["result"]["final_sql"])
+    stages = get_tracer().summary()["stages"]
+    return {
+        "scenario": name,
+        **spec,
+        "elapsed_s": elapsed,
+        "throughput_qps": len(items) / elapsed if elapsed else 0.0,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_p99_s": percentile(latencies, 99),
+        "heap_peak_mb": heap_peak / 2 ** 20,
+        # ru_maxrss is in KiB on Linux and bytes on macOS; it never goes down within a process
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10),
+        "failed": failed,
+        "unanswered": unanswered,
+        "model_swaps": swaps,
+        "replies": dict(backend.replies),
+        "malformed_replies": dict(backend.malformed_replies),
+        "routes": router.stats(),
+        "stages": {stage: {key: stats[key] for key in ("count", "errors", "retries", "llm_calls", "mean", "p50", "p95", "p99")}
+                   for stage, stats in stages.items()}
+    }
+
+
+def regressions(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Metrics in `result` that are worse than `baseline` by more than `tolerance` (a fraction)."""
+    found = []
+    for metric, higher_is_better in CHECKED_METRICS.items():
+        current, reference = result[metric], baseline.get(metric)
+        if reference is None:
+            continue
+        if higher_is_better and current < reference * (1 - tolerance):
+            found.append(f"{metric} {current:.3f} < baseline {reference:.3f}")
+        elif not higher_is_better and current > reference * (1 + tolerance):
+            found.append(f"{metric} {current:.3f} > baseline {reference:.3f}")
+    for metric in ("failed", "unanswered"):
+        # The mock is deterministic, so more failures is a behaviour change, not noise
+        if result[metric] > baseline.get(metric, result[metric]):
+            found.append(f"{metric} {result[metric]} > baseline {baseline[metric]}")
+    for stage, stats in baseline.get("stages", {}).items():
+        current = result["stages"].get(stage)
+        if current is None or stats["p95"] < MIN_STAGE_P95_S:
+            continue
+        if current["p95"] > stats["p95"] * (1 + tolerance):
+            found.append(f"stage {stage} p95 {current['p95']:.3f}s > baseline {stats['p95']:.3f}s")
+    return found
+
+
+def print_result(result: dict) -> None:
+    print(f"\n== {result['scenario']}: {result['questions']} questions, {result['workers']} workers, "
+          f"latency {result['latency']}, malformed {result['malformed']:.0%}, candidates {result['candidates']}, "
+          f"routing {result['route_policy']}")
+    print(f"throughput {result['throughput_qps']:.1f} q/s   latency p50 {result['latency_p50_s']:.3f}s "
+          f"p95 {result['latency_p95_s']:.3f}s p99 {result['latency_p99_s']:.3f}s")
+    print(f"heap peak {result['heap_peak_mb']:.1f} MiB   max RSS {result['max_rss_mb']:.1f} MiB   "
+          f"failed {result['failed']}   unanswered {result['unanswered']}   model swaps {result['model_swaps']}")
+    print(f"replies {result['replies']}   malformed {result['malformed_replies']}")
+    print(f"{'stage':<22}{'n':>5}{'err':>5}{'retry':>7}{'calls':>7}{'mean s':>9}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:<22}{stats['count']:>5}{stats['errors']:>5}{stats['retries']:>7}{stats['llm_calls']:>7}"
+              f"{stats['mean']:>9.3f}{stats['p50']:>9.3f}{stats['p95']:>9.3f}{stats['p99']:>9.3f}")
+    if result["route_policy"] != "off":
+        for line in format_route_stats(result["routes"]):
+            print(line)
+
+
+def scenario_specs(args) -> Dict[str, dict]:
+    specs = {}
+    for name in args.scenario or list(SCENARIOS):
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        spec = dict(SCENARIOS[name])
+        for key in ("questions", "workers", "latency", "malformed", "candidates", "route_policy"):
+            if getattr(args, key) is not None:
+                spec[key] = getattr(args, key)
+        specs[name] = spec
+    return specs
+
+
+def load_baseline(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the pipeline against a mock model server.")
+    parser.add_argument("--scenario", action="append", default=None,
+                        help=f"Scenario to run (repeatable; default all of: {', '.join(SCENARIOS)})")
+    parser.add_argument("--questions", type=int, default=None, help="Override the number of questions")
+    parser.add_argument("--workers", type=int, default=None, help="Override the number of concurrent questions")
+    parser.add_argument("--latency", default=None,
+                        help="Override the reply latency: fixed:S, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--malformed", type=float, default=None, help="Override the share of malformed replies")
+    parser.add_argument("--candidates", type=int, default=None, help="Override the SQL candidates per question")
+    parser.add_argument("--route-policy", choices=POLICIES, default=None,
+                        help="Override the routing policy (off, cascade or difficulty)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency draws and malformed replies")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run's results as the baseline")
+    parser.add_argument("--check", action="store_true", help="Exit non-zero if any scenario regressed")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed fractional slowdown before a metric counts as a regression")
+    parser.add_argument("--json", default=None, metavar="PATH", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    disable_response_cache()
+    disable_answer_cache()
+
+    results = {}
+    for name, spec in scenario_specs(args).items():
+        results[name] = run_scenario(name, spec, args.seed)
+        print_result(results[name])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = load_baseline(args.baseline) or {}
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nSaved baseline for {', '.join(results)} to {args.baseline}")
+        return
+
+    if args.check:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            raise SystemExit(f"No baseline at {args.baseline}; run with --save-baseline first")
+        failed = False
+        print()
+        for name, result in results.items():
+            if name not in baseline:
+                print(f"{name}: no baseline, skipped")
+                continue
+            if any(baseline[name].get(key) != result[key] for key in SCENARIOS[name]):
+                print(f"{name}: run with different settings than the baseline, skipped")
+                continue
+            found = regressions(result, baseline[name], args.tolerance)
+            failed = failed or bool(found)
+            print(f"{name}: " + ("REGRESSED\n  " + "\n  ".join(found) if found else "ok"))
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Compact schema text for prompts: one line per table with short types and FK hints.
+
+    loan(loan_id int PK, account_id int FK->account.account_id, amount int, status text)
+
+Key columns are always kept so joins can still be written; other columns can
+be limited to those the linker or the analyzer picked, with "..." marking the
+ones left out. Fragments are rendered once per table, column selection and
+dialect, and kept per database since its tables come up for every question.
+"""
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from catalog.dialects import DEFAULT_DIALECT, get_dialect
+from catalog.schema_catalog import SchemaCatalog, Table, get_schema_catalog
+
+COMPACT_LEGEND = "Tables as table(column type, ...); PK primary key, FK->table.column foreign key, ... more columns"
+TYPE_ABBREVIATIONS = {"integer": "int", "text": "text", "real": "real", "date": "date", "datetime": "datetime"}
+_PLAIN_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# table -> column names to show; None shows every column
+ColumnSelection = Dict[str, Optional[List[str]]]
+
+
+class CompactSchemaRenderer:
+    def __init__(self, catalog: Optional[SchemaCatalog] = None):
+        self.catalog = catalog or get_schema_catalog()
+        self._fragments: Dict[str, Dict[Tuple, str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def table_fragment(self, db_id: str, table: Table, columns: Optional[List[str]], dialect: str) -> str:
+        wanted = None if columns is None else tuple(sorted({name.lower() for name in columns}))
+        key = (table.name.lower(), wanted, dialect)
+        with self._lock:
+            fragment = self._fragments.setdefault(db_id, {}).get(key)
+            if fragment is not None:
+                self.hits += 1
+                return fragment
+            self.misses += 1
+        fragment = self._render_table(table, wanted, get_dialect(dialect))
+        with self._lock:
+            self._fragments[db_id][key] = fragment
+        return fragment
+
+    def render(self, db_id: str, tables: List[str], columns: Optional[ColumnSelection] = None,
+               dialect: str = DEFAULT_DIALECT) -> str:
+        """One line per table of `tables` that exists, limited to `columns` where given."""
+        db = self.catalog.get(db_id)
+        dialect = get_dialect(dialect).name
+        selection = {name.lower(): value for name, value in (columns or {}).items()}
+        lines = []
+        for name in tables:
+            table = db.table(name)
+            if table is not None and table.columns:
+                lines.append(self.table_fragment(db_id, table, selection.get(name.lower()) if columns else None, dialect))
+        return "\n".join(lines)
+
+    def invalidate(self, db_id: Optional[str] = None) -> None:
+        with self._lock:
+            if db_id is None:
+                self._fragments.clear()
+            else:
+                self._fragments.pop(db_id, None)
+
+    @staticmethod
+    def _render_table(table: Table, wanted: Optional[Tuple[str, ...]], dialect) -> str:
+        def name(identifier: str) -> str:
+            return identifier if _PLAIN_IDENTIFIER.match(identifier) else dialect.quote_identifier(identifier)
+
+        primary = {key.lower() for key in table.primary_keys}
+        references = {fk.column.lower(): fk for fk in table.foreign_keys}
+        parts = []
+        omitted = False
+        for key, column in table.columns.items():
+            if wanted is not None and key not in wanted and key not in primary and key not in references:
+                omitted = True
+                continue
+            part = f"{name(column.name)} {TYPE_ABBREVIATIONS.get(column.type.lower(), column.type.lower())}"
+            if key in primary:
+                part += " PK"
+            if key in references:
+                fk = references[key]
+                part += f" FK->{name(fk.ref_table)}.{name(fk.ref_column)}"
+            parts.append(part)
+        if omitted:
+            parts.append("...")
+        return f"{name(table.name)}({', '.join(parts)})"
+
+
+def selected_columns(tables: List[str], analysis: Optional[dict] = None,
+                     linked: Optional[Dict[str, List[str]]] = None) -> ColumnSelection:
+    """
+    Columns worth showing per table: the analyzer's picks plus the linker's.
+
+    "keep_all" shows every column. Tables the analyzer dropped still show the
+    linker's columns, and every table shows its keys, since it may still be
+    needed to join the others; only the last rendering falls back to keys alone.
+    """
+    selection: ColumnSelection = {}
+    choices = {str(table).lower(): value for table, value in (analysis or {}).items()}
+    for table in tables:
+        choice = choices.get(table.lower())
+        if choice == "keep_all":
+            selection[table] = None
+            continue
+        columns = list((linked or {}).get(table, []))
+        if isinstance(choice, list):
+            columns += [column for column in choice if column not in columns]
+        selection[table] = columns
+    return selection
+
+
+def schema_renderings(db_id: str, tables: List[str], analysis: Optional[dict] = None,
+                      linked: Optional[Dict[str, List[str]]] = None, dialect: str = DEFAULT_DIALECT,
+                      ddl: Optional[str] = None, compact: bool = True) -> List[str]:
+    """
+    Ways to show the schema, longest first, for a prompt budget to choose from.
+
+    Without `compact` the full DDL comes first. Before the analyzer has run,
+    every column of the linked tables is offered before the linker's picks.
+    """
+    renderer = get_compact_schema()
+    options = [ddl] if ddl and not compact else []
+    if analysis is None or not compact:
+        options.append(renderer.render(db_id, tables, None, dialect))
+    options.append(renderer.render(db_id, tables, selected_columns(tables, analysis, linked), dialect))
+    options.append(renderer.render(db_id, tables, {table: [] for table in tables}, dialect))
+    return list(dict.fromkeys(option for option in options if option))
+
+
+_renderer: Optional[CompactSchemaRenderer] = None
+_renderer_lock = threading.Lock()
+
+def get_compact_schema() -> CompactSchemaRenderer:
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = CompactSchemaRenderer(get_schema_catalog())
+        return _renderer
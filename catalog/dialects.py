@@ -0,0 +1,97 @@
+"""
+SQL dialects the pipeline can target end to end.
+
+One setting picks the question file, the DDL the models see, the dialect named
+in the prompts and how strictly the local validator treats syntax errors.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+DEFAULT_DIALECT = "mysql"
+DATASET_DIR = "data_minidev/MINIDEV"
+
+
+@dataclass(frozen=True)
+class Dialect:
+    name: str  # setting value, and the key of rendered DDL in the catalog
+    label: str  # as written in prompts
+    sqlglot: str  # sqlglot's name for the dialect
+    quote: str  # identifier quote character
+    types: Dict[str, str] = field(default_factory=dict)  # dev_tables.json column type -> DDL type
+    rules: Tuple[str, ...] = ()  # reminders for the generators
+    # (pattern, suggestion) for syntax this dialect rejects, matched outside string literals
+    foreign_syntax: Tuple[Tuple[str, str], ...] = ()
+
+    @property
+    def dataset(self) -> str:
+        return f"{DATASET_DIR}/mini_dev_{self.name}.json"
+
+    def quote_identifier(self, name: str) -> str:
+        return f"{self.quote}{name.replace(self.quote, self.quote * 2)}{self.quote}"
+
+    def render_type(self, col_type: str) -> str:
+        return self.types.get(col_type.lower(), col_type.upper())
+
+    def prompt_rules(self) -> str:
+        return "\n".join(f"- {rule}" for rule in self.rules)
+
+
+_CAST = (r"::\s*\w", "There is no :: cast operator; use CAST(x AS type).")
+_ILIKE = (r"\bILIKE\b", "There is no ILIKE; use LIKE, which is case-insensitive for ASCII text.")
+
+DIALECTS: Dict[str, Dialect] = {
+    "mysql": Dialect(
+        name="mysql",
+        label="MySQL",
+        sqlglot="mysql",
+        quote="`",
+        types={"text": "VARCHAR(255)", "integer": "INT"},
+        rules=(
+            "Quote identifiers that contain spaces or symbols with backticks, e.g. `Order Date`.",
+            "Cast with CAST(x AS DECIMAL(10, 2)) or multiply by 1.0; there is no :: cast.",
+            "Use LIMIT n for top-n questions."
+        ),
+        foreign_syntax=(_CAST, _ILIKE)
+    ),
+    "postgresql": Dialect(
+        name="postgresql",
+        label="PostgreSQL",
+        sqlglot="postgres",
+        quote='"',
+        types={"text": "TEXT", "integer": "INTEGER", "real": "REAL", "datetime": "TIMESTAMP"},
+        rules=(
+            "Quote identifiers that contain spaces, symbols or capitals with double quotes, never backticks.",
+            "String literals use single quotes.",
+            "Cast with CAST(x AS REAL) or x::REAL."
+        ),
+        foreign_syntax=((r"`", "PostgreSQL quotes identifiers with double quotes, not backticks."),)
+    ),
+    "sqlite": Dialect(
+        name="sqlite",
+        label="SQLite",
+        sqlglot="sqlite",
+        quote='"',
+        rules=(
+            "Quote identifiers that contain spaces or symbols with double quotes or backticks.",
+            "Cast with CAST(x AS REAL); there is no :: cast, ILIKE or DATE_FORMAT.",
+            "Use STRFTIME for date parts and SUBSTR for substrings."
+        ),
+        foreign_syntax=(_CAST, _ILIKE)
+    )
+}
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+
+def get_dialect(name: str = None) -> Dialect:
+    dialect = DIALECTS.get((name or DEFAULT_DIALECT).lower())
+    if dialect is None:
+        raise ValueError(f"Unknown SQL dialect {name!r}; choose from {', '.join(DIALECTS)}")
+    return dialect
+
+
+def foreign_syntax(sql: str, dialect: Dialect) -> List[str]:
+    """Suggestions for syntax in `sql` that `dialect` does not accept."""
+    code = _LITERAL.sub("''", sql or "")
+    return [suggestion for pattern, suggestion in dialect.foreign_syntax if re.search(pattern, code, re.IGNORECASE)]
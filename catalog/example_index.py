@@ -0,0 +1,281 @@
+"""
+Few-shot examples for a question: solved questions on the same database.
+
+Every MINIDEV question, with its evidence and gold SQL, is a TF-IDF row in a
+per-database matrix; rows are L2-normalized, so the cosine similarity of a new
+question to all examples of its database is one matrix-vector product. The
+question's own entry is never returned, and neither is any other entry with
+the same question and evidence: MINIDEV repeats some questions, and their
+copies would hand the gold SQL to the prompt.
+
+The matrices are compiled once into a single .npy file next to the question
+file and memory-mapped on later starts, with the vocabularies and examples in
+a pickle beside it. `add` extends a database's matrix in memory; `save` writes
+the result back. numpy is optional: without it there is no index and prompts
+stay zero-shot.
+"""
+import json
+import math
+import os
+import pickle
+import threading
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+from catalog.dialects import DEFAULT_DIALECT, get_dialect
+from catalog.schema_linker import tokenize
+from llm_config import get_few_shot_config
+from text_utils import canonical_text
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EXAMPLE_INDEX_FORMAT_VERSION = 1
+# Gold SQL shares column names with the question but also repeats them; count it for less
+SQL_WEIGHT = 0.5
+
+
+@dataclass
+class Example:
+    question_id: int
+    db_id: str
+    question: str
+    evidence: str
+    sql: str
+    difficulty: str = ""
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class Match:
+    example: Example
+    score: float
+
+
+def _weight(count: float) -> float:
+    """Sublinear term frequency: a term repeated in the SQL should not swamp the rest."""
+    return 1 + math.log(count) if count >= 1 else count
+
+
+def example_terms(question: str, evidence: str = "", sql: str = "") -> Counter:
+    terms = Counter(tokenize(question))
+    terms.update(tokenize(evidence))
+    for term, count in Counter(tokenize(sql)).items():
+        terms[term] += count * SQL_WEIGHT
+    return terms
+
+
+def _question_key(question: str, evidence: str) -> Tuple[str, str]:
+    return canonical_text(question), canonical_text(evidence)
+
+
+class _DatabaseExamples:
+    """The examples of one database and their normalized TF-IDF matrix."""
+
+    def __init__(self, examples: List[Example], vocabulary: Dict[str, int], idf, matrix):
+        self.examples = examples
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.matrix = matrix  # len(examples) x len(vocabulary), float32, rows L2-normalized
+        self.rows = {example.question_id: row for row, example in enumerate(examples)}
+        self.duplicates: Dict[Tuple[str, str], List[int]] = {}
+        for row, example in enumerate(examples):
+            self.duplicates.setdefault(_question_key(example.question, example.evidence), []).append(row)
+
+    @classmethod
+    def build(cls, examples: List[Example]) -> "_DatabaseExamples":
+        documents = [example_terms(e.question, e.evidence, e.sql) for e in examples]
+        vocabulary: Dict[str, int] = {}
+        for terms in documents:
+            for term in terms:
+                vocabulary.setdefault(term, len(vocabulary))
+        frequency = Counter(term for terms in documents for term in terms)
+        idf = np.zeros(len(vocabulary), dtype=np.float32)
+        for term, column in vocabulary.items():
+            idf[column] = math.log((1 + len(documents)) / (1 + frequency[term])) + 1
+        matrix = np.zeros((len(documents), len(vocabulary)), dtype=np.float32)
+        for row, terms in enumerate(documents):
+            for term, count in terms.items():
+                matrix[row, vocabulary[term]] = _weight(count)
+        matrix *= idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms > 0, norms, 1)
+        return cls(examples, vocabulary, idf, matrix)
+
+    def query_vector(self, question: str, evidence: str = ""):
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for term, count in example_terms(question, evidence).items():
+            column = self.vocabulary.get(term)
+            if column is not None:
+                vector[column] = _weight(count)
+        vector *= self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def nearest(self, question: str, evidence: str, k: int, exclude: Optional[int],
+                min_score: float) -> List[Match]:
+        vector = self.query_vector(question, evidence)
+        if vector is None or k <= 0:
+            return []
+        scores = self.matrix @ vector
+        if exclude in self.rows:
+            scores[self.rows[exclude]] = -1.0
+        for row in self.duplicates.get(_question_key(question, evidence), ()):
+            scores[row] = -1.0
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [Match(self.examples[row], float(scores[row])) for row in top if scores[row] >= min_score]
+
+
+class ExampleIndex:
+    def __init__(self, databases: Dict[str, _DatabaseExamples], source: Optional[Tuple[int, int]] = None):
+        self.databases = databases
+        self.source = source  # (mtime_ns, size) of the question file the index was built from
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(db.examples) for db in self.databases.values())
+
+    @classmethod
+    def build(cls, examples: List[Example], source: Optional[Tuple[int, int]] = None) -> "ExampleIndex":
+        by_db: Dict[str, List[Example]] = {}
+        for example in examples:
+            by_db.setdefault(example.db_id, []).append(example)
+        return cls({db_id: _DatabaseExamples.build(items) for db_id, items in by_db.items()}, source)
+
+    @classmethod
+    def from_questions_json(cls, path: str) -> "ExampleIndex":
+        with open(path, "r") as f:
+            questions = json.load(f)
+        # Numbered like run_pipeline.load_questions, so a question can be excluded by its id
+        examples = [Example(i, q["db_id"], q["question"], q.get("evidence", ""), q["SQL"], q.get("difficulty", ""))
+                    for i, q in enumerate(questions, 1)]
+        return cls.build(examples, _source_signature(path))
+
+    def nearest(self, db_id: str, question: str, evidence: str = "", k: int = 3,
+                exclude: Optional[int] = None, min_score: float = 0.0) -> List[Match]:
+        """Up to `k` examples of `db_id` most like the question, best first, leaving out `exclude`."""
+        with self._lock:
+            db = self.databases.get(db_id)
+        return db.nearest(question, evidence, k, exclude, min_score) if db else []
+
+    def add(self, examples: List[Example]) -> None:
+        """Add or replace examples; each affected database's matrix is rebuilt in memory."""
+        by_db: Dict[str, List[Example]] = {}
+        for example in examples:
+            by_db.setdefault(example.db_id, []).append(example)
+        for db_id, items in by_db.items():
+            with self._lock:
+                current = self.databases.get(db_id)
+            new_ids = {example.question_id for example in items}
+            kept = [e for e in current.examples if e.question_id not in new_ids] if current else []
+            rebuilt = _DatabaseExamples.build(kept + items)
+            with self._lock:
+                self.databases[db_id] = rebuilt
+
+    def save(self, path: str) -> None:
+        """Write the matrices to `path`.npy and everything else to `path`.pkl."""
+        with self._lock:
+            databases = dict(self.databases)
+        offset, layout = 0, {}
+        for db_id, db in databases.items():
+            layout[db_id] = (offset, db.matrix.shape, db.examples, db.vocabulary, db.idf)
+            offset += db.matrix.size
+        flat = np.concatenate([db.matrix.ravel() for db in databases.values()]) if databases \
+            else np.zeros(0, dtype=np.float32)
+        tmp = f".tmp.{os.getpid()}"
+        with open(f"{path}.npy{tmp}", "wb") as f:
+            np.save(f, flat, allow_pickle=False)
+        with open(f"{path}.pkl{tmp}", "wb") as f:
+            pickle.dump((EXAMPLE_INDEX_FORMAT_VERSION, self.source, layout), f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Matrices first: a new .pkl never points into an old .npy
+        os.replace(f"{path}.npy{tmp}", f"{path}.npy")
+        os.replace(f"{path}.pkl{tmp}", f"{path}.pkl")
+
+    @classmethod
+    def load(cls, path: str) -> "ExampleIndex":
+        with open(f"{path}.pkl", "rb") as f:
+            version, source, layout = pickle.load(f)
+        if version != EXAMPLE_INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported example index version: {version}")
+        # Pages are read on first use, so startup does not touch the matrices
+        flat = np.load(f"{path}.npy", mmap_mode="r")
+        databases = {}
+        for db_id, (offset, shape, examples, vocabulary, idf) in layout.items():
+            size = shape[0] * shape[1]
+            databases[db_id] = _DatabaseExamples(examples, vocabulary, idf, flat[offset:offset + size].reshape(shape))
+        return cls(databases, source)
+
+
+def _source_signature(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def compiled_index_path(questions_path: str) -> str:
+    return os.path.splitext(questions_path)[0] + ".examples"
+
+
+def load_or_build_index(questions_path: str) -> ExampleIndex:
+    """Load the compiled index if it matches the question file, otherwise rebuild and save it."""
+    compiled_path = compiled_index_path(questions_path)
+    signature = _source_signature(questions_path)
+    if os.path.exists(f"{compiled_path}.pkl"):
+        try:
+            index = ExampleIndex.load(compiled_path)
+            if index.source == signature:
+                return index
+        except Exception:
+            pass  # Stale or unreadable; rebuild below
+
+    index = ExampleIndex.from_questions_json(questions_path)
+    try:
+        index.save(compiled_path)
+    except OSError:
+        pass  # Read-only checkout; the in-memory index is still usable
+    return index
+
+
+_indexes: Dict[str, ExampleIndex] = {}
+_index_disabled = False
+_index_lock = threading.Lock()
+
+def disable_example_index() -> None:
+    """Turn few-shot retrieval off for the rest of the process."""
+    global _index_disabled
+    _index_disabled = True
+
+def get_example_index(dialect: str = DEFAULT_DIALECT) -> Optional[ExampleIndex]:
+    """The index over `dialect`'s question file, or None when few-shot examples are off or numpy is missing."""
+    if _index_disabled or np is None or not get_few_shot_config()["enabled"]:
+        return None
+    path = get_dialect(dialect).dataset
+    with _index_lock:
+        if path not in _indexes:
+            _indexes[path] = load_or_build_index(path)
+        return _indexes[path]
+
+
+def retrieve_examples(db_id: str, question: str, evidence: str = "", exclude: Optional[int] = None,
+                      dialect: str = DEFAULT_DIALECT) -> List[dict]:
+    """The configured number of examples for a question, as dicts for the shared state; [] without an index."""
+    index = get_example_index(dialect)
+    if index is None:
+        return []
+    config = get_few_shot_config()
+    matches = index.nearest(db_id, question, evidence, config["k"], exclude, config["min_score"])
+    return [{**match.example.as_dict(), "score": round(match.score, 4)} for match in matches]
+
+
+if __name__ == "__main__":
+    for name in ("mysql", "postgresql", "sqlite"):
+        questions_path = get_dialect(name).dataset
+        index = ExampleIndex.from_questions_json(questions_path)
+        index.save(compiled_index_path(questions_path))
+        print(f"Indexed {len(index)} examples from {questions_path} to {compiled_index_path(questions_path)}.npy")
@@ -0,0 +1,206 @@
+"""
+Schema catalog compiled once from dev_tables.json.
+
+The catalog holds per-database tables, typed columns, primary keys, foreign keys
+and CREATE TABLE statements rendered for every supported dialect, with O(1)
+lookup by db_id, table and column.
+It is pickled next to the source file and reloaded from there while the source
+is unchanged, so no process has to re-parse the JSON.
+"""
+import json
+import os
+import pickle
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from catalog.dialects import DEFAULT_DIALECT, DIALECTS, Dialect, get_dialect
+
+DEFAULT_TABLES_PATH = "data_minidev/MINIDEV/dev_tables.json"
+CATALOG_FORMAT_VERSION = 2
+
+
+@dataclass
+class Column:
+    name: str
+    table: str
+    type: str
+    description: str
+    is_primary_key: bool = False
+
+
+@dataclass
+class ForeignKey:
+    table: str
+    column: str
+    ref_table: str
+    ref_column: str
+
+
+@dataclass
+class Table:
+    name: str
+    columns: Dict[str, Column] = field(default_factory=dict)  # keyed by lowercased name
+    primary_keys: List[str] = field(default_factory=list)
+    foreign_keys: List[ForeignKey] = field(default_factory=list)
+    ddl: Dict[str, str] = field(default_factory=dict)  # keyed by dialect name
+
+    def column(self, name: str) -> Optional[Column]:
+        return self.columns.get(name.lower())
+
+
+@dataclass
+class DatabaseSchema:
+    db_id: str
+    tables: Dict[str, Table] = field(default_factory=dict)  # keyed by lowercased name
+    foreign_keys: List[ForeignKey] = field(default_factory=list)
+    ddl: Dict[str, str] = field(default_factory=dict)  # keyed by dialect name
+
+    def table(self, name: str) -> Optional[Table]:
+        return self.tables.get(name.lower())
+
+    def column(self, table: str, name: str) -> Optional[Column]:
+        table_entry = self.table(table)
+        return table_entry.column(name) if table_entry else None
+
+    def render_ddl(self, table_names: List[str], dialect: str = DEFAULT_DIALECT) -> str:
+        """Render the CREATE TABLE statements for a subset of tables, in catalog order."""
+        wanted = {name.lower() for name in table_names}
+        name = get_dialect(dialect).name
+        return "\n\n".join(table.ddl[name] for key, table in self.tables.items() if key in wanted)
+
+    def full_ddl(self, dialect: str = DEFAULT_DIALECT) -> str:
+        return self.ddl[get_dialect(dialect).name]
+
+
+def render_table_ddl(table: Table, dialect: Dialect) -> str:
+    q = dialect.quote_identifier
+    lines = ["{} {}".format(q(column.name), dialect.render_type(column.type)) for column in table.columns.values()]
+    if table.primary_keys:
+        lines.append("PRIMARY KEY ({})".format(", ".join(q(key) for key in table.primary_keys)))
+    for fk in table.foreign_keys:
+        lines.append("FOREIGN KEY ({}) REFERENCES {} ({})".format(q(fk.column), q(fk.ref_table), q(fk.ref_column)))
+    return "CREATE TABLE {} (\n    {}\n)".format(q(table.name), ",\n    ".join(lines))
+
+
+def build_database_schema(raw: dict) -> DatabaseSchema:
+    """Build a DatabaseSchema from one entry of dev_tables.json."""
+    db = DatabaseSchema(db_id=raw["db_id"])
+    table_names = raw["table_names_original"]
+    for table_name in table_names:
+        db.tables[table_name.lower()] = Table(name=table_name)
+
+    # Index columns by their position in column_names_original; -1 is the * column
+    columns_by_index: Dict[int, Column] = {}
+    for index, ((table_idx, col_name), (_, description), col_type) in enumerate(zip(
+        raw["column_names_original"],
+        raw["column_names"],
+        raw["column_types"]
+    )):
+        if table_idx == -1:
+            continue
+        table = db.tables[table_names[table_idx].lower()]
+        column = Column(name=col_name, table=table.name, type=col_type, description=description)
+        table.columns[col_name.lower()] = column
+        columns_by_index[index] = column
+
+    # Primary keys are either a column index or a list of indices for composite keys
+    for key in raw.get("primary_keys", []):
+        for index in key if isinstance(key, list) else [key]:
+            column = columns_by_index[index]
+            column.is_primary_key = True
+            db.tables[column.table.lower()].primary_keys.append(column.name)
+
+    for col_index, ref_index in raw.get("foreign_keys", []):
+        column, ref_column = columns_by_index[col_index], columns_by_index[ref_index]
+        fk = ForeignKey(column.table, column.name, ref_column.table, ref_column.name)
+        db.tables[column.table.lower()].foreign_keys.append(fk)
+        db.foreign_keys.append(fk)
+
+    for name, dialect in DIALECTS.items():
+        for table in db.tables.values():
+            table.ddl[name] = render_table_ddl(table, dialect)
+        db.ddl[name] = "\n\n".join(table.ddl[name] for table in db.tables.values() if table.columns)
+    return db
+
+
+class SchemaCatalog:
+    def __init__(self, databases: Dict[str, DatabaseSchema], source: Optional[Tuple[int, int]] = None):
+        self.databases = databases
+        self.source = source  # (mtime_ns, size) of the JSON the catalog was built from
+
+    def get(self, db_id: str) -> DatabaseSchema:
+        db = self.databases.get(db_id)
+        if db is None:
+            raise ValueError(f"Schema not found for database ID: {db_id}")
+        return db
+
+    def __contains__(self, db_id: str) -> bool:
+        return db_id in self.databases
+
+    @classmethod
+    def from_tables_json(cls, path: str = DEFAULT_TABLES_PATH) -> "SchemaCatalog":
+        with open(path, "r") as f:
+            schema_data = json.load(f)
+        databases = {raw["db_id"]: build_database_schema(raw) for raw in schema_data}
+        return cls(databases, _source_signature(path))
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((CATALOG_FORMAT_VERSION, self.source, self.databases), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SchemaCatalog":
+        with open(path, "rb") as f:
+            version, source, databases = pickle.load(f)
+        if version != CATALOG_FORMAT_VERSION:
+            raise ValueError(f"Unsupported schema catalog version: {version}")
+        return cls(databases, source)
+
+
+def _source_signature(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def compiled_catalog_path(tables_path: str) -> str:
+    return os.path.splitext(tables_path)[0] + ".catalog.pkl"
+
+
+def load_or_compile_catalog(tables_path: str = DEFAULT_TABLES_PATH) -> SchemaCatalog:
+    """Load the compiled catalog if it matches the source file, otherwise rebuild and save it."""
+    compiled_path = compiled_catalog_path(tables_path)
+    signature = _source_signature(tables_path)
+    if os.path.exists(compiled_path):
+        try:
+            catalog = SchemaCatalog.load(compiled_path)
+            if catalog.source == signature:
+                return catalog
+        except Exception:
+            pass  # Stale or unreadable; rebuild below
+
+    catalog = SchemaCatalog.from_tables_json(tables_path)
+    try:
+        catalog.save(compiled_path)
+    except OSError:
+        pass  # Read-only checkout; the in-memory catalog is still usable
+    return catalog
+
+
+_catalogs: Dict[str, SchemaCatalog] = {}
+_catalog_lock = threading.Lock()
+
+def get_schema_catalog(tables_path: str = DEFAULT_TABLES_PATH) -> SchemaCatalog:
+    """Return the process-wide catalog for `tables_path`, compiling it on first use."""
+    with _catalog_lock:
+        if tables_path not in _catalogs:
+            _catalogs[tables_path] = load_or_compile_catalog(tables_path)
+        return _catalogs[tables_path]
+
+
+if __name__ == "__main__":
+    catalog = SchemaCatalog.from_tables_json(DEFAULT_TABLES_PATH)
+    catalog.save(compiled_catalog_path(DEFAULT_TABLES_PATH))
+    print(f"Compiled {len(catalog.databases)} schemas to {compiled_catalog_path(DEFAULT_TABLES_PATH)}")
@@ -0,0 +1,236 @@
+"""
+Ranked schema linking over the schema catalog.
+
+Each database gets an inverted index over its table and column names (split on
+camelCase, snake_case and digits) and the descriptive column names. Questions
+and their evidence are scored against it with BM25, and the top tables are
+returned together with any tables needed to join them along foreign keys.
+Columns that store a value the question mentions (catalog.value_index) score
+extra.
+"""
+import math
+import re
+import threading
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from catalog.schema_catalog import DatabaseSchema, SchemaCatalog, get_schema_catalog
+
+STOP_WORDS = frozenset("""
+a about above after all also an and any are as at be been before being below between both but by
+can did do does doing during each few for from had has have having how i if in into is it its
+list many more most much no not of off on once only or other out over own per please same shall
+should show so some such than that the their them then there these they this those through to
+too under until up very was were what when where which while who whom why will with would you
+give find tell among according refer refers mean means
+""".split())
+
+_CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
+_WORD = re.compile(r"[A-Za-z]+|\d+")
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Extra score when a question or evidence names a column or table verbatim
+EXACT_MATCH_BONUS = 3.0
+EVIDENCE_WEIGHT = 1.5
+# Extra score per unit of similarity when the column stores a value the question mentions
+VALUE_MATCH_BONUS = 3.0
+
+
+def _stem(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text or identifiers into lowercased, lightly stemmed terms without stop words."""
+    text = _CAMEL_BOUNDARY.sub(" ", text.replace("_", " "))
+    tokens = []
+    for word in _WORD.findall(text):
+        word = word.lower()
+        if word in STOP_WORDS or (len(word) < 2 and not word.isdigit()):
+            continue
+        tokens.append(_stem(word))
+    return tokens
+
+
+@dataclass
+class LinkResult:
+    db_id: str
+    tables: List[str]  # ranked tables followed by join-path tables
+    columns: Dict[str, List[str]] = field(default_factory=dict)  # table -> ranked column names
+    table_scores: Dict[str, float] = field(default_factory=dict)
+    join_tables: List[str] = field(default_factory=list)
+    values: List[dict] = field(default_factory=list)  # value matches that fed the ranking
+
+
+class SchemaIndex:
+    """BM25 inverted index over one database's tables and columns."""
+
+    def __init__(self, db: DatabaseSchema):
+        self.db = db
+        # Documents are columns, plus one document per table name
+        self.documents: List[Tuple[str, Optional[str]]] = []
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths: List[int] = []
+        for table in db.tables.values():
+            docs = [(table.name, None, tokenize(table.name))]
+            for column in table.columns.values():
+                terms = tokenize(column.name) + tokenize(column.description)
+                docs.append((table.name, column.name, terms))
+            for table_name, column_name, terms in docs:
+                doc_id = len(self.documents)
+                self.documents.append((table_name, column_name))
+                lengths.append(len(terms))
+                for term, tf in Counter(terms).items():
+                    postings.setdefault(term, {})[doc_id] = tf
+
+        self.doc_lengths = lengths
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        count = len(lengths)
+        self.postings = postings
+        self.idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in postings.items()
+        }
+        self.identifiers: Dict[str, List[int]] = {}
+        for doc_id, (table_name, column_name) in enumerate(self.documents):
+            self.identifiers.setdefault((column_name or table_name).lower(), []).append(doc_id)
+        self.column_docs = {document: doc_id for doc_id, document in enumerate(self.documents) if document[1]}
+
+        self.neighbors: Dict[str, Set[str]] = {table.name: set() for table in db.tables.values()}
+        for fk in db.foreign_keys:
+            if fk.table != fk.ref_table:
+                self.neighbors[fk.table].add(fk.ref_table)
+                self.neighbors[fk.ref_table].add(fk.table)
+
+    def score(self, question: str, evidence: str = "") -> Dict[int, float]:
+        query = Counter(tokenize(question))
+        for term, tf in Counter(tokenize(evidence)).items():
+            query[term] += tf * EVIDENCE_WEIGHT
+
+        scores: Dict[int, float] = {}
+        for term, weight in query.items():
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in docs.items():
+                norm = K1 * (1 - B + B * self.doc_lengths[doc_id] / (self.avg_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * idf * tf * (K1 + 1) / (tf + norm)
+
+        for identifier in set(_IDENTIFIER.findall(f"{question} {evidence}".lower())):
+            for doc_id in self.identifiers.get(identifier, ()):
+                scores[doc_id] = scores.get(doc_id, 0.0) + EXACT_MATCH_BONUS
+        return scores
+
+    def link(self, question: str, evidence: str = "", top_k: int = 4, max_columns: int = 6,
+             values: Optional[list] = None) -> LinkResult:
+        """`values` are catalog.value_index matches; each boosts the column holding the value."""
+        doc_scores = self.score(question, evidence)
+        for match in values or ():
+            doc_id = self.column_docs.get((match.table, match.column))
+            if doc_id is not None:
+                doc_scores[doc_id] = doc_scores.get(doc_id, 0.0) + VALUE_MATCH_BONUS * match.score
+        name_scores: Dict[str, float] = {}
+        column_scores: Dict[str, List[Tuple[float, str]]] = {}
+        for doc_id, score in doc_scores.items():
+            table_name, column_name = self.documents[doc_id]
+            if column_name is None:
+                name_scores[table_name] = score
+            else:
+                column_scores.setdefault(table_name, []).append((score, column_name))
+
+        table_scores: Dict[str, float] = {}
+        for table_name in set(name_scores) | set(column_scores):
+            ranked = sorted(column_scores.get(table_name, []), reverse=True)
+            column_scores[table_name] = ranked
+            table_scores[table_name] = name_scores.get(table_name, 0.0) + sum(score for score, _ in ranked[:3])
+
+        ranked_tables = sorted(table_scores, key=lambda name: (-table_scores[name], name))[:top_k]
+        if ranked_tables:
+            # Drop weak tail matches that only share a common word with the question
+            cutoff = table_scores[ranked_tables[0]] * 0.2
+            ranked_tables = [name for name in ranked_tables if table_scores[name] >= cutoff]
+
+        join_tables = self._join_path_tables(ranked_tables)
+        tables = ranked_tables + join_tables
+        columns = {
+            name: [column for _, column in column_scores.get(name, [])[:max_columns]]
+            for name in tables
+        }
+        return LinkResult(self.db.db_id, tables, columns, table_scores, join_tables,
+                          [match.as_dict() for match in values or ()])
+
+    def _join_path_tables(self, tables: List[str]) -> List[str]:
+        """Return the extra tables needed to connect `tables` along foreign keys."""
+        if len(tables) < 2:
+            return []
+        connected = {tables[0]}
+        extra: List[str] = []
+        for target in tables[1:]:
+            if target in connected:
+                continue
+            path = self._shortest_path(connected, target)
+            if path is None:
+                connected.add(target)  # No FK route; keep the table on its own
+                continue
+            for name in path:
+                if name not in connected:
+                    connected.add(name)
+                    if name not in tables:
+                        extra.append(name)
+        return extra
+
+    def _shortest_path(self, sources: Set[str], target: str) -> Optional[List[str]]:
+        parents: Dict[str, Optional[str]] = {source: None for source in sources}
+        queue = deque(sources)
+        while queue:
+            current = queue.popleft()
+            if current == target:
+                path = []
+                while current is not None:
+                    path.append(current)
+                    current = parents[current]
+                return path[::-1]
+            for neighbor in sorted(self.neighbors.get(current, ())):
+                if neighbor not in parents:
+                    parents[neighbor] = current
+                    queue.append(neighbor)
+        return None
+
+
+class SchemaLinker:
+    """Builds one SchemaIndex per database on first use and keeps it."""
+
+    def __init__(self, catalog: SchemaCatalog):
+        self.catalog = catalog
+        self._indexes: Dict[str, SchemaIndex] = {}
+        self._lock = threading.Lock()
+
+    def index(self, db_id: str) -> SchemaIndex:
+        with self._lock:
+            if db_id not in self._indexes:
+                self._indexes[db_id] = SchemaIndex(self.catalog.get(db_id))
+            return self._indexes[db_id]
+
+    def link(self, db_id: str, question: str, evidence: str = "", top_k: int = 4, max_columns: int = 6,
+             values: Optional[list] = None) -> LinkResult:
+        return self.index(db_id).link(question, evidence, top_k, max_columns, values)
+
+
+_linker: Optional[SchemaLinker] = None
+_linker_lock = threading.Lock()
+
+def get_schema_linker() -> SchemaLinker:
+    global _linker
+    with _linker_lock:
+        if _linker is None:
+            _linker = SchemaLinker(get_schema_catalog())
+        return _linker
@@ -0,0 +1,338 @@
+"""
+Literal grounding: which column of a database holds a value the question mentions.
+
+The distinct values of every low-cardinality text column in a database's
+SQLite file are indexed by their character trigrams. A question's quoted
+literals and short word spans are looked up against it, and stored values
+whose trigram sets are close enough (Jaccard) come back as (table, column,
+value) matches, exact matches first. The linker boosts the matched columns and
+the generators are shown the stored spelling, so a literal like 'EUR' or
+'201201' is right on the first try rather than after a validation round trip.
+
+The index is compiled next to the database file: postings, value offsets and
+value text in one flat binary file that is memory-mapped, and the trigram
+table and column list in a pickle beside it. It is rebuilt when the database
+file or the build settings change. Only the standard library is needed.
+"""
+import argparse
+import mmap
+import os
+import pickle
+import re
+import sqlite3
+import sys
+import threading
+from array import array
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from catalog.schema_catalog import DatabaseSchema, get_schema_catalog
+from catalog.schema_linker import STOP_WORDS
+from evaluation.execution_evaluator import DEFAULT_DB_ROOT, database_path
+from llm_config import get_value_index_config
+
+VALUE_INDEX_FORMAT_VERSION = 1
+# Longer stored text is prose, not a value a question would quote
+MAX_VALUE_LENGTH = 64
+# Values this short ('M', 'EUR') only match exactly; fuzzy hits on them are noise
+MIN_FUZZY_LENGTH = 4
+# Longest run of question words tried as one value
+MAX_SPAN_WORDS = 4
+# Sections of the binary file, all unsigned 32-bit
+_ARRAYS = ("postings", "offsets", "value_columns", "gram_counts")
+_ITEMSIZE = array("I").itemsize
+
+_QUOTED = re.compile(r"'([^']+)'|\"([^\"]+)\"")
+_SPAN_WORD = re.compile(r"[A-Za-z0-9][\w\-./&]*")
+
+
+@dataclass
+class ValueMatch:
+    table: str
+    column: str
+    value: str  # as stored
+    span: str  # the question or evidence text it matched
+    score: float  # 1.0 for an exact match up to case and spacing
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def normalize_value(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def trigrams(text: str) -> set:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def candidate_spans(question: str, evidence: str = "") -> List[str]:
+    """Quoted literals, then runs of up to MAX_SPAN_WORDS words that neither start nor end on a stop word."""
+    spans: Dict[str, str] = {}
+    for text in (evidence, question):
+        for groups in _QUOTED.findall(text or ""):
+            literal = next(group for group in groups if group).strip()
+            if len(literal) >= 2:
+                spans.setdefault(normalize_value(literal), literal)
+    for text in (question, evidence):
+        words = [word.rstrip(".-/&") for word in _SPAN_WORD.findall(text or "")]
+        words = [word for word in words if word]
+        for start in range(len(words)):
+            if words[start].lower() in STOP_WORDS:
+                continue
+            for end in range(start + 1, min(start + MAX_SPAN_WORDS, len(words)) + 1):
+                if words[end - 1].lower() in STOP_WORDS:
+                    continue
+                span = " ".join(words[start:end])
+                if len(span) >= 2:
+                    spans.setdefault(normalize_value(span), span)
+    return list(spans.values())
+
+
+def _quote(identifier: str) -> str:
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
+def low_cardinality_values(conn: sqlite3.Connection, db: DatabaseSchema,
+                           max_distinct: int) -> Iterator[Tuple[str, str, List[str]]]:
+    """(table, column, distinct values) for each text column with at most `max_distinct` values."""
+    for table in db.tables.values():
+        for column in table.columns.values():
+            if column.type != "text":
+                continue
+            try:
+                rows = conn.execute(
+                    f"SELECT DISTINCT {_quote(column.name)} FROM {_quote(table.name)} "
+                    f"WHERE {_quote(column.name)} IS NOT NULL LIMIT ?", (max_distinct + 1,)).fetchall()
+            except sqlite3.Error:
+                continue  # The file lacks a table or column the catalog lists
+            if len(rows) > max_distinct:
+                continue
+            values = [value for (value,) in rows
+                      if isinstance(value, str) and value.strip() and len(value) <= MAX_VALUE_LENGTH]
+            if values:
+                yield table.name, column.name, values
+
+
+class ValueIndex:
+    """Trigram index over one database's low-cardinality text values."""
+
+    def __init__(self, db_id: str, columns: List[Tuple[str, str]], grams: Dict[str, Tuple[int, int]],
+                 postings, offsets, value_columns, gram_counts, text,
+                 source: Optional[Tuple[int, int]] = None, settings: Optional[dict] = None):
+        self.db_id = db_id
+        self.columns = columns  # (table, column) per indexed column
+        self.grams = grams  # trigram -> (start, count) of its value ids in postings
+        self.postings = postings
+        self.offsets = offsets  # value i is text[offsets[i]:offsets[i + 1]], UTF-8
+        self.value_columns = value_columns  # index into columns, per value
+        self.gram_counts = gram_counts  # distinct trigrams, per value
+        self.text = text
+        self.source = source  # (mtime_ns, size) of the database file the index was built from
+        self.settings = settings or {}
+
+    def __len__(self) -> int:
+        return len(self.value_columns)
+
+    @classmethod
+    def build(cls, db_id: str, column_values: List[Tuple[str, str, List[str]]],
+              source: Optional[Tuple[int, int]] = None, settings: Optional[dict] = None) -> "ValueIndex":
+        columns, values, value_columns = [], [], array("I")
+        for table, column, items in column_values:
+            columns.append((table, column))
+            for value in items:
+                values.append(value)
+                value_columns.append(len(columns) - 1)
+
+        by_gram: Dict[str, List[int]] = {}
+        gram_counts = array("I")
+        for value_id, value in enumerate(values):
+            grams = trigrams(normalize_value(value))
+            gram_counts.append(len(grams))
+            for gram in grams:
+                by_gram.setdefault(gram, []).append(value_id)
+        grams, postings = {}, array("I")
+        for gram, ids in by_gram.items():
+            grams[gram] = (len(postings), len(ids))
+            postings.extend(ids)
+
+        text, offsets = bytearray(), array("I", [0])
+        for value in values:
+            text += value.encode("utf-8")
+            offsets.append(len(text))
+        return cls(db_id, columns, grams, postings, offsets, value_columns, gram_counts, bytes(text), source, settings)
+
+    def value(self, value_id: int) -> str:
+        return bytes(self.text[self.offsets[value_id]:self.offsets[value_id + 1]]).decode("utf-8")
+
+    def _similar(self, text: str, min_similarity: float) -> Iterator[Tuple[int, float]]:
+        query = trigrams(text)
+        shared: Counter = Counter()
+        for gram in query:
+            entry = self.grams.get(gram)
+            if entry:
+                start, count = entry
+                shared.update(self.postings[start:start + count])
+        # Jaccard is at most shared / |query|, so most candidates go without decoding their value
+        floor = min_similarity * len(query)
+        for value_id, common in shared.items():
+            if common < floor:
+                continue
+            score = common / (len(query) + self.gram_counts[value_id] - common)
+            if score < min_similarity:
+                continue
+            value = normalize_value(self.value(value_id))
+            if value == text:
+                yield value_id, 1.0
+            elif len(value) >= MIN_FUZZY_LENGTH and len(text) >= MIN_FUZZY_LENGTH:
+                # Same trigrams in a different order still falls short of exact
+                yield value_id, min(score, 0.99)
+
+    def lookup(self, question: str, evidence: str = "", k: int = 5, min_similarity: float = 0.75) -> List[ValueMatch]:
+        """Up to `k` stored values the question or evidence mentions, best first."""
+        best: Dict[int, Tuple[float, str]] = {}
+        for span in candidate_spans(question, evidence):
+            for value_id, score in self._similar(normalize_value(span), min_similarity):
+                if value_id not in best or score > best[value_id][0]:
+                    best[value_id] = (score, span)
+        # Longer spans first among equals: 'Czech Republic' says more than 'Czech'
+        ranked = sorted(best.items(), key=lambda item: (-item[1][0], -len(item[1][1]), item[0]))[:k]
+        return [ValueMatch(*self.columns[self.value_columns[value_id]], self.value(value_id), span, round(score, 4))
+                for value_id, (score, span) in ranked]
+
+    def save(self, path: str) -> None:
+        """Write the arrays and value text to `path`.bin and everything else to `path`.pkl."""
+        sections, offset = {}, 0
+        tmp = f".tmp.{os.getpid()}"
+        with open(f"{path}.bin{tmp}", "wb") as f:
+            for name in _ARRAYS:
+                data = array("I", getattr(self, name))
+                f.write(data.tobytes())
+                sections[name] = (offset, len(data))
+                offset += len(data) * _ITEMSIZE
+            f.write(bytes(self.text))
+            sections["text"] = (offset, len(self.text))
+        with open(f"{path}.pkl{tmp}", "wb") as f:
+            pickle.dump((VALUE_INDEX_FORMAT_VERSION, sys.byteorder, self.source, self.settings, self.db_id,
+                         self.columns, self.grams, sections), f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Binary first: a new .pkl never points into an old .bin
+        os.replace(f"{path}.bin{tmp}", f"{path}.bin")
+        os.replace(f"{path}.pkl{tmp}", f"{path}.pkl")
+
+    @classmethod
+    def load(cls, path: str) -> "ValueIndex":
+        with open(f"{path}.pkl", "rb") as f:
+            version, byteorder, source, settings, db_id, columns, grams, sections = pickle.load(f)
+        if version != VALUE_INDEX_FORMAT_VERSION or byteorder != sys.byteorder:
+            raise ValueError(f"Unsupported value index version: {version} ({byteorder})")
+        with open(f"{path}.bin", "rb") as f:
+            # Pages are read on first use and shared by every process mapping the file
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        view = memoryview(buffer)
+        arrays = {}
+        for name in _ARRAYS:
+            start, count = sections[name]
+            arrays[name] = view[start:start + count * _ITEMSIZE].cast("I")
+        start, length = sections["text"]
+        return cls(db_id, columns, grams, arrays["postings"], arrays["offsets"], arrays["value_columns"],
+                   arrays["gram_counts"], view[start:start + length], source, settings)
+
+
+def _source_signature(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def compiled_index_path(db_id: str, root: str = DEFAULT_DB_ROOT) -> str:
+    return os.path.splitext(database_path(db_id, root))[0] + ".values"
+
+
+def build_value_index(db: DatabaseSchema, root: str = DEFAULT_DB_ROOT, max_distinct: Optional[int] = None) -> ValueIndex:
+    """Scan `db`'s SQLite file under `root` and index its low-cardinality text values."""
+    path = database_path(db.db_id, root)
+    max_distinct = max_distinct or get_value_index_config()["max_distinct"]
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        column_values = list(low_cardinality_values(conn, db, max_distinct))
+    finally:
+        conn.close()
+    settings = {"max_distinct": max_distinct, "max_value_length": MAX_VALUE_LENGTH}
+    return ValueIndex.build(db.db_id, column_values, _source_signature(path), settings)
+
+
+def load_or_build_index(db_id: str, root: str = DEFAULT_DB_ROOT) -> Optional[ValueIndex]:
+    """
+    The compiled index of `db_id` if it matches the database file and settings,
+    otherwise rebuilt and saved; None when there is no database file.
+    """
+    path = database_path(db_id, root)
+    if not os.path.exists(path):
+        return None
+    compiled_path = compiled_index_path(db_id, root)
+    settings = {"max_distinct": get_value_index_config()["max_distinct"], "max_value_length": MAX_VALUE_LENGTH}
+    if os.path.exists(f"{compiled_path}.pkl"):
+        try:
+            index = ValueIndex.load(compiled_path)
+            if index.source == _source_signature(path) and index.settings == settings:
+                return index
+        except Exception:
+            pass  # Stale or unreadable; rebuild below
+
+    index = build_value_index(get_schema_catalog().get(db_id), root, settings["max_distinct"])
+    try:
+        index.save(compiled_path)
+    except OSError:
+        pass  # Read-only checkout; the in-memory index is still usable
+    return index
+
+
+_indexes: Dict[Tuple[str, str], Optional[ValueIndex]] = {}
+_index_root = DEFAULT_DB_ROOT
+_index_disabled = False
+_index_lock = threading.Lock()
+
+def disable_value_index() -> None:
+    """Turn literal grounding off for the rest of the process."""
+    global _index_disabled
+    _index_disabled = True
+
+def set_value_index_root(root: str) -> None:
+    """Read databases from `root` (<root>/<db_id>/<db_id>.sqlite) from now on."""
+    global _index_root
+    _index_root = root
+
+def get_value_index(db_id: str) -> Optional[ValueIndex]:
+    """The index of `db_id`, or None when grounding is off or the database file is missing."""
+    if _index_disabled or not get_value_index_config()["enabled"]:
+        return None
+    key = (_index_root, db_id)
+    with _index_lock:
+        if key not in _indexes:
+            _indexes[key] = load_or_build_index(db_id, _index_root)
+        return _indexes[key]
+
+def lookup_values(db_id: str, question: str, evidence: str = "") -> List[ValueMatch]:
+    """The configured number of value matches for a question; [] without an index."""
+    index = get_value_index(db_id)
+    if index is None:
+        return []
+    config = get_value_index_config()
+    return index.lookup(question, evidence, config["k"], config["min_similarity"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the value index of every database with a SQLite file.")
+    parser.add_argument("--root", default=DEFAULT_DB_ROOT)
+    parser.add_argument("--max-distinct", type=int, default=None,
+                        help="Skip text columns with more distinct values (default: VALUE_INDEX_MAX_DISTINCT)")
+    args = parser.parse_args()
+    for db_id, db in get_schema_catalog().databases.items():
+        if not os.path.exists(database_path(db_id, args.root)):
+            print(f"{db_id}: no database file, skipped")
+            continue
+        index = build_value_index(db, args.root, args.max_distinct)
+        index.save(compiled_index_path(db_id, args.root))
+        print(f"{db_id}: {len(index)} values from {len(index.columns)} columns to "
+              f"{compiled_index_path(db_id, args.root)}.bin")
@@ -0,0 +1,70 @@
+"""
+Bounded-concurrency runner that processes many questions at once.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+async def _run_one(index: int, item: Any, fn: Callable[[Any], Any], pool: ThreadPoolExecutor,
+                   timeout: Optional[float],
+                   on_result: Optional[Callable[[int, Dict[str, Any]], None]]) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    started = asyncio.Event()
+
+    def call():
+        loop.call_soon_threadsafe(started.set)
+        return fn(item)
+
+    future = loop.run_in_executor(pool, call)
+    # The timeout clock starts once a worker thread picks the item up, not at submission.
+    await started.wait()
+    start = time.perf_counter()
+    outcome = {"index": index, "status": "ok", "result": None, "error": None}
+    try:
+        outcome["result"] = await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        outcome["status"] = "timeout"
+        outcome["error"] = f"Timed out after {timeout}s"
+    except Exception as e:
+        outcome["status"] = "error"
+        outcome["error"] = str(e)
+    outcome["elapsed"] = time.perf_counter() - start
+    if on_result:
+        on_result(index, outcome)
+    return outcome
+
+
+async def run_batch_async(items: List[Any], fn: Callable[[Any], Any], workers: int = 4,
+                          timeout: Optional[float] = None,
+                          on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """
+    Run `fn` over `items` with at most `workers` calls in flight.
+
+    Results are returned in the same order as `items`. `fn` runs in a worker
+    thread, so anything it keeps in `state.shared_state` is private to the item.
+    A timed-out call is reported as such; its thread is left to finish on its own
+    because Python threads cannot be cancelled, and keeps its worker until it
+    does, so no more than `workers` calls ever run at once.
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+
+    # The pool is the bound: items wait in its queue until a thread is free.
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="question")
+    try:
+        tasks = [
+            _run_one(i, item, fn, pool, timeout, on_result)
+            for i, item in enumerate(items)
+        ]
+        return list(await asyncio.gather(*tasks))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_batch(items: List[Any], fn: Callable[[Any], Any], workers: int = 4,
+              timeout: Optional[float] = None,
+              on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """Synchronous wrapper around `run_batch_async`."""
+    return asyncio.run(run_batch_async(items, fn, workers, timeout, on_result))
@@ -0,0 +1,101 @@
+"""
+Request coalescing and admission control for the resident service.
+
+Requests with the same key that arrive while one is running share its result
+instead of running the pipeline again. At most `workers` run at once and
+`max_queue` more may wait; anything beyond that is refused straight away, so a
+burst gets a fast "busy" instead of piling up behind the model server.
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class QueueFull(Exception):
+    pass
+
+
+class CoalescingExecutor:
+    def __init__(self, workers: int = 4, max_queue: int = 32):
+        if workers < 1 or max_queue < 0:
+            raise ValueError("workers must be at least 1 and max_queue at least 0")
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="request")
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._admitted = 0  # running or waiting
+        self._running = 0
+        self.executed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    @property
+    def queue_depth(self) -> int:
+        with self._lock:
+            return self._admitted - self._running
+
+    def submit(self, key: Hashable, fn: Callable[..., Any], *args) -> Tuple[Future, bool]:
+        """
+        A future for `fn(*args)`, and whether it joined a run already in flight for `key`.
+
+        Raises QueueFull when the request would have to wait beyond `max_queue`.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, True
+            if self._admitted >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"{self._admitted - self._running} requests already waiting")
+            self._admitted += 1
+            # Registered before the task can start, so its cleanup always finds it
+            future = self._in_flight[key] = Future()
+        self._pool.submit(self._run, key, future, fn, args)
+        return future, False
+
+    def _run(self, key: Hashable, future: Future, fn: Callable[..., Any], args: tuple) -> None:
+        with self._lock:
+            self._running += 1
+        try:
+            result, error = fn(*args), None
+        except BaseException as e:
+            result, error = None, e
+        with self._lock:
+            # Requests from here on start a fresh run rather than receive this result
+            self._in_flight.pop(key, None)
+            self._running -= 1
+            self._admitted -= 1
+            self.executed += 1
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def warm(self, fn: Callable[[], None]) -> None:
+        """Run `fn` once on every worker thread, starting all of them now rather than on demand."""
+        barrier = threading.Barrier(self.workers)
+
+        def once():
+            fn()
+            barrier.wait()  # Holds this thread so the next call lands on a new one
+
+        for future in [self._pool.submit(once) for _ in range(self.workers)]:
+            future.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queue_depth": self._admitted - self._running,
+                "max_queue": self.max_queue,
+                "in_flight_keys": len(self._in_flight),
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
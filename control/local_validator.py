@@ -0,0 +1,139 @@
+"""
+Deterministic SQL validation against the schema catalog, without an LLM call.
+
+Each database's DDL is loaded into an empty in-memory SQLite database and the
+query is compiled with EXPLAIN. SQLite resolves every table and column while
+preparing the statement, so unknown identifiers are caught without any data.
+
+With a target dialect, syntax that dialect rejects is reported before compiling,
+and queries for other dialects are transpiled to SQLite first when sqlglot is
+installed. Syntax errors only count as invalid when the target is SQLite itself.
+"""
+import difflib
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from catalog.dialects import foreign_syntax, get_dialect
+from catalog.schema_catalog import DatabaseSchema, get_schema_catalog
+from control.transpile import transpile
+
+VALID = "valid"
+INVALID = "invalid"
+UNKNOWN = "unknown"  # Could not be checked locally, e.g. dialect-specific syntax
+
+_NO_SUCH_TABLE = re.compile(r"no such table: (?:\w+\.)?(\S+)", re.IGNORECASE)
+_NO_SUCH_COLUMN = re.compile(r"no such column: (\S+)", re.IGNORECASE)
+_AMBIGUOUS_COLUMN = re.compile(r"ambiguous column name: (\S+)", re.IGNORECASE)
+_COMPLEX_QUERY = re.compile(r"\b(JOIN|GROUP\s+BY|HAVING|UNION|INTERSECT|EXCEPT|OVER)\b|\(\s*SELECT\b", re.IGNORECASE)
+_QUERY_START = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+_connections: Dict[str, Tuple[sqlite3.Connection, threading.Lock]] = {}
+_connections_lock = threading.Lock()
+
+
+def _empty_database(db: DatabaseSchema) -> Tuple[sqlite3.Connection, threading.Lock]:
+    with _connections_lock:
+        if db.db_id not in _connections:
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            for table in db.tables.values():
+                if table.columns:
+                    conn.execute(table.ddl["sqlite"])
+            _connections[db.db_id] = (conn, threading.Lock())
+        return _connections[db.db_id]
+
+
+def _closest_columns(db: DatabaseSchema, name: str, limit: int = 3) -> List[str]:
+    qualified = {f"{table.name}.{column.name}": column.name.lower()
+                 for table in db.tables.values() for column in table.columns.values()}
+    matches = difflib.get_close_matches(name.lower(), set(qualified.values()), n=limit, cutoff=0.6)
+    return [key for key, column in qualified.items() if column in matches][:limit]
+
+
+def _suggestions_for(db: DatabaseSchema, error: str) -> List[str]:
+    match = _NO_SUCH_TABLE.search(error)
+    if match:
+        name = match.group(1).strip("`\"[]")
+        close = difflib.get_close_matches(name.lower(), list(db.tables), n=3, cutoff=0.5)
+        hint = f" Did you mean: {', '.join(db.tables[key].name for key in close)}?" if close else ""
+        return [f"Table '{name}' does not exist in database '{db.db_id}'.{hint}"]
+
+    match = _NO_SUCH_COLUMN.search(error)
+    if match:
+        name = match.group(1)
+        column = name.split(".")[-1].strip("`\"[]")
+        close = _closest_columns(db, column)
+        hint = f" Did you mean: {', '.join(close)}?" if close else ""
+        return [f"Column '{name}' does not exist in the referenced tables.{hint}"]
+
+    match = _AMBIGUOUS_COLUMN.search(error)
+    if match:
+        return [f"Column '{match.group(1)}' is ambiguous; qualify it with a table alias."]
+
+    return [error]
+
+
+def check_sql(sql: str, db_id: str, dialect: Optional[str] = None) -> dict:
+    """
+    Compile `sql` against an empty copy of the database schema.
+
+    Returns the same structure as the LLM validator plus a `status` of
+    "valid", "invalid" or "unknown" and the raw `error`, if any. Without
+    `dialect`, syntax errors are "unknown" since the query may be another
+    dialect's.
+    """
+    result = {"is_valid": False, "final_query": sql, "suggestions": [], "status": INVALID, "error": None}
+    sql = (sql or "").strip().rstrip(";").strip()
+    if not sql:
+        result["suggestions"] = ["The SQL query is empty."]
+        return result
+    if not _QUERY_START.match(sql):
+        result["suggestions"] = ["Only SELECT queries are allowed."]
+        return result
+
+    target = get_dialect(dialect) if dialect else None
+    compiled = sql
+    if target is not None:
+        mismatches = foreign_syntax(sql, target)
+        if mismatches:
+            result["error"] = f"Not valid {target.label}"
+            result["suggestions"] = mismatches
+            return result
+        compiled = transpile(sql, "sqlite", source=target.name)
+
+    db = get_schema_catalog().get(db_id)
+    conn, lock = _empty_database(db)
+    try:
+        with lock:
+            conn.execute(f"EXPLAIN {compiled}")
+    except sqlite3.Error as e:
+        error = str(e)
+        result["error"] = error
+        if "one statement at a time" in error:
+            result["suggestions"] = ["Submit a single SQL statement."]
+        elif _NO_SUCH_TABLE.search(error) or _NO_SUCH_COLUMN.search(error) or _AMBIGUOUS_COLUMN.search(error):
+            result["suggestions"] = _suggestions_for(db, error)
+        elif target is not None and target.name == "sqlite":
+            result["suggestions"] = [error]
+        else:
+            # Syntax and function errors may just be another dialect; let the LLM judge
+            result["status"] = UNKNOWN
+            result["suggestions"] = [error]
+        return result
+
+    result.update(is_valid=True, status=VALID, final_query=sql)
+    return result
+
+
+def needs_semantic_review(sql: str, policy: str = "complex") -> bool:
+    """
+    Decide whether a query that compiled locally should still go to the LLM validator.
+
+    policy: "always", "never", or "complex" (joins, grouping, subqueries, set operations).
+    """
+    if policy == "always":
+        return True
+    if policy == "never":
+        return False
+    return bool(_COMPLEX_QUERY.search(sql or ""))
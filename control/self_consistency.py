@@ -0,0 +1,198 @@
+"""
+Self-consistency: sample several SQL candidates concurrently and pick one by vote.
+
+Candidates are deduplicated after normalization and executed in parallel
+against the question's SQLite database, transpiled there from the target
+dialect. They are then grouped by result set, and the group backed by the
+most samples wins. Without a database file, or when the target dialect is not
+SQLite and transpiling is off or unavailable, candidates are compiled locally
+instead and the vote is on the normalized query text.
+"""
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import copy_context
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from catalog.dialects import get_dialect
+from control.local_validator import INVALID, check_sql
+from control.transpile import transpile, transpile_available
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_candidate(sql: str) -> str:
+    """Fold case and whitespace outside string literals and drop the trailing semicolon."""
+    parts = []
+    last = 0
+    for match in _LITERAL.finditer(sql):
+        parts.append(_SPACE.sub(" ", sql[last:match.start()]).lower())
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(_SPACE.sub(" ", sql[last:]).lower())
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+@dataclass
+class Candidate:
+    sql: str
+    seeds: List[int] = field(default_factory=list)
+    status: str = "pending"  # "ok", "error" or "invalid" once checked
+    error: Optional[str] = None
+    result_key: Optional[frozenset] = None
+    rows: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def samples(self) -> int:
+        return len(self.seeds)
+
+
+@dataclass
+class VoteResult:
+    sql: Optional[str]
+    candidates: List[Candidate]
+    requested: int
+    received: int
+    votes: int = 0
+    executed: bool = False  # True when candidates ran against the database
+    sampling_s: float = 0.0
+    voting_s: float = 0.0
+    sample_errors: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return {
+            "sql": self.sql,
+            "requested": self.requested,
+            "received": self.received,
+            "distinct": len(self.candidates),
+            "votes": self.votes,
+            "executed": self.executed,
+            "sampling_s": self.sampling_s,
+            "voting_s": self.voting_s,
+            "sample_errors": self.sample_errors,
+            "candidates": [
+                {"sql": c.sql, "samples": c.samples, "status": c.status, "error": c.error, "rows": c.rows}
+                for c in self.candidates
+            ]
+        }
+
+
+def sample(generate: Callable[[int], str], k: int, concurrency: int,
+           deadline: float) -> Tuple[List[Tuple[int, str]], List[str]]:
+    """Call `generate(seed)` for seeds 0..k-1, at most `concurrency` at a time, until `deadline`."""
+    pool = ThreadPoolExecutor(max_workers=max(1, min(concurrency, k)), thread_name_prefix="sample")
+    try:
+        # Copy the context so samples are traced and see the question's state
+        futures = {pool.submit(copy_context().run, generate, seed): seed for seed in range(k)}
+        done, _ = wait(futures, timeout=max(0.0, deadline - time.perf_counter()))
+    finally:
+        # Samples still running past the budget are abandoned, not waited for
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    samples, errors = [], []
+    for future in sorted(done, key=futures.get):
+        try:
+            sql = future.result()
+        except Exception as e:
+            errors.append(str(e))
+            continue
+        if sql:
+            samples.append((futures[future], sql))
+    return samples, errors
+
+
+def dedupe(samples: List[Tuple[int, str]]) -> List[Candidate]:
+    candidates: Dict[str, Candidate] = {}
+    for seed, sql in samples:
+        candidates.setdefault(normalize_candidate(sql), Candidate(sql)).seeds.append(seed)
+    return list(candidates.values())
+
+
+def check_candidates(candidates: List[Candidate], db_id: str, evaluator=None, concurrency: int = 4,
+                     deadline: Optional[float] = None, dialect: Optional[str] = None,
+                     allow_transpile: bool = True) -> bool:
+    """
+    Execute (or, without a runnable database, compile) every candidate; True if they were executed.
+
+    The databases are SQLite, so candidates in another dialect only run when
+    `allow_transpile` is set and sqlglot is there to rewrite them; valid MySQL
+    would otherwise fail on SQLite and lose the vote.
+    """
+    dialect = get_dialect(dialect).name
+    runnable = dialect == "sqlite" or (allow_transpile and transpile_available())
+    if evaluator is None or not runnable or not evaluator.has_database(db_id):
+        for candidate in candidates:
+            local = check_sql(candidate.sql, db_id, dialect)
+            candidate.status = "invalid" if local["status"] == INVALID else "ok"
+            candidate.error = local.get("error") or (local["suggestions"][0] if local["status"] == INVALID else None)
+        return False
+
+    def execute(candidate: Candidate) -> None:
+        timeout = None if deadline is None else max(0.1, deadline - time.perf_counter())
+        result = evaluator.execute(db_id, transpile(candidate.sql, "sqlite", dialect), timeout=timeout)
+        candidate.elapsed = result.elapsed
+        if result.ok:
+            candidate.status = "ok"
+            candidate.result_key = frozenset(result.rows.items())
+            candidate.rows = sum(result.rows.values())
+        else:
+            candidate.status = "error"
+            candidate.error = result.error
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(candidates))), thread_name_prefix="vote") as pool:
+        list(pool.map(execute, candidates))
+    return True
+
+
+def vote(candidates: List[Candidate]) -> Tuple[Optional[Candidate], int]:
+    """
+    The winning candidate and its group's vote count.
+
+    Candidates that ran are grouped by result set (or by query text when they
+    were only compiled); each group scores the samples behind it. Ties go to
+    a group with a non-empty result, then to the one sampled first.
+    """
+    groups: Dict[object, List[Candidate]] = {}
+    for candidate in candidates:
+        if candidate.status == "ok":
+            key = candidate.result_key if candidate.result_key is not None else normalize_candidate(candidate.sql)
+            groups.setdefault(key, []).append(candidate)
+    if not groups:
+        return None, 0
+
+    def rank(group: List[Candidate]):
+        return (sum(c.samples for c in group), any(c.rows for c in group), -min(min(c.seeds) for c in group))
+
+    best = max(groups.values(), key=rank)
+    winner = max(best, key=lambda c: (c.samples, -min(c.seeds)))
+    return winner, sum(c.samples for c in best)
+
+
+def self_consistent_sql(generate: Callable[[int], str], db_id: str, evaluator=None, k: int = 5,
+                        concurrency: Optional[int] = None, budget: float = 60.0,
+                        dialect: Optional[str] = None, allow_transpile: bool = True) -> VoteResult:
+    """Sample `k` candidates within `budget` seconds, check them and return the voted query."""
+    start = time.perf_counter()
+    deadline = start + budget
+    concurrency = concurrency or k
+    samples, errors = sample(generate, k, concurrency, deadline)
+    sampled = time.perf_counter()
+
+    candidates = dedupe(samples)
+    executed = check_candidates(candidates, db_id, evaluator, concurrency, deadline, dialect,
+                                allow_transpile) if candidates else False
+    winner, votes = vote(candidates)
+    return VoteResult(
+        sql=winner.sql if winner else None,
+        candidates=candidates,
+        requested=k,
+        received=len(samples),
+        votes=votes,
+        executed=executed,
+        sampling_s=sampled - start,
+        voting_s=time.perf_counter() - sampled,
+        sample_errors=errors
+    )
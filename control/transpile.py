@@ -0,0 +1,39 @@
+"""
+Rewrite SQL from one dialect into another with sqlglot, without a model call.
+
+sqlglot is optional. Without it, or when it cannot parse a query, the query is
+returned unchanged and validation judges it as written.
+"""
+from typing import Optional
+
+from catalog.dialects import DEFAULT_DIALECT, get_dialect
+
+try:
+    import sqlglot
+    from sqlglot.errors import SqlglotError
+except ImportError:
+    sqlglot = None
+
+
+def transpile_available() -> bool:
+    return sqlglot is not None
+
+
+def transpile(sql: str, target: str, source: Optional[str] = None) -> str:
+    """`sql`, written in `source` (default: `target`), rewritten for `target`; unchanged when that fails."""
+    target = get_dialect(target)
+    source = get_dialect(source) if source else target
+    if sqlglot is None or not sql or source.name == target.name:
+        return sql
+    try:
+        statements = sqlglot.transpile(sql, read=source.sqlglot, write=target.sqlglot)
+    except SqlglotError:
+        return sql
+    return statements[0] if len(statements) == 1 else sql
+
+
+def transpile_output(sql: str, state: dict) -> str:
+    """A generator's query, moved from the dialect it was prompted in to the pipeline's target dialect."""
+    if not state.get("transpile", True):
+        return sql
+    return transpile(sql, state.get("dialect") or DEFAULT_DIALECT, state.get("generation_dialect"))
@@ -0,0 +1,354 @@
+"""
+A question queue in one SQLite file, shared by worker processes on one or more hosts.
+
+A coordinator enqueues questions; each worker leases one at a time, runs it
+and writes the result record back. Leases are held for `lease_seconds` and
+renewed by a heartbeat while the worker is alive, so a question whose worker
+died goes back to the queue once its lease runs out. After `max_attempts`
+leases a question is given up on. Completing is idempotent: the first result
+for a question wins, so a worker that outlived its lease does no harm.
+
+SQLite needs working file locks, so for several hosts put the file on storage
+that provides them (a local disk exported over NFSv4 with locking, not SMB).
+The queue uses SQLite's rollback journal, which relies on those locks alone.
+WAL mode is faster under many workers but keeps a shared-memory index that
+only processes on one host can see, so it is opt-in (`wal=True`,
+QUEUE_WAL=1) and only for runs whose workers all share the file's host.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional
+
+from planning.tracing import percentile
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"  # given up after max_attempts
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    def __init__(self, path: str, lease_seconds: float = 300.0, max_attempts: int = 3, wal: bool = False):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        # WAL does not work over a network filesystem; see the module docstring
+        self._conn.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS tasks (
+                question_id INTEGER PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_expires REAL,
+                result TEXT,
+                enqueued REAL NOT NULL,
+                started REAL,
+                finished REAL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status, attempts, question_id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _transaction(self, fn: Callable[[], Any]) -> Any:
+        # IMMEDIATE takes the write lock up front, so two processes never lease the same row
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, questions: List[dict], requeue_failed: bool = False) -> int:
+        """Add questions not yet queued (or failed, with `requeue_failed`); returns how many were added."""
+        now = time.time()
+
+        def add() -> int:
+            added = 0
+            for question in questions:
+                payload = json.dumps(question, ensure_ascii=False)
+                if requeue_failed:
+                    added += self._conn.execute(
+                        "UPDATE tasks SET status = ?, attempts = 0, worker = NULL, lease_expires = NULL, "
+                        "result = NULL, payload = ? WHERE question_id = ? AND status = ?",
+                        (PENDING, payload, question["question_id"], FAILED)).rowcount
+                added += self._conn.execute(
+                    "INSERT OR IGNORE INTO tasks (question_id, payload, status, enqueued) VALUES (?, ?, ?, ?)",
+                    (question["question_id"], payload, PENDING, now)).rowcount
+            return added
+        return self._transaction(add)
+
+    def set_meta(self, key: str, value: Any) -> None:
+        self._transaction(lambda: self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value))))
+
+    def get_meta(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _expire_leases(self, now: float) -> None:
+        expired = self._conn.execute(
+            "SELECT question_id, attempts, payload FROM tasks WHERE status = ? AND lease_expires < ?",
+            (LEASED, now)).fetchall()
+        for question_id, attempts, payload in expired:
+            if attempts >= self.max_attempts:
+                question = json.loads(payload)
+                record = {"question_id": question_id, "db_id": question.get("db_id"),
+                          "difficulty": question.get("difficulty"), "question": question.get("question"),
+                          "status": "lease_expired", "error": f"Lease expired {attempts} times",
+                          "final_sql": None, "match": False}
+                self._conn.execute("UPDATE tasks SET status = ?, result = ?, finished = ? WHERE question_id = ?",
+                                   (FAILED, json.dumps(record), now, question_id))
+            else:
+                self._conn.execute("UPDATE tasks SET status = ?, worker = NULL, lease_expires = NULL "
+                                   "WHERE question_id = ?", (PENDING, question_id))
+
+    def lease(self, worker: str) -> Optional[dict]:
+        """The next pending question, leased to `worker`, or None when nothing is pending."""
+        def take() -> Optional[dict]:
+            now = time.time()
+            self._expire_leases(now)
+            # Fresh questions before retries, so one poisoned question cannot hold up the rest
+            row = self._conn.execute(
+                "SELECT question_id, payload FROM tasks WHERE status = ? ORDER BY attempts, question_id LIMIT 1",
+                (PENDING,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                "started = COALESCE(started, ?) WHERE question_id = ?",
+                (LEASED, worker, now + self.lease_seconds, now, row[0]))
+            return json.loads(row[1])
+        return self._transaction(take)
+
+    def renew(self, worker: str) -> int:
+        """Extend every lease `worker` holds; the worker's heartbeat."""
+        return self._transaction(lambda: self._conn.execute(
+            "UPDATE tasks SET lease_expires = ? WHERE worker = ? AND status = ?",
+            (time.time() + self.lease_seconds, worker, LEASED)).rowcount)
+
+    def complete(self, question_id: Any, worker: str, record: Dict[str, Any], retry: bool = False) -> bool:
+        """
+        Store the result of a leased question; False when it already had one.
+
+        With `retry` (an error or timeout) the question goes back to the queue
+        instead, unless it has used up its attempts.
+        """
+        record = {**record, "worker": worker}
+
+        def finish() -> bool:
+            row = self._conn.execute("SELECT status, attempts, worker FROM tasks WHERE question_id = ?",
+                                     (question_id,)).fetchone()
+            if row is None or row[0] in (DONE, FAILED):
+                return False
+            if retry and row[2] != worker:
+                return False  # The lease ran out and another worker holds it now; let that one finish
+            if retry and row[1] < self.max_attempts:
+                self._conn.execute("UPDATE tasks SET status = ?, worker = NULL, lease_expires = NULL, result = ? "
+                                   "WHERE question_id = ?", (PENDING, json.dumps(record, default=str), question_id))
+                return True
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, worker = ?, lease_expires = NULL, result = ?, finished = ? "
+                "WHERE question_id = ?",
+                (DONE if not retry else FAILED, worker, json.dumps(record, default=str), time.time(), question_id))
+            return True
+        return self._transaction(finish)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        return {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0, **dict(rows)}
+
+    def drained(self) -> bool:
+        counts = self.counts()
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    def records(self) -> List[Dict[str, Any]]:
+        """The result record of every finished question, with queue timing added."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT result, attempts, started, finished FROM tasks WHERE status IN (?, ?) ORDER BY question_id",
+                (DONE, FAILED)).fetchall()
+        records = []
+        for result, attempts, started, finished in rows:
+            record = json.loads(result)
+            record.update({"attempts": attempts, "started": started, "finished": finished})
+            records.append(record)
+        return records
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def run_worker(queue: WorkQueue, fn: Callable[[dict], Dict[str, Any]], workers: int = 1,
+               timeout: Optional[float] = None, poll_interval: float = 2.0, wait: bool = False,
+               worker: Optional[str] = None,
+               on_result: Optional[Callable[[dict, Dict[str, Any]], None]] = None) -> int:
+    """
+    Lease and run questions with `workers` in flight until the queue is empty.
+
+    `fn` maps question data to a results record whose "status" is "ok" when
+    it finished. Other statuses, exceptions and timeouts send the question
+    back for another attempt. `timeout` counts from when a call starts; a call
+    that overruns it keeps its thread until it returns, and no question is
+    leased in its place until then. With `wait`, the worker also waits for leases
+    held elsewhere to finish or expire, taking over any that come back.
+    Returns the number of questions this worker ran.
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    worker = worker or worker_name()
+    stop = threading.Event()
+    ran = [0]
+    ran_lock = threading.Lock()
+
+    def heartbeat():
+        while not stop.wait(max(1.0, queue.lease_seconds / 3)):
+            queue.renew(worker)
+
+    # At most `workers` calls run, stragglers included: a timed-out call keeps its
+    # thread, and no question is leased until a thread is free again, as in run_batch
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="question")
+    free = threading.Semaphore(workers)
+
+    def call(question: dict, started: threading.Event) -> Dict[str, Any]:
+        started.set()
+        try:
+            return fn(question)
+        finally:
+            free.release()
+
+    def slot():
+        while not stop.is_set():
+            if not free.acquire(timeout=poll_interval):
+                continue
+            question = queue.lease(worker)
+            if question is None:
+                free.release()
+                if not wait or queue.drained():
+                    return
+                stop.wait(poll_interval)
+                continue
+            started = threading.Event()
+            future = pool.submit(call, question, started)
+            # The timeout clock starts once the call does, not at submission
+            started.wait()
+            start = time.perf_counter()
+            try:
+                record = future.result(timeout)
+                retry = record.get("status") != "ok"
+            except FutureTimeout:
+                record, retry = {"status": "timeout", "error": f"Timed out after {timeout}s"}, True
+            except Exception as e:
+                record, retry = {"status": "error", "error": str(e)}, True
+            record = {"question_id": question["question_id"], "db_id": question.get("db_id"),
+                      "difficulty": question.get("difficulty"), "question": question.get("question"),
+                      "final_sql": None, "match": False, "timings": {"total": time.perf_counter() - start},
+                      **record}
+            queue.complete(question["question_id"], worker, record, retry)
+            with ran_lock:
+                ran[0] += 1
+            if on_result:
+                on_result(question, record)
+
+    beat = threading.Thread(target=heartbeat, name="lease-heartbeat", daemon=True)
+    beat.start()
+    slots = [threading.Thread(target=slot, name=f"queue-slot-{i}", daemon=True) for i in range(workers)]
+    try:
+        for thread in slots:
+            thread.start()
+        for thread in slots:
+            thread.join()
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    return ran[0]
+
+
+def aggregate_report(records: List[Dict[str, Any]], counts: Optional[Dict[str, int]] = None) -> dict:
+    """Accuracy, latency and per-worker throughput over the finished records of a queue."""
+    finished = [record for record in records if record.get("status") == "ok"]
+    latencies = sorted(record.get("timings", {}).get("total", 0.0) for record in records)
+    starts = [record["started"] for record in records if record.get("started")]
+    ends = [record["finished"] for record in records if record.get("finished")]
+    wall = (max(ends) - min(starts)) if starts and ends else 0.0
+
+    def accuracy(group: List[Dict[str, Any]]) -> float:
+        return 100.0 * sum(1 for record in group if record.get("match")) / len(group) if group else 0.0
+
+    by_worker: Dict[str, List[Dict[str, Any]]] = {}
+    by_difficulty: Dict[str, List[Dict[str, Any]]] = {}
+    stage_times: Dict[str, List[float]] = {}
+    for record in records:
+        by_worker.setdefault(record.get("worker") or "?", []).append(record)
+        by_difficulty.setdefault(record.get("difficulty") or "?", []).append(record)
+        for stage, seconds in (record.get("timings") or {}).items():
+            if stage != "total":
+                stage_times.setdefault(stage, []).append(seconds)
+
+    return {
+        "questions": len(records),
+        "queue": counts or {},
+        "ok": len(finished),
+        "errors": sum(1 for record in records if record.get("status") != "ok"),
+        "correct": sum(1 for record in records if record.get("match")),
+        "accuracy": accuracy(records),
+        "retried": sum(1 for record in records if record.get("attempts", 1) > 1),
+        "wall_s": wall,
+        "throughput_qps": len(records) / wall if wall else 0.0,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_p99_s": percentile(latencies, 99),
+        "workers": {
+            name: {"questions": len(group), "accuracy": accuracy(group),
+                   "busy_s": sum(record.get("timings", {}).get("total", 0.0) for record in group)}
+            for name, group in sorted(by_worker.items())
+        },
+        "difficulty": {name: {"questions": len(group), "accuracy": accuracy(group)}
+                       for name, group in sorted(by_difficulty.items())},
+        "stages": {stage: {"p50": percentile(sorted(times), 50), "p95": percentile(sorted(times), 95)}
+                   for stage, times in stage_times.items()}
+    }
+
+
+def format_report(report: dict) -> List[str]:
+    """Human-readable lines for the run log."""
+    queue = report["queue"]
+    lines = [
+        f"Questions: {report['questions']} finished"
+        + (f" ({queue.get(PENDING, 0)} pending, {queue.get(LEASED, 0)} leased)" if queue else ""),
+        f"Correct: {report['correct']}   Accuracy: {report['accuracy']:.2f}%   Errors: {report['errors']}   "
+        f"Retried: {report['retried']}",
+        f"Wall: {report['wall_s']:.1f}s   Throughput: {report['throughput_qps']:.2f} q/s   Latency p50 "
+        f"{report['latency_p50_s']:.2f}s p95 {report['latency_p95_s']:.2f}s p99 {report['latency_p99_s']:.2f}s",
+        f"{'worker':<32}{'n':>6}{'acc %':>8}{'busy s':>10}"
+    ]
+    for name, stats in report["workers"].items():
+        lines.append(f"{name:<32}{stats['questions']:>6}{stats['accuracy']:>8.1f}{stats['busy_s']:>10.1f}")
+    lines.append(f"{'difficulty':<32}{'n':>6}{'acc %':>8}")
+    for name, stats in report["difficulty"].items():
+        lines.append(f"{name:<32}{stats['questions']:>6}{stats['accuracy']:>8.1f}")
+    lines.append(f"{'stage':<32}{'p50 s':>9}{'p95 s':>9}")
+    for stage, stats in report["stages"].items():
+        lines.append(f"{stage:<32}{stats['p50']:>9.2f}{stats['p95']:>9.2f}")
+    return lines
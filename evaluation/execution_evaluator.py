@@ -0,0 +1,203 @@
+"""
+Execution-accuracy evaluation against per-database SQLite files.
+
+A prediction is correct when it returns the same multiset of rows as the gold
+query. Connections are opened read-only and pooled per database, gold results
+are executed once per run, and every query runs under a time and row budget
+enforced through SQLite's progress handler.
+"""
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_DB_ROOT = os.getenv("MINIDEV_DB_ROOT", "data_minidev/MINIDEV/dev_databases")
+SQLITE_DATASET = "data_minidev/MINIDEV/mini_dev_sqlite.json"
+
+# SQLite VM instructions between progress-handler calls
+PROGRESS_STEPS = 10000
+
+
+def database_path(db_id: str, root: str = DEFAULT_DB_ROOT) -> str:
+    """BIRD layout: <root>/<db_id>/<db_id>.sqlite"""
+    return os.path.join(root, db_id, f"{db_id}.sqlite")
+
+
+def load_execution_gold(path: str = SQLITE_DATASET) -> Dict[int, str]:
+    """SQLite gold SQL keyed by the positional question_id used by load_questions()."""
+    with open(path, "r") as f:
+        return {i: q["SQL"] for i, q in enumerate(json.load(f), 1)}
+
+
+@dataclass
+class ExecutionResult:
+    rows: Optional[Counter] = None
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class ConnectionPool:
+    """Reusable read-only connections, one queue per database file."""
+
+    def __init__(self, size: int = 4):
+        self.size = size
+        self._pools: Dict[str, queue.Queue] = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, path: str) -> queue.Queue:
+        with self._lock:
+            if path not in self._pools:
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"Database file not found: {path}")
+                pool = queue.Queue()
+                for _ in range(self.size):
+                    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+                    conn.text_factory = lambda data: data.decode("utf-8", errors="replace")
+                    pool.put(conn)
+                self._pools[path] = pool
+            return self._pools[path]
+
+    @contextmanager
+    def connection(self, path: str) -> Iterator[sqlite3.Connection]:
+        pool = self._pool(path)
+        conn = pool.get()
+        try:
+            yield conn
+        finally:
+            conn.set_progress_handler(None, 0)
+            pool.put(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            for pool in self._pools.values():
+                while not pool.empty():
+                    pool.get().close()
+            self._pools.clear()
+
+
+class ExecutionEvaluator:
+    def __init__(self, db_root: str = DEFAULT_DB_ROOT, timeout: float = 30.0, max_rows: int = 100000,
+                 pool_size: int = 4):
+        self.db_root = db_root
+        self.timeout = timeout
+        self.max_rows = max_rows
+        self.pool = ConnectionPool(pool_size)
+        self._gold_cache: Dict[Tuple[str, str], ExecutionResult] = {}
+        self._gold_lock = threading.Lock()
+
+    def has_database(self, db_id: str) -> bool:
+        return os.path.exists(database_path(db_id, self.db_root))
+
+    def execute(self, db_id: str, sql: str, timeout: Optional[float] = None) -> ExecutionResult:
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        deadline = start + timeout
+        try:
+            with self.pool.connection(database_path(db_id, self.db_root)) as conn:
+                # Returning non-zero from the handler interrupts the running statement
+                conn.set_progress_handler(lambda: int(time.perf_counter() > deadline), PROGRESS_STEPS)
+                cursor = conn.execute(sql)
+                rows = cursor.fetchmany(self.max_rows + 1)
+                cursor.close()
+            if len(rows) > self.max_rows:
+                return ExecutionResult(error=f"Row limit of {self.max_rows} exceeded",
+                                       elapsed=time.perf_counter() - start)
+            return ExecutionResult(rows=Counter(rows), elapsed=time.perf_counter() - start)
+        except sqlite3.OperationalError as e:
+            error = f"Timed out after {timeout:.1f}s" if time.perf_counter() > deadline else str(e)
+            return ExecutionResult(error=error, elapsed=time.perf_counter() - start)
+        except (sqlite3.Error, FileNotFoundError) as e:
+            return ExecutionResult(error=str(e), elapsed=time.perf_counter() - start)
+
+    def execute_gold(self, db_id: str, gold_sql: str) -> ExecutionResult:
+        key = (db_id, gold_sql)
+        with self._gold_lock:
+            cached = self._gold_cache.get(key)
+        if cached is not None:
+            return cached
+        result = self.execute(db_id, gold_sql)
+        with self._gold_lock:
+            self._gold_cache[key] = result
+        return result
+
+    def compare(self, db_id: str, gold_sql: str, predicted_sql: str) -> dict:
+        gold = self.execute_gold(db_id, gold_sql)
+        predicted = self.execute(db_id, predicted_sql) if predicted_sql else ExecutionResult(error="No prediction")
+        return {
+            "match": gold.ok and predicted.ok and gold.rows == predicted.rows,
+            "gold_error": gold.error,
+            "predicted_error": predicted.error,
+            "gold_elapsed": gold.elapsed,
+            "predicted_elapsed": predicted.elapsed
+        }
+
+
+# One evaluator per worker process, so pools and the gold cache survive across chunks
+_worker_evaluator: Optional[ExecutionEvaluator] = None
+
+def _init_worker(db_root: str, timeout: float, max_rows: int) -> None:
+    global _worker_evaluator
+    _worker_evaluator = ExecutionEvaluator(db_root, timeout, max_rows, pool_size=1)
+
+def _compare_item(item: dict) -> dict:
+    result = _worker_evaluator.compare(item["db_id"], item["gold_sql"], item.get("predicted_sql"))
+    result["question_id"] = item.get("question_id")
+    return result
+
+
+def evaluate_batch(items: List[dict], db_root: str = DEFAULT_DB_ROOT, workers: int = os.cpu_count() or 1,
+                   timeout: float = 30.0, max_rows: int = 100000) -> List[dict]:
+    """
+    Compare many predictions in a process pool.
+
+    Each item needs `db_id`, `gold_sql` and `predicted_sql`; results come back
+    in input order. Items are grouped by database so each worker's connections
+    and gold cache stay warm.
+    """
+    order = sorted(range(len(items)), key=lambda i: items[i]["db_id"])
+    chunksize = max(1, len(items) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(db_root, timeout, max_rows)) as pool:
+        sorted_results = list(pool.map(_compare_item, [items[i] for i in order], chunksize=chunksize))
+    results: List[Optional[dict]] = [None] * len(items)
+    for position, result in zip(order, sorted_results):
+        results[position] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score predictions by execution accuracy.")
+    parser.add_argument("predictions", help="JSONL file with db_id, gold_sql and predicted_sql per line")
+    parser.add_argument("--db-root", default=DEFAULT_DB_ROOT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--max-rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    with open(args.predictions, "r") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+
+    start = time.perf_counter()
+    results = evaluate_batch(items, args.db_root, args.workers, args.timeout, args.max_rows)
+    elapsed = time.perf_counter() - start
+    correct = sum(1 for result in results if result["match"])
+    gold_errors = sum(1 for result in results if result["gold_error"])
+    print(f"Execution accuracy: {correct}/{len(results)} ({correct / max(len(results), 1) * 100:.2f}%)")
+    print(f"Gold errors: {gold_errors}")
+    print(f"Scored in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Small synthetic SQLite databases generated from dev_tables.json.
+
+The real MINIDEV databases are not shipped with the repo. These databases have
+the same tables, columns and keys, filled with deterministic values, which is
+enough to exercise execution-based evaluation offline. They are written to a
+root of the caller's choosing, never over an existing database unless forced,
+so the real dev_databases are not replaced by random data by accident.
+"""
+import argparse
+import os
+import random
+import sqlite3
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+from catalog.schema_catalog import DatabaseSchema, get_schema_catalog
+from evaluation.execution_evaluator import database_path
+
+TEXT_VALUES = ["alpha", "beta", "gamma", "delta", "epsilon", "EUR", "CZK", "LAM", "SME", "KAM"]
+
+
+def _value(col_type: str, rng: random.Random):
+    if col_type == "integer":
+        return rng.randint(0, 1000)
+    if col_type == "real":
+        return round(rng.uniform(0, 1000), 2)
+    if col_type == "date":
+        return (date(2000, 1, 1) + timedelta(days=rng.randint(0, 8000))).isoformat()
+    if col_type == "datetime":
+        return (datetime(2000, 1, 1) + timedelta(seconds=rng.randint(0, 8000 * 86400))).isoformat(sep=" ")
+    return rng.choice(TEXT_VALUES)
+
+
+def build_synthetic_database(db: DatabaseSchema, path: str, rows_per_table: int = 20, seed: int = 0,
+                             force: bool = False) -> str:
+    """
+    Create `path` with the schema of `db` and `rows_per_table` rows in every table.
+
+    An existing file at `path` is only replaced with `force`; otherwise FileExistsError is raised.
+    """
+    rng = random.Random(f"{seed}:{db.db_id}")
+    if os.path.exists(path):
+        if not force:
+            raise FileExistsError(f"Refusing to overwrite existing database: {path}")
+        os.remove(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    conn = sqlite3.connect(path)
+    tables = [table for table in db.tables.values() if table.columns]
+    for table in tables:
+        conn.execute(table.ddl["sqlite"])
+
+    # Key columns get 1..n so foreign keys always point at an existing row
+    key_columns = {(fk.table.lower(), fk.column.lower()) for fk in db.foreign_keys}
+    key_columns |= {(fk.ref_table.lower(), fk.ref_column.lower()) for fk in db.foreign_keys}
+    for table in tables:
+        primary = {key.lower() for key in table.primary_keys}
+        columns = list(table.columns.values())
+        rows: List[tuple] = []
+        for row in range(rows_per_table):
+            values = []
+            for column in columns:
+                name = column.name.lower()
+                if name in primary and len(primary) == 1:
+                    values.append(row + 1)
+                elif (table.name.lower(), name) in key_columns or name in primary:
+                    values.append(rng.randint(1, rows_per_table))
+                else:
+                    values.append(_value(column.type, rng))
+            rows.append(tuple(values))
+        placeholders = ", ".join("?" for _ in columns)
+        names = ", ".join("`{}`".format(column.name) for column in columns)
+        # Composite keys may collide on random values; skip duplicates rather than fail
+        conn.executemany(f"INSERT OR IGNORE INTO `{table.name}` ({names}) VALUES ({placeholders})", rows)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def build_all(root: str, rows_per_table: int = 20, seed: int = 0, force: bool = False) -> Dict[str, str]:
+    """Build every catalog database under `root`; fails before writing anything if one exists and not `force`."""
+    catalog = get_schema_catalog()
+    paths = {db_id: database_path(db_id, root) for db_id in catalog.databases}
+    existing = [path for path in paths.values() if os.path.exists(path)]
+    if existing and not force:
+        raise FileExistsError(f"Refusing to overwrite {len(existing)} existing database(s) under {root}, "
+                              f"e.g. {existing[0]}; pass force=True to replace them")
+    return {
+        db_id: build_synthetic_database(db, paths[db_id], rows_per_table, seed, force)
+        for db_id, db in catalog.databases.items()
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic SQLite databases from dev_tables.json.")
+    parser.add_argument("--root", required=True,
+                        help="Directory to write <db_id>/<db_id>.sqlite under; not the real dev_databases")
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--force", action="store_true", help="Replace databases that already exist under --root")
+    args = parser.parse_args()
+    try:
+        built = build_all(args.root, args.rows, args.seed, args.force)
+    except FileExistsError as exc:
+        parser.exit(1, f"{exc}\n")
+    for db_id, path in built.items():
+        print(f"{db_id}: {path}")
@@ -0,0 +1,171 @@
+"""
+Per-model request scheduling in front of one model server.
+
+Agents on many worker threads call into the same Ollama host. Left alone,
+requests for gemma2:2b and sqlcoder:7b interleave and the server keeps swapping
+models in and out of memory. The dispatcher queues requests per model, keeps
+granting requests for the models already loaded (up to a per-model in-flight
+cap), and only switches once a loaded model's queue is empty or it has had a
+full batch while others wait.
+Within a model, lower priority numbers go first, so validation and fallback
+calls for nearly-finished questions overtake new analyses, and the same order
+decides which waiting model is loaded next.
+"""
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from llm_config import get_dispatch_config
+
+# Lower runs first
+PRIORITY_FALLBACK = 0
+PRIORITY_VALIDATION = 1
+PRIORITY_GENERATION = 2
+PRIORITY_ANALYSIS = 3
+PRIORITY_DEFAULT = 5
+
+
+class _Ticket:
+    __slots__ = ("priority", "seq", "model", "granted", "enqueued")
+
+    def __init__(self, priority: int, seq: int, model: str):
+        self.priority = priority
+        self.seq = seq
+        self.model = model
+        self.granted = False
+        self.enqueued = time.perf_counter()
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMDispatcher:
+    def __init__(self, max_in_flight_per_model: int = 4, max_loaded_models: int = 1, switch_batch: int = 16):
+        self.max_in_flight_per_model = max_in_flight_per_model
+        self.max_loaded_models = max_loaded_models
+        # Requests granted to a loaded model before others waiting get a turn
+        self.switch_batch = switch_batch
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting: Dict[str, List[_Ticket]] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._loaded: List[str] = []
+        self._batch: Dict[str, int] = {}
+        # Metrics
+        self.model_switches = 0
+        self.model_loads = 0
+        self.granted = 0
+        self.max_queue_depth: Dict[str, int] = {}
+        self.total_wait: Dict[str, float] = {}
+
+    def run(self, model: str, fn: Callable[[], Any], priority: int = PRIORITY_DEFAULT) -> Any:
+        """Block until `model` may be called, then run `fn` and return its result."""
+        ticket = _Ticket(priority, next(self._seq), model)
+        with self._cond:
+            queue = self._waiting.setdefault(model, [])
+            heapq.heappush(queue, ticket)
+            self.max_queue_depth[model] = max(self.max_queue_depth.get(model, 0), len(queue))
+            self._grant()
+            while not ticket.granted:
+                self._cond.wait()
+            self.total_wait[model] = self.total_wait.get(model, 0.0) + time.perf_counter() - ticket.enqueued
+        try:
+            return fn()
+        finally:
+            with self._cond:
+                self._in_flight[model] -= 1
+                self._grant()
+
+    def _head(self, model: str) -> Optional[_Ticket]:
+        queue = self._waiting.get(model)
+        return queue[0] if queue else None
+
+    def _grant(self) -> None:
+        """Hand out as many tickets as the policy allows. Caller holds the lock."""
+        granted_any = False
+        while True:
+            model = self._pick_model()
+            if model is None:
+                break
+            ticket = heapq.heappop(self._waiting[model])
+            ticket.granted = True
+            self._in_flight[model] = self._in_flight.get(model, 0) + 1
+            self._batch[model] = self._batch.get(model, 0) + 1
+            self.granted += 1
+            granted_any = True
+        if granted_any:
+            self._cond.notify_all()
+
+    def _pick_model(self) -> Optional[str]:
+        outside = [model for model in self._waiting if self._waiting[model] and model not in self._loaded]
+        best_outside = min((self._head(model) for model in outside), default=None)
+
+        candidates = []
+        for model in self._loaded:
+            head = self._head(model)
+            if head is None or self._in_flight.get(model, 0) >= self.max_in_flight_per_model:
+                continue
+            if best_outside is not None and self._batch.get(model, 0) >= self.switch_batch:
+                continue  # Had its turn; let it drain so the waiting model gets loaded
+            candidates.append(head)
+        if candidates:
+            return min(candidates).model
+
+        if best_outside is None:
+            return None
+        if len(self._loaded) < self.max_loaded_models:
+            self._load(best_outside.model)
+            return best_outside.model
+
+        # Swap out a loaded model once nothing is running on it
+        for model in self._loaded:
+            if self._in_flight.get(model, 0) == 0:
+                head = self._head(model)
+                if head is None or self._batch.get(model, 0) >= self.switch_batch:
+                    self._loaded.remove(model)
+                    self._load(best_outside.model)
+                    return best_outside.model
+        return None
+
+    def _load(self, model: str) -> None:
+        if self.model_loads > 0:
+            self.model_switches += 1
+        self.model_loads += 1
+        self._loaded.append(model)
+        self._batch[model] = 0
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queue_depth": {model: len(queue) for model, queue in self._waiting.items()},
+                "max_queue_depth": dict(self.max_queue_depth),
+                "in_flight": dict(self._in_flight),
+                "loaded_models": list(self._loaded),
+                "model_switches": self.model_switches,
+                "granted": self.granted,
+                "total_wait_s": dict(self.total_wait)
+            }
+
+
+_dispatchers: Dict[str, LLMDispatcher] = {}
+_dispatchers_lock = threading.Lock()
+
+def get_dispatcher(base_url: str) -> Optional[LLMDispatcher]:
+    """The shared dispatcher for one model server, or None when dispatching is disabled."""
+    config = get_dispatch_config()
+    if not config["enabled"]:
+        return None
+    with _dispatchers_lock:
+        if base_url not in _dispatchers:
+            _dispatchers[base_url] = LLMDispatcher(
+                config["max_in_flight_per_model"],
+                config["max_loaded_models"],
+                config["switch_batch"]
+            )
+        return _dispatchers[base_url]
+
+def all_dispatchers() -> Dict[str, LLMDispatcher]:
+    with _dispatchers_lock:
+        return dict(_dispatchers)
@@ -0,0 +1,195 @@
+"""
+A local stand-in for the Ollama HTTP API, for tests and offline benchmarks.
+
+It serves /api/chat (streaming and non-streaming) on a background thread. Replies
+come from a `responder(model, messages)` callable and latency from a per-model
+number or callable. Like Ollama with one loaded model, it runs up to `parallel`
+requests for the loaded model at once; a request for another model waits until
+those finish and then pays `swap_delay` seconds to load it (counted in `swaps`).
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Union
+
+Latency = Union[float, Callable[[str], float]]
+# A CREATE TABLE statement or a compact "table(column type, ...)" line
+_TABLE = re.compile(r"CREATE TABLE [`\"]?([^`\"\s(]+)|^(?:[`\"]([^`\"\n]+)[`\"]|([A-Za-z_]\w*))\(", re.MULTILINE)
+
+
+def reply_kind(messages: List[Dict[str, str]]) -> str:
+    """Which agent a request comes from, going by its system prompt: "validation", "analysis" or "sql"."""
+    system = messages[0]["content"].lower() if messages and messages[0]["role"] == "system" else ""
+    if "validator" in system:
+        return "validation"
+    if "analy" in system or "database administrator" in system:
+        return "analysis"
+    return "sql"
+
+
+def first_table(messages: List[Dict[str, str]]) -> str:
+    """The first table in the schema of the last message, or "unknown"."""
+    match = _TABLE.search(messages[-1]["content"] if messages else "")
+    return next(name for name in match.groups() if name) if match else "unknown"
+
+
+def default_responder(model: str, messages: List[Dict[str, str]]) -> str:
+    """Well-formed canned replies for each pipeline agent, keyed off the system prompt."""
+    kind = reply_kind(messages)
+    if kind == "validation":
+        return '```json\n{"is_valid": true, "optimizations": [], "suggestions": [], "final_query": ""}\n```'
+    if kind == "analysis":
+        # Select the first table of the schema in the prompt
+        return '```json\n{"%s": "keep_all"}\n```' % first_table(messages)
+    return "SELECT 1;\n```\nThis query selects a constant."
+
+
+class FakeOllamaServer:
+    def __init__(self, responder: Callable[[str, List[Dict[str, str]]], str] = default_responder,
+                 latency: Union[Latency, Dict[str, Latency]] = 0.0, swap_delay: float = 0.0,
+                 chunk_size: int = 8, chunk_delay: float = 0.0, parallel: int = 4,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.responder = responder
+        self.latency = latency
+        self.swap_delay = swap_delay
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.parallel = parallel
+        self.requests: Dict[str, int] = {}
+        self.swaps = 0
+        self.cancelled_streams = 0
+        self.max_concurrency = 0
+        self._active = 0
+        self._loaded: Optional[str] = None
+        self._lock = threading.Condition()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _latency_for(self, model: str) -> float:
+        latency = self.latency.get(model, 0.0) if isinstance(self.latency, dict) else self.latency
+        return latency(model) if callable(latency) else latency
+
+    def _begin(self, model: str) -> float:
+        """Wait for a slot on `model` and return the delay the request should incur."""
+        with self._lock:
+            self.requests[model] = self.requests.get(model, 0) + 1
+            while not (self._active == 0 or (self._loaded == model and self._active < self.parallel)):
+                self._lock.wait()
+            self._active += 1
+            self.max_concurrency = max(self.max_concurrency, self._active)
+            delay = self._latency_for(model)
+            if self._loaded != model:
+                if self._loaded is not None:
+                    self.swaps += 1
+                    delay += self.swap_delay
+                self._loaded = model
+        return delay
+
+    def _end(self) -> None:
+        with self._lock:
+            self._active -= 1
+            self._lock.notify_all()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionResetError:
+                    # The client closed a kept-alive connection, e.g. after stopping a stream early
+                    pass
+
+            def _send_json(self, status: int, payload: dict) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _write_chunk(self, payload: dict) -> None:
+                line = (json.dumps(payload) + "\n").encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json(200, {"models": [{"name": name} for name in server.requests]})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                if self.path != "/api/chat":
+                    self._send_json(404, {"error": "not found"})
+                    return
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                model = request.get("model", "")
+                messages = request.get("messages", [])
+                delay = server._begin(model)
+                try:
+                    time.sleep(delay)
+                    content = server.responder(model, messages)
+                    prompt_tokens = sum(len(m.get("content", "").split()) for m in messages)
+                    completion_tokens = len(content.split())
+                    if not request.get("stream", True):
+                        self._send_json(200, {
+                            "model": model,
+                            "message": {"role": "assistant", "content": content},
+                            "done": True,
+                            "prompt_eval_count": prompt_tokens,
+                            "eval_count": completion_tokens
+                        })
+                        return
+
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    try:
+                        for i in range(0, len(content), server.chunk_size):
+                            if server.chunk_delay:
+                                time.sleep(server.chunk_delay)
+                            self._write_chunk({"model": model, "done": False,
+                                               "message": {"role": "assistant", "content": content[i:i + server.chunk_size]}})
+                        self._write_chunk({"model": model, "done": True, "message": {"role": "assistant", "content": ""},
+                                           "prompt_eval_count": prompt_tokens, "eval_count": completion_tokens})
+                        self.wfile.write(b"0\r\n\r\n")
+                    except (BrokenPipeError, ConnectionResetError):
+                        with server._lock:
+                            server.cancelled_streams += 1
+                        self.close_connection = True
+                finally:
+                    server._end()
+
+        return Handler
@@ -0,0 +1,185 @@
+"""
+Minimal Ollama chat client with keep-alive connection pooling.
+
+One client per base URL is shared by every agent in the process, so repeated
+calls reuse open HTTP connections instead of reconnecting for each request.
+"""
+import http.client
+import json
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from llm.tokens import get_token_counter
+
+
+class OllamaClient:
+    def __init__(self, base_url: str, max_connections: int = 8, timeout: float = 120):
+        parsed = urlparse(base_url)
+        self.base_url = base_url
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.https = parsed.scheme == "https"
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._idle: queue.LifoQueue = queue.LifoQueue(maxsize=max_connections)
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self.connections_opened = 0
+        self.requests_sent = 0
+
+    def _new_connection(self, timeout: float) -> http.client.HTTPConnection:
+        self.connections_opened += 1
+        connection_cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return connection_cls(self.host, self.port, timeout=timeout)
+
+    def _acquire(self, timeout: float) -> http.client.HTTPConnection:
+        try:
+            conn = self._idle.get_nowait()
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn
+        except queue.Empty:
+            return self._new_connection(timeout)
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def post(self, path: str, payload: dict, timeout: Optional[float] = None) -> dict:
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        timeout = timeout or self.timeout
+        with self._slots:
+            # A pooled connection may have been closed by the server; retry once on a fresh one
+            for attempt in range(2):
+                conn = self._acquire(timeout) if attempt == 0 else self._new_connection(timeout)
+                try:
+                    conn.request("POST", path, body=body, headers=headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                        BrokenPipeError, ConnectionResetError):
+                    conn.close()
+                    if attempt == 1:
+                        raise
+                    continue
+                except Exception:
+                    conn.close()
+                    raise
+                self.requests_sent += 1
+                if response.will_close:
+                    conn.close()
+                else:
+                    self._release(conn)
+                if response.status >= 400:
+                    raise RuntimeError(f"Ollama request to {path} failed ({response.status}): {data[:500]!r}")
+                return json.loads(data)
+
+    def chat(self, model: str, messages: List[Dict[str, str]], options: Optional[dict] = None,
+             timeout: Optional[float] = None, **extra) -> dict:
+        """POST /api/chat without streaming and return the decoded response."""
+        payload = {"model": model, "messages": messages, "stream": False}
+        if options:
+            payload["options"] = options
+        payload.update(extra)
+        return self.post("/api/chat", payload, timeout)
+
+    def chat_stream(self, model: str, messages: List[Dict[str, str]], options: Optional[dict] = None,
+                    timeout: Optional[float] = None, stop_when: Optional[Callable[[str], bool]] = None,
+                    **extra) -> dict:
+        """
+        POST /api/chat with streaming and return the accumulated reply.
+
+        `stop_when` is called with each new text chunk; once it returns True the
+        connection is dropped, which makes Ollama stop generating. The result
+        has the reply `message`, token counts (both estimated from the text
+        when the stream was stopped early, flagged by `prompt_eval_count_estimated`
+        and `eval_count_estimated`), and `time_to_first_token`, `elapsed` and
+        `stopped_early`.
+        """
+        payload = {"model": model, "messages": messages, "stream": True}
+        if options:
+            payload["options"] = options
+        payload.update(extra)
+        body = json.dumps(payload).encode("utf-8")
+        timeout = timeout or self.timeout
+
+        with self._slots:
+            start = time.perf_counter()
+            conn = self._acquire(timeout)
+            try:
+                conn.request("POST", "/api/chat", body=body,
+                             headers={"Content-Type": "application/json", "Connection": "keep-alive"})
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    BrokenPipeError, ConnectionResetError):
+                conn.close()
+                conn = self._new_connection(timeout)
+                conn.request("POST", "/api/chat", body=body,
+                             headers={"Content-Type": "application/json", "Connection": "keep-alive"})
+                response = conn.getresponse()
+            self.requests_sent += 1
+            if response.status >= 400:
+                data = response.read()
+                conn.close()
+                raise RuntimeError(f"Ollama streaming request failed ({response.status}): {data[:500]!r}")
+
+            parts: List[str] = []
+            result = {"time_to_first_token": None, "stopped_early": False}
+            try:
+                for line in response:
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    chunk = event.get("message", {}).get("content", "")
+                    if chunk:
+                        if result["time_to_first_token"] is None:
+                            result["time_to_first_token"] = time.perf_counter() - start
+                        parts.append(chunk)
+                        if stop_when is not None and stop_when(chunk):
+                            result["stopped_early"] = True
+                            break
+                    if event.get("done"):
+                        result["prompt_eval_count"] = event.get("prompt_eval_count", 0)
+                        result["eval_count"] = event.get("eval_count", 0)
+                        break
+            except Exception:
+                conn.close()
+                raise
+
+            if result["stopped_early"] or response.will_close:
+                # Unread body left on the socket; closing it also cancels generation
+                conn.close()
+            else:
+                response.read()
+                self._release(conn)
+            result["elapsed"] = time.perf_counter() - start
+            result["message"] = {"role": "assistant", "content": "".join(parts)}
+            if result["stopped_early"]:
+                # The server's counts never arrived; estimate both from the text so totals stay in one unit
+                counter = get_token_counter()
+                result["prompt_eval_count"] = counter.count(model, "".join(m.get("content", "") for m in messages))
+                result["prompt_eval_count_estimated"] = True
+                result["eval_count"] = counter.count(model, result["message"]["content"])
+                result["eval_count_estimated"] = True
+            return result
+
+    def close(self) -> None:
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+_clients: Dict[str, OllamaClient] = {}
+_clients_lock = threading.Lock()
+
+def get_ollama_client(base_url: str) -> OllamaClient:
+    """Return the shared client for `base_url`, creating it on first use."""
+    with _clients_lock:
+        if base_url not in _clients:
+            _clients[base_url] = OllamaClient(base_url)
+        return _clients[base_url]
@@ -0,0 +1,319 @@
+"""
+Shared parsing of model replies: fenced blocks, tolerant JSON and SQL.
+
+Every agent used to run its own chain of `re.search` calls and hand whatever
+came out to `json.loads`. This module scans a reply once for fenced blocks
+(``` or ''' fences, with or without a language tag), takes the first balanced
+JSON object from the best candidate, and repairs the usual small-model slips
+(trailing commas, single-quoted strings, Python literals, comments) before
+giving up. Results are typed so callers do not re-check shapes.
+"""
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
+
+from llm.streaming import SQLStreamExtractor
+
+_FENCE = re.compile(r"(```|''')[ \t]*([A-Za-z]*)[ \t]*(?:\r?\n)?")
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_BARE_WORD = re.compile(r"[A-Za-z_]+")
+_OPENING = re.compile(r"[{\[]")
+_DECODER = json.JSONDecoder()
+_SQL_START = re.compile(r"\b(SELECT|WITH)\b", re.IGNORECASE)
+_SQL_LANGS = {"sql", "mysql", "postgresql", "postgres", "sqlite"}
+
+
+@dataclass
+class FencedBlock:
+    lang: str
+    body: str
+    start: int
+    end: int
+
+
+@dataclass
+class JSONParse:
+    value: Any = None
+    ok: bool = False
+    source: str = ""  # "fence", "text" or "" when nothing parsed
+    repairs: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+class StructuredOutputError(ValueError):
+    """
+    A reply that is not the expected JSON shape.
+
+    `fragment` is the part that needs fixing, small enough to send back on its
+    own; `partial` is whatever usable part did parse, to be merged with the
+    fixed fragment.
+    """
+
+    def __init__(self, message: str, fragment: str, partial: Any = None):
+        super().__init__(message)
+        self.fragment = fragment
+        self.partial = partial
+
+
+ANALYSIS_MARKERS = ("keep_all", "drop_all")
+
+
+@dataclass
+class TableAnalysis:
+    """The analyzer's table -> ranked columns (or "keep_all"/"drop_all") selection."""
+    tables: Dict[str, Union[str, List[str]]] = field(default_factory=dict)
+    # Table names the model invented; dropped rather than sent back for repair
+    unknown: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_value(cls, value: Any, known_tables: Optional[List[str]] = None) -> "TableAnalysis":
+        if isinstance(value, dict) and len(value) == 1 and isinstance(value.get("tables"), dict):
+            value = value["tables"]
+        if not isinstance(value, dict):
+            raise StructuredOutputError("Analysis must be a JSON object of table -> columns",
+                                        json.dumps(value, ensure_ascii=False))
+        canonical = {name.lower(): name for name in known_tables} if known_tables else None
+
+        analysis = cls()
+        invalid = {}
+        for table, columns in value.items():
+            name = str(table)
+            if canonical is not None:
+                if name.lower() not in canonical:
+                    analysis.unknown.append(name)
+                    continue
+                name = canonical[name.lower()]
+            if isinstance(columns, str):
+                analysis.tables[name] = columns if columns in ANALYSIS_MARKERS else [columns]
+            elif isinstance(columns, list) and all(isinstance(column, str) for column in columns):
+                analysis.tables[name] = columns
+            else:
+                invalid[table] = columns
+
+        if invalid:
+            raise StructuredOutputError(
+                f"Tables {sorted(invalid)} must map to a list of column names, \"keep_all\" or \"drop_all\"",
+                json.dumps(invalid, ensure_ascii=False), analysis if analysis.tables else None
+            )
+        if not analysis.tables:
+            message = "No tables from the schema were selected"
+            if analysis.unknown:
+                message += f"; these are not in the schema: {analysis.unknown}"
+            raise StructuredOutputError(message, json.dumps(value, ensure_ascii=False))
+        return analysis
+
+    def merge(self, other: "TableAnalysis") -> "TableAnalysis":
+        return TableAnalysis({**self.tables, **other.tables}, self.unknown + other.unknown)
+
+    def as_dict(self) -> dict:
+        return dict(self.tables)
+
+
+@dataclass
+class ValidationVerdict:
+    is_valid: bool
+    final_query: Optional[str] = None
+    suggestions: List[str] = field(default_factory=list)
+    optimizations: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_value(cls, value: Any) -> "ValidationVerdict":
+        if not isinstance(value, dict) or "is_valid" not in value:
+            raise StructuredOutputError("Validation reply has no 'is_valid' field",
+                                        json.dumps(value, ensure_ascii=False))
+        is_valid = value["is_valid"]
+        if isinstance(is_valid, str):
+            is_valid = is_valid.strip().lower() in ("true", "yes", "valid")
+        final_query = value.get("final_query")
+        if not isinstance(final_query, str) or final_query.strip() in ("", "...", "SELECT ..."):
+            final_query = None
+        return cls(bool(is_valid), final_query, _string_list(value.get("suggestions")),
+                   _string_list(value.get("optimizations")))
+
+    def as_dict(self) -> dict:
+        return {
+            "is_valid": self.is_valid,
+            "final_query": self.final_query,
+            "suggestions": self.suggestions,
+            "optimizations": self.optimizations
+        }
+
+
+def _string_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value]
+    return [str(value)]
+
+
+def fenced_blocks(text: str) -> List[FencedBlock]:
+    """All fenced blocks in one pass; an unclosed final fence runs to the end of the text."""
+    blocks = []
+    opener = None
+    for match in _FENCE.finditer(text):
+        if opener is None:
+            opener = match
+        elif match.group(1) == opener.group(1):
+            blocks.append(FencedBlock(opener.group(2).lower(), text[opener.end():match.start()],
+                                      opener.start(), match.end()))
+            opener = None
+    if opener is not None:
+        blocks.append(FencedBlock(opener.group(2).lower(), text[opener.end():], opener.start(), len(text)))
+    return blocks
+
+
+def _balanced_object(text: str, start: int) -> Optional[str]:
+    """The balanced {...} or [...] opening at `start`, ignoring brackets inside string literals."""
+    depth = 0
+    quote = None
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def _repair(text: str, repairs: List[str]) -> str:
+    """Rewrite JSON-ish text outside of strings: quotes, Python literals, comments, trailing commas."""
+    out = []
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch == '"':
+            end = i + 1
+            while end < n and text[end] != '"':
+                end += 2 if text[end] == "\\" else 1
+            out.append(text[i:end + 1])
+            i = end + 1
+        elif ch == "'":
+            end = i + 1
+            chars = []
+            while end < n and text[end] != "'":
+                if text[end] == "\\" and end + 1 < n:
+                    chars.append(text[end + 1] if text[end + 1] == "'" else text[end:end + 2])
+                    end += 2
+                    continue
+                chars.append('\\"' if text[end] == '"' else text[end])
+                end += 1
+            out.append('"' + "".join(chars) + '"')
+            repairs.append("single_quotes")
+            i = end + 1
+        elif ch == "/" and text.startswith("//", i) or ch == "#":
+            newline = text.find("\n", i)
+            i = n if newline < 0 else newline
+            repairs.append("comments")
+        elif ch.isalpha() or ch == "_":
+            word = _BARE_WORD.match(text, i).group(0)
+            if word in _PY_LITERALS:
+                out.append(_PY_LITERALS[word])
+                repairs.append("python_literals")
+            else:
+                out.append(word)
+            i += len(word)
+        else:
+            out.append(ch)
+            i += 1
+    repaired = "".join(out)
+    stripped = _TRAILING_COMMA.sub(r"\1", repaired)
+    if stripped != repaired:
+        repairs.append("trailing_commas")
+    return stripped
+
+
+def _load(candidate: str, source: str) -> JSONParse:
+    repairs: List[str] = []
+    try:
+        value = json.loads(_repair(candidate, repairs))
+    except ValueError as e:
+        return JSONParse(error=str(e))
+    return JSONParse(value, True, source, sorted(set(repairs)))
+
+
+def parse_json(text: str) -> JSONParse:
+    """Find and decode the JSON object in a reply, preferring fenced json (or untagged) blocks."""
+    text = text or ""
+    candidates = [(block.body, "fence") for block in fenced_blocks(text) if block.lang in ("json", "")]
+    candidates.append((text, "text"))
+    error = "No JSON object found"
+    for body, source in candidates:
+        opening = _OPENING.search(body)
+        if opening is None:
+            continue
+        try:
+            # Fast path: well-formed JSON, decoded in C with any trailing prose ignored
+            return JSONParse(_DECODER.raw_decode(body, opening.start())[0], True, source)
+        except ValueError:
+            pass
+        obj = _balanced_object(body, opening.start())
+        if obj is None:
+            continue
+        result = _load(obj, source)
+        if result.ok:
+            return result
+        error = result.error
+    return JSONParse(error=error)
+
+
+def _fragment(text: str) -> str:
+    """The JSON-looking part of an unparseable reply, for sending back to be fixed."""
+    blocks = [block.body for block in fenced_blocks(text) if block.lang in ("json", "")]
+    for body in blocks + [text]:
+        opening = _OPENING.search(body)
+        if opening is not None:
+            return body[opening.start():].strip()[:4000]
+    return text.strip()[:4000]
+
+
+def parse_json_object(text: str) -> dict:
+    """`parse_json` for callers that need a dict; raises StructuredOutputError otherwise."""
+    result = parse_json(text)
+    if not result.ok:
+        raise StructuredOutputError(f"Could not parse JSON from model reply: {result.error}", _fragment(text or ""))
+    if not isinstance(result.value, dict):
+        raise StructuredOutputError(f"Expected a JSON object, got {type(result.value).__name__}",
+                                    json.dumps(result.value, ensure_ascii=False))
+    return result.value
+
+
+def parse_validation(text: str) -> ValidationVerdict:
+    return ValidationVerdict.from_value(parse_json_object(text))
+
+
+def parse_analysis(text: str, known_tables: Optional[List[str]] = None) -> TableAnalysis:
+    """Parse the analyzer's reply; with `known_tables`, invented table names are dropped."""
+    result = parse_json(text)
+    if not result.ok:
+        raise StructuredOutputError(f"Could not parse JSON from model reply: {result.error}", _fragment(text or ""))
+    return TableAnalysis.from_value(result.value, known_tables)
+
+
+def extract_sql(text: str) -> Optional[str]:
+    """The SQL statement in a reply: a sql-tagged block, then an untagged one, then bare SELECT/WITH text."""
+    text = text or ""
+    blocks = fenced_blocks(text)
+    for wanted in (lambda lang: lang in _SQL_LANGS, lambda lang: lang == ""):
+        for block in blocks:
+            body = block.body.strip()
+            if wanted(block.lang) and body and _SQL_START.search(body):
+                return body
+    extractor = SQLStreamExtractor()
+    extractor.feed(text)
+    return extractor.finish()
@@ -0,0 +1,139 @@
+"""
+Prompts built from prioritized sections and fitted to a per-model token budget.
+
+A prompt is a list of sections joined in order. When the estimate goes over
+budget, the least important section that can still give way is replaced by
+its next shorter alternative, or dropped if it is optional, until the prompt
+fits or nothing more can go. Prefill time on local inference grows with prompt
+length, so every token left out is latency saved.
+"""
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from catalog.compact_schema import COMPACT_LEGEND, schema_renderings
+from llm_config import get_prompt_config
+
+
+@dataclass
+class PromptSection:
+    text: str
+    name: str = ""
+    # Higher gives way first; ties go to the later section
+    priority: int = 0
+    alternatives: List[str] = field(default_factory=list)  # shorter versions, longest first
+    optional: bool = False  # may be dropped once its alternatives are used up
+
+    def options(self) -> List[str]:
+        return [self.text] + self.alternatives + ([""] if self.optional else [])
+
+
+@dataclass
+class FittedPrompt:
+    text: str
+    tokens: int
+    budget: int
+    trimmed: List[str] = field(default_factory=list)  # "<section>:<option index>" or "<section>:dropped"
+
+    @property
+    def over_budget(self) -> bool:
+        return self.tokens > self.budget
+
+
+def fit_prompt(sections: List[PromptSection], budget: int, count: Callable[[str], int]) -> FittedPrompt:
+    """Join `sections`, stepping the least important ones down until `budget` tokens are met."""
+    options = [section.options() for section in sections]
+    sizes = [[None] * len(opts) for opts in options]
+
+    def size(i: int, j: int) -> int:
+        if sizes[i][j] is None:
+            sizes[i][j] = count(options[i][j])
+        return sizes[i][j]
+
+    chosen = [0] * len(sections)
+    total = sum(size(i, 0) for i in range(len(sections)))
+    while total > budget:
+        shrinkable = [i for i in range(len(sections)) if chosen[i] < len(options[i]) - 1]
+        if not shrinkable:
+            break
+        i = max(shrinkable, key=lambda k: (sections[k].priority, k))
+        total -= size(i, chosen[i])
+        chosen[i] += 1
+        total += size(i, chosen[i])
+
+    trimmed = []
+    for i, section in enumerate(sections):
+        if chosen[i]:
+            dropped = options[i][chosen[i]] == "" and section.optional
+            trimmed.append(f"{section.name or i}:{'dropped' if dropped else chosen[i]}")
+    text = "".join(options[i][chosen[i]] for i in range(len(sections)))
+    return FittedPrompt(text, total, budget, trimmed)
+
+
+def prompt_budget(model: str, system_tokens: int = 0) -> int:
+    """Tokens left for the user prompt of `model` after its system message and the reply."""
+    config = get_prompt_config()
+    window = config["context_windows"].get(model) or config["context_window"]
+    budget = window - config["reply_reserve"]
+    if config["token_budget"]:
+        budget = min(budget, config["token_budget"])
+    return max(0, budget - system_tokens)
+
+
+def schema_section(state: dict, prefix: str = "", suffix: str = "", priority: int = 1,
+                   use_analysis: bool = True) -> PromptSection:
+    """
+    The question's schema as a section, with shorter renderings to fall back on.
+
+    Compact renderings come from the linked tables in `state`, limited to the
+    linker's columns (and, with `use_analysis`, the analyzer's) plus keys.
+    """
+    db_id, tables = state.get("db_id"), state.get("schema_tables")
+    if not db_id or not tables:
+        return PromptSection(f"{prefix}{state.get('schema', '')}{suffix}", "schema", priority)
+    renderings = schema_renderings(
+        db_id, tables, state.get("analysis") if use_analysis else None, state.get("schema_columns"),
+        state.get("generation_dialect") or state.get("dialect"), state.get("schema"),
+        get_prompt_config()["compact_schema"]
+    )
+    wrapped = [f"{prefix}{text}{suffix}" if text == state.get("schema") else f"{prefix}{COMPACT_LEGEND}\n{text}{suffix}"
+               for text in renderings]
+    return PromptSection(wrapped[0], "schema", priority, wrapped[1:])
+
+
+def examples_section(state: dict, prefix: str = "", suffix: str = "\n\n", priority: int = 3) -> PromptSection:
+    """
+    The question's retrieved examples as an optional section.
+
+    Under budget pressure the least similar examples go first, then the rest.
+    """
+    examples = state.get("examples") or []
+    if not examples:
+        return PromptSection("", "examples", priority)
+
+    def render(example: dict) -> str:
+        evidence = f"Evidence: {example['evidence']}\n" if example.get("evidence") else ""
+        return f"Question: {example['question']}\n{evidence}SQL: {example['sql']}"
+
+    wrapped = [prefix + "\n\n".join(render(example) for example in examples[:n]) + suffix
+               for n in range(len(examples), 0, -1)]
+    return PromptSection(wrapped[0], "examples", priority, wrapped[1:], optional=True)
+
+
+def values_section(state: dict, prefix: str = "", suffix: str = "\n\n", priority: int = 2) -> PromptSection:
+    """
+    Stored database values the question mentions, as an optional section.
+
+    Each line names the column and the value as spelled in the data; under
+    budget pressure the weakest matches go first.
+    """
+    values = state.get("values") or []
+    if not values:
+        return PromptSection("", "values", priority)
+
+    def render(match: dict) -> str:
+        stored = match["value"].replace("'", "''")
+        return f"{match['table']}.{match['column']} = '{stored}' (for \"{match['span']}\")"
+
+    wrapped = [prefix + "\n".join(render(match) for match in values[:n]) + suffix
+               for n in range(len(values), 0, -1)]
+    return PromptSection(wrapped[0], "values", priority, wrapped[1:], optional=True)
@@ -0,0 +1,105 @@
+"""
+Incremental SQL extraction from a streamed model response.
+
+The extractor is fed text chunks as they arrive and reports when a complete SQL
+statement has been seen (a closing code fence or a terminating semicolon
+outside string literals and comments), so the request can be cancelled instead
+of waiting for the model's trailing explanation.
+
+A statement starts after an opening code fence, or at an upper-case SELECT or
+WITH that begins a line; lower-case "with" or "select" in the prose before a
+fence is not taken for SQL.
+"""
+import re
+from typing import Optional
+
+_FENCE_OPEN = re.compile(r"```[ \t]*(sql|SQL|mysql|postgresql|sqlite)?[ \t]*\r?\n")
+_KEYWORD = re.compile(r"^[ \t]*(SELECT|WITH)(?=[\s(])", re.MULTILINE)
+
+
+class SQLStreamExtractor:
+    def __init__(self):
+        self.text = ""
+        self.sql: Optional[str] = None
+        self._start: Optional[int] = None
+        self._pos = 0
+        self._quote: Optional[str] = None
+        self._fenced = False
+
+    @property
+    def done(self) -> bool:
+        return self.sql is not None
+
+    def feed(self, chunk: str) -> bool:
+        """Add a chunk of model output; return True once the SQL statement is complete."""
+        if self.done:
+            return True
+        self.text += chunk
+        if self._start is None:
+            fence = _FENCE_OPEN.search(self.text)
+            keyword = _KEYWORD.search(self.text)
+            if fence and (not keyword or fence.start() < keyword.start()):
+                self._start = fence.end()
+                self._fenced = True
+            elif keyword:
+                self._start = keyword.start(1)
+                self._fenced = False
+            else:
+                return False
+            self._pos = self._start
+        return self._scan()
+
+    def _scan(self) -> bool:
+        text = self.text
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._quote:
+                if ch == self._quote:
+                    self._quote = None
+            elif ch in ("'", '"'):
+                self._quote = ch
+            elif ch == "-" and text.startswith("--", i):
+                newline = text.find("\n", i)
+                if newline == -1:
+                    break  # Comment still streaming; resume here next time
+                i = newline
+            elif ch == "`":
+                if len(text) - i < 3:
+                    break  # Could be the start of a closing fence
+                if text.startswith("```", i):
+                    if not self._fenced:
+                        if text.find("\n", i) == -1:
+                            break  # Wait for the whole fence line
+                        fence = _FENCE_OPEN.match(text, i)
+                        if fence and fence.group(1):
+                            # A tagged block after the keyword: the keyword was prose, the block is the SQL
+                            self._start = i = fence.end()
+                            self._fenced = True
+                            self._quote = None
+                            continue
+                    return self._finish(i)
+            elif ch == ";":
+                return self._finish(i)
+            i += 1
+        self._pos = i
+        return False
+
+    def _finish(self, end: int) -> bool:
+        self.sql = self.text[self._start:end].strip()
+        if not self.sql:
+            # An empty fence or a stray ';'; look for a real statement after it
+            self.sql = None
+            skip = 3 if self.text.startswith("```", end) else 1
+            self.text = self.text[end + skip:]
+            self._start = None
+            self._pos = 0
+            return self.feed("")
+        return True
+
+    def finish(self) -> Optional[str]:
+        """Call when the stream has ended: accept an unterminated statement if one started."""
+        if self.sql is None and self._start is not None and not self._quote:
+            remainder = self.text[self._start:].strip().rstrip("`").strip()
+            self.sql = remainder or None
+        return self.sql
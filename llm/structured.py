@@ -0,0 +1,49 @@
+"""
+JSON schemas for Ollama's `format` option and prompts for repairing bad replies.
+
+With a schema in `format`, Ollama constrains decoding to that shape, so the
+analyzer can only name tables and columns that exist in the linked schema and
+the validator always returns a well-formed verdict.
+"""
+from typing import Dict, List
+
+from llm.parsing import ANALYSIS_MARKERS, StructuredOutputError
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+VALIDATION_FORMAT = {
+    "type": "object",
+    "properties": {
+        "is_valid": {"type": "boolean"},
+        "optimizations": _STRING_LIST,
+        "suggestions": _STRING_LIST,
+        "final_query": {"type": "string"}
+    },
+    "required": ["is_valid", "suggestions", "final_query"]
+}
+
+
+def analysis_format(tables: Dict[str, List[str]]) -> dict:
+    """Schema for the analyzer's reply: known table names mapping to their own columns or a marker."""
+    marker = {"type": "string", "enum": list(ANALYSIS_MARKERS)}
+    if not tables:
+        return {"type": "object", "additionalProperties": {"anyOf": [_STRING_LIST, marker]}}
+    return {
+        "type": "object",
+        "properties": {
+            table: {"anyOf": [{"type": "array", "items": {"type": "string", "enum": columns}}, marker]}
+            for table, columns in tables.items()
+        },
+        "additionalProperties": False
+    }
+
+
+def repair_prompt(error: StructuredOutputError) -> str:
+    """A short follow-up that sends back only the fragment that failed, not the original prompt."""
+    return f"""This JSON from your previous answer is invalid: {error}
+
+```json
+{error.fragment}
+```
+
+Reply with only the corrected JSON for this fragment, in the same structure and with no other text."""
@@ -0,0 +1,53 @@
+"""
+Prompt token estimates per model, without loading a tokenizer.
+
+Counts start from a characters-per-token ratio and are calibrated per model
+from the prompt token counts Ollama reports for each uncached call.
+"""
+import math
+import threading
+from typing import Dict
+
+# Conservative for English mixed with SQL identifiers; calibration moves it
+DEFAULT_CHARS_PER_TOKEN = 3.5
+MIN_CHARS_PER_TOKEN = 2.0
+MAX_CHARS_PER_TOKEN = 6.0
+# Weight of each new observation in the running ratio
+CALIBRATION_RATE = 0.2
+
+
+class TokenCounter:
+    def __init__(self, default_ratio: float = DEFAULT_CHARS_PER_TOKEN):
+        self.default_ratio = default_ratio
+        self._ratios: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def ratio(self, model: str) -> float:
+        with self._lock:
+            return self._ratios.get(model, self.default_ratio)
+
+    def count(self, model: str, text: str) -> int:
+        return math.ceil(len(text or "") / self.ratio(model))
+
+    def observe(self, model: str, chars: int, tokens: int) -> None:
+        """Calibrate `model` from one call that sent `chars` characters as `tokens` prompt tokens."""
+        if chars <= 0 or tokens <= 0:
+            return
+        observed = chars / tokens
+        with self._lock:
+            current = self._ratios.get(model, self.default_ratio)
+            # Ollama only counts tokens it had to evaluate, so a reused prompt prefix
+            # looks like a very dense prompt; never let that loosen the estimate much
+            if observed > current * 1.5 or not MIN_CHARS_PER_TOKEN <= observed <= MAX_CHARS_PER_TOKEN:
+                return
+            self._ratios[model] = current + CALIBRATION_RATE * (observed - current)
+
+    def ratios(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._ratios)
+
+
+_counter = TokenCounter()
+
+def get_token_counter() -> TokenCounter:
+    return _counter
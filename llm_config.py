@@ -10,7 +10,7 @@ def get_llm_config():
     return {
         "config_list": [{
             "model": "gemma2:2b",
-            "base_url": "http://localhost:11434",
+            "base_url": os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
             "api_type": "ollama"
         }],
         "temperature": 0.1,
@@ -21,7 +21,7 @@ def get_llm_config():
 def get_sqlcoder_config():
     return {
         "config_list": [{
-            "base_url": "http://localhost:11434",
+            "base_url": os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
             "model": "sqlcoder:7b",
             "api_type": "ollama"
         }],
@@ -30,6 +30,142 @@ def get_sqlcoder_config():
         "cache_seed": None
     }
 
+def get_cache_config():
+    """Settings for the persistent LLM response cache shared by all agents."""
+    return {
+        "path": os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite"),
+        "max_entries": int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000")),
+        "enabled": os.getenv("LLM_CACHE_ENABLED", "1") != "0",
+        # Comma-separated agent names that always go to the model
+        "bypass_agents": [name for name in os.getenv("LLM_CACHE_BYPASS", "").split(",") if name]
+    }
+
+def get_answer_cache_config():
+    """Settings for the answer cache that replays validated SQL for repeated questions."""
+    return {
+        "path": os.getenv("ANSWER_CACHE_PATH", ".answer_cache.sqlite"),
+        "max_entries": int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "20000")),
+        "enabled": os.getenv("ANSWER_CACHE_ENABLED", "1") != "0",
+        # Seconds an answer stays valid; 0 keeps it until evicted
+        "ttl": float(os.getenv("ANSWER_CACHE_TTL", "0")),
+        "approximate": os.getenv("ANSWER_CACHE_APPROXIMATE", "1") != "0",
+        "min_similarity": float(os.getenv("ANSWER_CACHE_MIN_SIMILARITY", "0.7"))
+    }
+
+def get_structured_output_config():
+    """Settings for JSON-schema constrained replies from the analyzer and validator."""
+    return {
+        "enabled": os.getenv("LLM_STRUCTURED_OUTPUT", "1") != "0",
+        # Follow-up calls that send back only the invalid fragment of a reply
+        "max_repairs": int(os.getenv("LLM_STRUCTURED_MAX_REPAIRS", "1"))
+    }
+
+def get_fallback_config():
+    """Settings for the repair loop that runs when a generated query fails validation."""
+    return {
+        # Generate-and-validate rounds before the question is given up on
+        "max_attempts": int(os.getenv("FALLBACK_MAX_ATTEMPTS", "3"))
+    }
+
+def get_sampling_config():
+    """Settings for self-consistency: several SQL samples per question, chosen by execution vote."""
+    candidates = int(os.getenv("SQL_CANDIDATES", "1"))
+    return {
+        # 1 keeps the single-candidate generate -> validate -> fallback pipeline
+        "candidates": candidates,
+        "temperature": float(os.getenv("SQL_SAMPLE_TEMPERATURE", "0.7")),
+        "concurrency": int(os.getenv("SQL_SAMPLE_CONCURRENCY", "0")) or candidates,
+        # Seconds for sampling and voting together; late samples are dropped
+        "budget": float(os.getenv("SQL_SAMPLE_BUDGET", "60"))
+    }
+
+def get_router_config():
+    """Settings for routing questions between cheaper and fuller agent chains by estimated complexity."""
+    return {
+        # "off" (every question takes the full chain), "cascade" or "difficulty"
+        "policy": os.getenv("ROUTER_POLICY", "off"),
+        # Linked tables a question may need and still count as simple
+        "max_simple_tables": int(os.getenv("ROUTER_MAX_SIMPLE_TABLES", "1")),
+        # SQL model for the last escalation step; unset ends escalation at the full chain
+        "large_model": os.getenv("ROUTER_LARGE_MODEL") or None
+    }
+
+def get_queue_config():
+    """Settings for workers sharing one run through a queue file."""
+    return {
+        # A worker renews its leases every third of this; a dead worker's questions return after it
+        "lease_seconds": float(os.getenv("QUEUE_LEASE_SECONDS", "300")),
+        # Leases per question, counting errors, timeouts and expiries, before it is given up on
+        "max_attempts": int(os.getenv("QUEUE_MAX_ATTEMPTS", "3")),
+        "poll_interval": float(os.getenv("QUEUE_POLL_INTERVAL", "2")),
+        # WAL journal: only when every worker runs on the host that holds the queue file
+        "wal": os.getenv("QUEUE_WAL", "0") == "1"
+    }
+
+def get_dialect_config():
+    """Settings for the SQL dialect the pipeline targets end to end."""
+    return {
+        # Picks the question file, the schema DDL, the prompts and local validation
+        "dialect": os.getenv("SQL_DIALECT", "mysql"),
+        # Dialect the generators are prompted in when it differs from the target; unset means the target
+        "generation_dialect": os.getenv("SQL_GENERATION_DIALECT") or None,
+        # Rewrite generated SQL into the target dialect with sqlglot, when installed
+        "transpile": os.getenv("SQL_TRANSPILE", "1") != "0"
+    }
+
+def get_dispatch_config():
+    """Settings for the per-model request dispatcher in front of each model server."""
+    return {
+        "enabled": os.getenv("LLM_DISPATCH_ENABLED", "1") != "0",
+        # Keep at or below the server's OLLAMA_NUM_PARALLEL
+        "max_in_flight_per_model": int(os.getenv("LLM_DISPATCH_MAX_IN_FLIGHT", "4")),
+        # Models the server may hold at once (Ollama's OLLAMA_MAX_LOADED_MODELS)
+        "max_loaded_models": int(os.getenv("LLM_DISPATCH_MAX_LOADED_MODELS", "1")),
+        "switch_batch": int(os.getenv("LLM_DISPATCH_SWITCH_BATCH", "16"))
+    }
+
+def get_prompt_config():
+    """Settings for compact prompts fitted to each model's token budget."""
+    return {
+        # Show the schema as one compact line per table instead of CREATE TABLE DDL
+        "compact_schema": os.getenv("PROMPT_COMPACT_SCHEMA", "1") != "0",
+        # Context window assumed for every model, and per-model overrides as "model=tokens,..."
+        "context_window": int(os.getenv("PROMPT_CONTEXT_WINDOW", "4096")),
+        "context_windows": {
+            model: int(tokens)
+            for model, _, tokens in (item.rpartition("=") for item in os.getenv("PROMPT_CONTEXT_WINDOWS", "").split(","))
+            if model and tokens
+        },
+        # Send the window to Ollama as num_ctx, so the server does not truncate below it
+        "set_num_ctx": os.getenv("PROMPT_SET_NUM_CTX", "0") == "1",
+        # Tokens kept free for the reply
+        "reply_reserve": int(os.getenv("PROMPT_REPLY_RESERVE", "512")),
+        # Optional tighter cap on the prompt itself; 0 means the window minus the reserve
+        "token_budget": int(os.getenv("PROMPT_TOKEN_BUDGET", "0"))
+    }
+
+def get_few_shot_config():
+    """Settings for the solved examples retrieved into the analyzer and generator prompts."""
+    return {
+        # Needs numpy; without it prompts stay zero-shot
+        "enabled": os.getenv("FEW_SHOT_ENABLED", "1") != "0",
+        "k": int(os.getenv("FEW_SHOT_K", "3")),
+        # Cosine similarity below which an example is more noise than help
+        "min_score": float(os.getenv("FEW_SHOT_MIN_SCORE", "0.15"))
+    }
+
+def get_value_index_config():
+    """Settings for grounding question literals in the databases' stored values."""
+    return {
+        # Needs the SQLite files under MINIDEV_DB_ROOT; databases without one are skipped
+        "enabled": os.getenv("VALUE_INDEX_ENABLED", "1") != "0",
+        # Text columns with more distinct values than this are names, notes or ids, not categories
+        "max_distinct": int(os.getenv("VALUE_INDEX_MAX_DISTINCT", "1000")),
+        "k": int(os.getenv("VALUE_INDEX_K", "5")),
+        # Trigram Jaccard similarity a question span needs with a stored value
+        "min_similarity": float(os.getenv("VALUE_INDEX_MIN_SIMILARITY", "0.75"))
+    }
+
 # def get_llm_config():
 #     return {
 #         "config_list": [{
@@ -1,21 +1,37 @@
-from typing import Callable, List, Dict, Any
+from typing import Callable, List, Dict, Any, Optional
 from state.shared_state import update_state
+from planning.tracing import trace_span, record_retry
 
 class AgentStep:
-    def __init__(self, name: str, agent: Any, preconditions: List[str], effects: List[str]):
+    def __init__(self, name: str, agent: Any, preconditions: List[str], effects: List[str], max_retries: int = 0,
+                 condition: Optional[Callable[[Dict[str, Any]], bool]] = None):
         self.name = name
         self.agent = agent
         self.preconditions = preconditions
         self.effects = effects
+        self.max_retries = max_retries
+        # Conditional steps only run when this returns True once they are ready
+        self.condition = condition
 
     def is_ready(self, state: Dict[str, Any]) -> bool:
         return all(key in state for key in self.preconditions)
 
+    def should_run(self, state: Dict[str, Any]) -> bool:
+        return self.condition is None or bool(self.condition(state))
+
     def run(self, state: Dict[str, Any]) -> None:
         if not self.is_ready(state):
             raise RuntimeError(f"Preconditions not met for agent: {self.name}")
 
         print(f"Running agent step: {self.name}")
-        result = self.agent.run(state)
+        with trace_span(self.name):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    result = self.agent.run(state)
+                    break
+                except Exception:
+                    if attempt == self.max_retries:
+                        raise
+                    record_retry()
         for key, value in result.items():
-            update_state(key, value)
\ No newline at end of file
+            update_state(key, value)
@@ -1,23 +1,117 @@
-from typing import List, Dict, Any
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import List, Dict, Any, Set
 from planning.agent_step import AgentStep
+from planning.tracing import trace_span
+
+class PlanningError(ValueError):
+    pass
 
 class Planner:
-    def __init__(self, steps: List[AgentStep]):
+    """
+    Runs agent steps as a dependency graph.
+
+    The graph is compiled once from each step's preconditions and effects: a step
+    depends on every step that produces one of its preconditions. Cycles are
+    rejected when the planner is built and steps whose preconditions can never be
+    met are rejected before anything runs. Steps whose dependencies are satisfied
+    run concurrently; conditional steps are skipped when their condition is false.
+    """
+
+    def __init__(self, steps: List[AgentStep], max_workers: int = 4):
         self.steps = steps
+        self.max_workers = max_workers
+        self._compile()
+
+    def _compile(self) -> None:
+        names = [step.name for step in self.steps]
+        duplicates = {name for name in names if names.count(name) > 1}
+        if duplicates:
+            raise PlanningError(f"Duplicate step names: {sorted(duplicates)}")
+
+        self.producers: Dict[str, List[str]] = {}
+        for step in self.steps:
+            for key in step.effects:
+                self.producers.setdefault(key, []).append(step.name)
+
+        self.dependencies: Dict[str, Set[str]] = {}
+        self.dependents: Dict[str, Set[str]] = {step.name: set() for step in self.steps}
+        for step in self.steps:
+            deps = {producer for key in step.preconditions for producer in self.producers.get(key, [])}
+            deps.discard(step.name)
+            self.dependencies[step.name] = deps
+            for dep in deps:
+                self.dependents[dep].add(step.name)
+
+        # Kahn's algorithm; anything left over sits on a cycle
+        in_degree = {name: len(deps) for name, deps in self.dependencies.items()}
+        queue = [name for name in names if in_degree[name] == 0]
+        order = []
+        while queue:
+            name = queue.pop(0)
+            order.append(name)
+            for dependent in sorted(self.dependents[name]):
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    queue.append(dependent)
+        if len(order) != len(names):
+            cyclic = sorted(name for name in names if name not in order)
+            raise PlanningError(f"Dependency cycle between steps: {cyclic}")
+        self.order = order
+        self._by_name = {step.name: step for step in self.steps}
+
+    def unreachable_steps(self, available_keys: Set[str]) -> List[str]:
+        """Steps whose preconditions cannot be produced from `available_keys`, even if every step runs."""
+        keys = set(available_keys)
+        for name in self.order:
+            step = self._by_name[name]
+            if step.is_ready(keys):
+                keys.update(step.effects)
+        return [name for name in self.order if not self._by_name[name].is_ready(keys)]
 
     def run(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        executed_steps = set()
-        while True:
-            progress = False
-            for step in self.steps:
-                print(f"Checking step: {step.name}")
-                print(f"  Preconditions: {step.preconditions}")
-                print(f"  Current state keys: {list(state.keys())}")
-                if step.name not in executed_steps and step.is_ready(state):
-                    print(f"Running agent step: {step.name}")
-                    step.run(state)
-                    executed_steps.add(step.name)
-                    progress = True
-            if not progress:
-                break
-        return state
\ No newline at end of file
+        unreachable = self.unreachable_steps(set(state.keys()))
+        if unreachable:
+            raise PlanningError(f"Steps can never become ready: {unreachable}")
+
+        with trace_span("Planner"):
+            self._dispatch(state)
+        return state
+
+    def _dispatch(self, state: Dict[str, Any]) -> None:
+        pending = list(self.order)
+        running: Dict[Future, str] = {}
+        self.executed: List[str] = []
+        self.skipped: List[str] = []
+        pool = None
+        try:
+            while pending or running:
+                ready = [name for name in pending
+                         if not (self.dependencies[name] & (set(pending) | set(running.values())))]
+                for name in ready:
+                    pending.remove(name)
+                    step = self._by_name[name]
+                    if not step.is_ready(state) or not step.should_run(state):
+                        # Condition false, or an upstream step was skipped
+                        self.skipped.append(name)
+                        continue
+                    if not running and len(ready) == 1:
+                        # Nothing to overlap with; run inline and skip the pool
+                        step.run(state)
+                        self.executed.append(name)
+                        continue
+                    if pool is None:
+                        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="step")
+                    # Copy the context so the step sees this question's state and trace span
+                    running[pool.submit(copy_context().run, step.run, state)] = name
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    future.result()  # Re-raise step failures here
+                    self.executed.append(name)
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,189 @@
+"""
+Difficulty-aware routing of questions between cheaper and fuller agent chains.
+
+Routes, from cheapest:
+    cheap  the analysis model writes the SQL straight from the linked schema, with
+           no analysis step; only local validation judges it and there is no repair loop
+    full   analysis, generation with the SQL model, validation and the repair loop
+    large  the full chain with ROUTER_LARGE_MODEL writing the SQL (only when set)
+
+A question that gets no validated query on its route escalates to the next
+one. Policies pick the first route:
+    off         every question takes the full chain
+    cascade     questions estimated simple start on cheap, the rest on full
+    difficulty  simple start on cheap, moderate on full, challenging on large
+
+Per-route counts and latencies are kept so the time saved on cheap answers
+can be weighed against the escalations they cause.
+"""
+import re
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from llm_config import get_router_config
+from planning.tracing import percentile
+
+POLICIES = ("off", "cascade", "difficulty")
+LEVELS = ("simple", "moderate", "challenging")
+
+# Each distinct one asks for aggregation, comparison, ordering or negation beyond a lookup
+_COMPLEX_WORDS = re.compile(
+    r"\b(ratio|percent(?:age)?|proportion|difference|average|rate|each|per|most|least|highest|lowest|top|"
+    r"rank(?:ed|ing)?|compare|both|neither|without|never|except|times)\b", re.IGNORECASE)
+# Evidence that spells out a calculation
+_FORMULA = re.compile(r"[/*]|\b(DIVIDE|SUM|COUNT|MAX|MIN|AVG|CAST|SUBTRACT|MULTIPLY)\s*\(", re.IGNORECASE)
+# Tables scoring at least this share of the best match count toward the estimate; the
+# linker's weaker picks are there for recall and say little about the query's shape
+STRONG_TABLE_SHARE = 0.7
+# Latencies kept per route for the percentiles
+LATENCY_WINDOW = 10000
+
+
+@dataclass
+class Route:
+    name: str
+    sql_model: str  # "analysis", "sql" or "large": which model config writes the SQL
+    skip_analysis: bool = False
+    local_validation_only: bool = False
+    repair: bool = True  # run the fallback loop when validation fails
+
+
+ROUTES = {
+    "cheap": Route("cheap", "analysis", skip_analysis=True, local_validation_only=True, repair=False),
+    "full": Route("full", "sql"),
+    "large": Route("large", "large")
+}
+ESCALATION = ["cheap", "full", "large"]
+
+
+@dataclass
+class Complexity:
+    level: str
+    score: int
+    reasons: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class RouteStats:
+    started: int = 0  # questions whose first route this was
+    attempts: int = 0
+    answered: int = 0
+    escalated: int = 0
+    failed: int = 0  # no answer and nowhere left to escalate
+    total_s: float = 0.0
+    latencies: deque = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+
+
+class Router:
+    def __init__(self, policy: str = "off", max_simple_tables: int = 1, large_model: Optional[str] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown routing policy '{policy}'; expected one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.max_simple_tables = max_simple_tables
+        self.large_model = large_model
+        self._stats: Dict[str, RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, question: str, evidence: str = "", table_scores: Optional[Dict[str, float]] = None,
+                 difficulty: Optional[str] = None) -> Complexity:
+        """
+        Complexity from the question text, the evidence and the schema linker's table scores.
+
+        The dataset's difficulty, when known, can only raise the estimate.
+        """
+        reasons = []
+        best = max(table_scores.values()) if table_scores else 0.0
+        tables = [name for name, score in (table_scores or {}).items() if best and score >= best * STRONG_TABLE_SHARE]
+        extra_tables = max(0, len(tables) - self.max_simple_tables)
+        if extra_tables:
+            reasons.append(f"{len(tables)} tables")
+        words = sorted({word.lower() for word in _COMPLEX_WORDS.findall(question or "")})
+        reasons += words
+        formula = bool(_FORMULA.search(evidence or ""))
+        if formula:
+            reasons.append("formula in evidence")
+        score = extra_tables + len(words) + int(formula)
+        level = "simple" if score == 0 else "moderate" if score <= 2 else "challenging"
+        if difficulty in LEVELS and LEVELS.index(difficulty) > LEVELS.index(level):
+            level = difficulty
+            reasons.append(f"labelled {difficulty}")
+        return Complexity(level, score, reasons)
+
+    def first_route(self, complexity: Complexity) -> Route:
+        if self.policy == "cascade" and complexity.level == "simple":
+            return ROUTES["cheap"]
+        if self.policy == "difficulty":
+            name = {"simple": "cheap", "moderate": "full", "challenging": "large"}[complexity.level]
+            return ROUTES[name if name != "large" or self.large_model else "full"]
+        return ROUTES["full"]
+
+    def next_route(self, route: Route) -> Optional[Route]:
+        """The route to escalate to after `route` failed, or None."""
+        following = ESCALATION[ESCALATION.index(route.name) + 1:]
+        for name in following:
+            if name != "large" or self.large_model:
+                return ROUTES[name]
+        return None
+
+    def record(self, route: Route, answered: bool, elapsed: float, escalated: bool, first: bool) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(route.name, RouteStats())
+            stats.started += int(first)
+            stats.attempts += 1
+            stats.answered += int(answered)
+            stats.escalated += int(escalated)
+            stats.failed += int(not answered and not escalated)
+            stats.total_s += elapsed
+            stats.latencies.append(elapsed)
+
+    def stats(self) -> dict:
+        """Per route: questions started, attempts, outcomes and latency, with questions per hour at its mean."""
+        with self._lock:
+            items = [(name, stats, sorted(stats.latencies)) for name, stats in self._stats.items()]
+        summary = {}
+        for name, stats, latencies in sorted(items, key=lambda item: ESCALATION.index(item[0])):
+            mean = stats.total_s / stats.attempts if stats.attempts else 0.0
+            summary[name] = {
+                "started": stats.started,
+                "attempts": stats.attempts,
+                "answered": stats.answered,
+                "escalated": stats.escalated,
+                "failed": stats.failed,
+                "mean_s": mean,
+                "p50_s": percentile(latencies, 50),
+                "p95_s": percentile(latencies, 95),
+                "questions_per_hour": 3600.0 / mean if mean else 0.0
+            }
+        return summary
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats = {}
+
+
+def format_route_stats(stats: dict) -> List[str]:
+    """Human-readable lines for the run log."""
+    lines = [f"{'route':<8}{'started':>9}{'tries':>7}{'answered':>10}{'escalated':>11}{'failed':>8}"
+             f"{'mean s':>9}{'p50 s':>8}{'p95 s':>8}{'q/h':>9}"]
+    for name, route in stats.items():
+        lines.append(f"{name:<8}{route['started']:>9}{route['attempts']:>7}{route['answered']:>10}"
+                     f"{route['escalated']:>11}{route['failed']:>8}{route['mean_s']:>9.2f}{route['p50_s']:>8.2f}"
+                     f"{route['p95_s']:>8.2f}{route['questions_per_hour']:>9.0f}")
+    return lines
+
+
+_router: Optional[Router] = None
+_router_lock = threading.Lock()
+
+def get_router() -> Router:
+    global _router
+    with _router_lock:
+        if _router is None:
+            config = get_router_config()
+            _router = Router(config["policy"], config["max_simple_tables"], config["large_model"])
+        return _router
@@ -0,0 +1,243 @@
+"""
+Per-stage tracing for the planner and agent steps.
+
+Every agent step (and any other stage wrapped in `trace_span`) records its wall
+time, outcome, retries and the LLM calls it made: prompt size in characters and
+prompt/completion token counts as reported by the model server (estimated from
+the text for streams stopped before the server reported them). Spans can be
+summarised into p50/p95/p99 per stage and per difficulty, and exported in the
+Chrome trace event format (chrome://tracing, Perfetto).
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from state.shared_state import get_state
+
+
+@dataclass
+class Span:
+    stage: str
+    question_id: Any
+    difficulty: Optional[str]
+    start: float
+    duration: float = 0.0
+    outcome: str = "ok"
+    error: Optional[str] = None
+    retries: int = 0
+    llm_calls: int = 0
+    cached_calls: int = 0
+    prompt_chars: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Calls whose token counts are estimates rather than the server's
+    estimated_token_calls: int = 0
+    # Streamed calls only: seconds from request to first token / to the extracted result
+    time_to_first_token: Optional[float] = None
+    time_to_result: Optional[float] = None
+    early_stops: int = 0
+    # Prompts shortened to fit the token budget, and those still over it
+    prompt_trims: int = 0
+    prompt_overflows: int = 0
+    thread_id: int = field(default_factory=threading.get_ident)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Tracer:
+    def __init__(self, max_spans: Optional[int] = None):
+        # Only the newest `max_spans` are kept when set, for processes that never finish a run
+        self.spans: deque = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def limit(self, max_spans: Optional[int]) -> None:
+        with self._lock:
+            self.spans = deque(self.spans, maxlen=max_spans)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[Span]:
+        span = Span(stage, get_state("question_id"), get_state("difficulty"), time.perf_counter())
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.outcome = "error"
+            span.error = str(e)
+            raise
+        finally:
+            span.duration = time.perf_counter() - span.start
+            _current_span.reset(token)
+            with self._lock:
+                self.spans.append(span)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.spans = deque(maxlen=self.spans.maxlen)
+            self._origin = time.perf_counter()
+
+    def question_timings(self, question_id: Any) -> Dict[str, float]:
+        """Total seconds per stage for one question."""
+        timings: Dict[str, float] = {}
+        with self._lock:
+            spans = [span for span in self.spans if span.question_id == question_id]
+        for span in spans:
+            timings[span.stage] = timings.get(span.stage, 0.0) + span.duration
+        return timings
+
+    def _aggregate(self, spans: List[Span]) -> dict:
+        durations = sorted(span.duration for span in spans)
+        first_token = sorted(span.time_to_first_token for span in spans if span.time_to_first_token is not None)
+        to_result = sorted(span.time_to_result for span in spans if span.time_to_result is not None)
+        return {
+            "count": len(spans),
+            "errors": sum(1 for span in spans if span.outcome != "ok"),
+            "retries": sum(span.retries for span in spans),
+            "llm_calls": sum(span.llm_calls for span in spans),
+            "cached_calls": sum(span.cached_calls for span in spans),
+            "mean": sum(durations) / len(durations) if durations else 0.0,
+            "p50": percentile(durations, 50),
+            "p95": percentile(durations, 95),
+            "p99": percentile(durations, 99),
+            "prompt_chars": sum(span.prompt_chars for span in spans),
+            "prompt_tokens": sum(span.prompt_tokens for span in spans),
+            "completion_tokens": sum(span.completion_tokens for span in spans),
+            "estimated_token_calls": sum(span.estimated_token_calls for span in spans),
+            "early_stops": sum(span.early_stops for span in spans),
+            "prompt_trims": sum(span.prompt_trims for span in spans),
+            "prompt_overflows": sum(span.prompt_overflows for span in spans),
+            "ttft_p50": percentile(first_token, 50),
+            "time_to_result_p50": percentile(to_result, 50)
+        }
+
+    def summary(self) -> dict:
+        """Latency percentiles and token totals per stage, and per (difficulty, stage)."""
+        with self._lock:
+            spans = list(self.spans)
+        by_stage: Dict[str, List[Span]] = {}
+        by_difficulty: Dict[str, Dict[str, List[Span]]] = {}
+        for span in spans:
+            by_stage.setdefault(span.stage, []).append(span)
+            difficulty = span.difficulty or "unknown"
+            by_difficulty.setdefault(difficulty, {}).setdefault(span.stage, []).append(span)
+        return {
+            "stages": {stage: self._aggregate(items) for stage, items in by_stage.items()},
+            "difficulty": {
+                difficulty: {stage: self._aggregate(items) for stage, items in stages.items()}
+                for difficulty, stages in by_difficulty.items()
+            }
+        }
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Write spans as Chrome trace 'complete' events."""
+        with self._lock:
+            spans = list(self.spans)
+        events = []
+        for span in spans:
+            args = asdict(span)
+            for key in ("stage", "start", "duration", "thread_id"):
+                args.pop(key)
+            events.append({
+                "name": span.stage,
+                "cat": "pipeline",
+                "ph": "X",
+                "ts": (span.start - self._origin) * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": os.getpid(),
+                "tid": span.thread_id,
+                "args": args
+            })
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+
+_tracer = Tracer()
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+def trace_span(stage: str):
+    """Context manager that records `stage` as a span of the current question."""
+    return _tracer.span(stage)
+
+def record_llm_call(prompt_chars: int, prompt_tokens: int = 0, completion_tokens: int = 0,
+                    cached: bool = False, estimated: bool = False) -> None:
+    """Attribute one model call to the active span, if any."""
+    span = _current_span.get()
+    if span is None:
+        return
+    span.llm_calls += 1
+    span.prompt_chars += prompt_chars
+    if cached:
+        span.cached_calls += 1
+    else:
+        span.prompt_tokens += prompt_tokens or 0
+        span.completion_tokens += completion_tokens or 0
+        span.estimated_token_calls += int(estimated)
+
+def record_stream_timing(time_to_first_token: Optional[float], time_to_result: float,
+                         stopped_early: bool) -> None:
+    """Attribute streaming latencies of one call to the active span (the last call wins)."""
+    span = _current_span.get()
+    if span is None:
+        return
+    span.time_to_first_token = time_to_first_token
+    span.time_to_result = time_to_result
+    if stopped_early:
+        span.early_stops += 1
+
+def record_prompt_fit(trimmed: bool, over_budget: bool) -> None:
+    span = _current_span.get()
+    if span is None:
+        return
+    span.prompt_trims += int(trimmed)
+    span.prompt_overflows += int(over_budget)
+
+def record_retry() -> None:
+    span = _current_span.get()
+    if span is not None:
+        span.retries += 1
+
+def format_summary(summary: dict) -> List[str]:
+    """Human-readable lines for the run log."""
+    header = f"{'stage':<22}{'n':>5}{'err':>5}{'retry':>7}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'calls':>7}{'prompt tok':>12}{'compl tok':>11}"
+    lines = ["Per-stage latency:", header]
+
+    def row(name: str, stats: dict) -> str:
+        return (f"{name:<22}{stats['count']:>5}{stats['errors']:>5}{stats['retries']:>7}{stats['p50']:>9.2f}{stats['p95']:>9.2f}"
+                f"{stats['p99']:>9.2f}{stats['llm_calls']:>7}{stats['prompt_tokens']:>12}{stats['completion_tokens']:>11}")
+
+    for stage, stats in summary["stages"].items():
+        lines.append(row(stage, stats))
+    for stage, stats in summary["stages"].items():
+        if stats["ttft_p50"] or stats["time_to_result_p50"]:
+            lines.append(f"{stage}: streamed p50 time-to-first-token {stats['ttft_p50']:.2f}s, "
+                         f"time-to-result {stats['time_to_result_p50']:.2f}s, {stats['early_stops']} early stops")
+    for stage, stats in summary["stages"].items():
+        if stats["prompt_trims"] or stats["prompt_overflows"]:
+            lines.append(f"{stage}: {stats['prompt_trims']} prompts trimmed to the token budget, "
+                         f"{stats['prompt_overflows']} still over it")
+    for difficulty, stages in sorted(summary["difficulty"].items()):
+        lines.append(f"Difficulty: {difficulty}")
+        for stage, stats in stages.items():
+            lines.append(row(f"  {stage}", stats))
+    return lines
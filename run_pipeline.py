@@ -1,25 +1,44 @@
-def extract_json_block(text):
-    match = re.search(r"```json\s*(\{.*?\})\s*```", text, re.DOTALL)
-    if not match:
-        raise ValueError("Could not extract JSON block from validation content.")
-    return json.loads(match.group(1))
 """
 Main script for running the SQL multi-agent pipeline.
 """
+import argparse
 import json
 import re
 import logging
+import time
 from datetime import datetime
 from autogen import UserProxyAgent, GroupChat, GroupChatManager
 from agents.question_analyzer import QuestionAnalyzer
 from agents.sql_generator import SQLGenerator
 from agents.query_validator import QueryValidator
-from llm_config import get_llm_config, get_sqlcoder_config
+from llm_config import (get_llm_config, get_sqlcoder_config, get_fallback_config, get_sampling_config,
+                        get_dialect_config, get_few_shot_config, get_queue_config)
 from planning.agent_step import AgentStep
 from planning.planner import Planner
+from planning.router import POLICIES, format_route_stats, get_router
+from planning.tracing import trace_span, get_tracer, format_summary
 from agents.fallback_sql_generator import FallbackSQLGenerator
+from agents.registry import get_agent
 from control.validator_hooks import should_run_fallback, inject_fallback_step
+from control.batch_runner import run_batch
+from control.self_consistency import self_consistent_sql
+from control.work_queue import WorkQueue, aggregate_report, format_report, run_worker
 from state.shared_state import reset_state, update_state, get_state, get_full_state, get_state_reference
+from state.response_cache import get_response_cache, disable_response_cache
+from state.answer_cache import dialect_label, get_answer_cache, disable_answer_cache
+from state.results_store import ResultsStore, select_questions
+from catalog.dialects import DEFAULT_DIALECT, DIALECTS, get_dialect
+from catalog.example_index import disable_example_index, get_example_index, retrieve_examples
+from catalog.schema_catalog import get_schema_catalog
+from catalog.schema_linker import get_schema_linker
+from catalog.value_index import disable_value_index, get_value_index, lookup_values, set_value_index_root
+from control.local_validator import check_sql, needs_semantic_review, INVALID, VALID
+from control.transpile import transpile, transpile_available
+from evaluation.execution_evaluator import ExecutionEvaluator, DEFAULT_DB_ROOT, load_execution_gold
+from llm.dispatcher import all_dispatchers
+from llm.parsing import parse_validation
+from llm.prompts import schema_section
+from llm.structured import VALIDATION_FORMAT
 
 # Set up logging
 # Create a custom logger
@@ -54,80 +73,33 @@ def normalize_sql(sql):
     sql = sql.rstrip(';')
     return sql.strip()
 
-def extract_relevant_schema(schema_text, question):
-    """Extract only the relevant tables and their relationships based on the question."""
-    # Split schema into individual CREATE TABLE statements
-    tables = schema_text.split('CREATE TABLE')
-    relevant_tables = []
-    
-    # Simple keyword matching to find relevant tables
-    keywords = question.lower().split()
-    for table in tables:
-        if any(keyword in table.lower() for keyword in keywords):
-            # Only keep the table name and column definitions
-            table_lines = table.split('\n')
-            filtered_lines = [line for line in table_lines if 'CREATE TABLE' in line or 'PRIMARY KEY' in line or 'FOREIGN KEY' in line]
-            if filtered_lines:
-                relevant_tables.append('CREATE TABLE' + '\n'.join(filtered_lines))
-    
-    return '\n'.join(relevant_tables) if relevant_tables else schema_text[:1000]  # Fallback to first 1000 chars
+def link_schema(db_id, question, evidence=""):
+    """
+    The linker's tables and ranked columns for the question; every table when nothing links.
+
+    Columns storing a value the question mentions rank higher, and the matches come back in `values`.
+    """
+    values = lookup_values(db_id, question, evidence)
+    link = get_schema_linker().link(db_id, question, evidence, values=values)
+    if not link.tables:
+        link.tables = [table.name for table in get_schema_catalog().get(db_id).tables.values()]
+    return link
 
-def load_schema(db_id):
+def relevant_tables(db_id, question, evidence=""):
+    """The tables the question links to plus those needed to join them; every table when nothing links."""
+    return link_schema(db_id, question, evidence).tables
+
+def extract_relevant_schema(db_id, question, evidence="", dialect=DEFAULT_DIALECT):
+    """Extract only the relevant tables and the tables needed to join them."""
+    return get_schema_catalog().get(db_id).render_ddl(relevant_tables(db_id, question, evidence), dialect)
+
+def load_schema(db_id, dialect=DEFAULT_DIALECT):
     """Load the database schema for a specific database ID."""
-    with open('data_minidev/MINIDEV/dev_tables.json', 'r') as f:
-        schema_data = json.load(f)
-        # Find the schema for the given db_id
-        db_schema = next((db for db in schema_data if db['db_id'] == db_id), None)
-        if not db_schema:
-            raise ValueError(f"Schema not found for database ID: {db_id}")
-        
-        # Convert JSON schema to SQL CREATE TABLE statements
-        create_statements = []
-        
-        # Create a mapping of table indices to table names
-        table_names = db_schema['table_names']
-        
-        # Group columns by table
-        table_columns = {}
-        for col_info, col_name, col_type in zip(
-            db_schema['column_names_original'],
-            db_schema['column_names'],
-            db_schema['column_types']
-        ):
-            table_idx = col_info[0]
-            if table_idx == -1:  # Skip the * column
-                continue
-            if table_idx not in table_columns:
-                table_columns[table_idx] = []
-            table_columns[table_idx].append((col_name[1], col_type))
-        
-        # Generate CREATE TABLE statements
-        for table_idx, columns in table_columns.items():
-            table_name = table_names[table_idx]
-            column_defs = []
-            
-            for col_name, col_type in columns:
-                # Convert column type to SQL type
-                sql_type = col_type.upper()
-                if sql_type == 'TEXT':
-                    sql_type = 'VARCHAR(255)'
-                elif sql_type == 'INTEGER':
-                    sql_type = 'INT'
-                
-                column_defs.append("`{}` {}".format(col_name, sql_type))
-            
-            # Use string formatting for the CREATE TABLE statement
-            create_stmt = "CREATE TABLE `{}` (\n    {}\n)".format(
-                table_name,
-                ',\n    '.join(column_defs)
-            )
-            create_statements.append(create_stmt)
-        
-        return '\n\n'.join(create_statements)
+    return get_schema_catalog().get(db_id).full_ddl(dialect)
 
-def load_questions():
-    """Load all questions from the dataset."""
-    with open('data_minidev/MINIDEV/mini_dev_mysql.json', 'r') as f:
+def load_questions(dialect=DEFAULT_DIALECT):
+    """Load all questions from the dataset shipped for `dialect`."""
+    with open(get_dialect(dialect).dataset, 'r') as f:
         questions = json.load(f)
         return [{
             'question_id': i,  # Add question ID
@@ -138,29 +110,14 @@ def load_questions():
             'db_id': q['db_id']
         } for i, q in enumerate(questions, 1)]
 
-import re
-
-def extract_sql_from_message(content: str) -> str:
-    # Try to match ```sql ... ``` first
-    match = re.search(r"```sql\s*(.*?)```", content, re.DOTALL)
-    if match:
-        return match.group(1).strip()
-
-    # Try plain triple backticks
-    match = re.search(r"```\s*(.*?)```", content, re.DOTALL)
-    if match:
-        return match.group(1).strip()
+def validate_sql_with_agent(query: str, schema: str, llm_config: dict, db_id: str = None, dialect: str = None) -> dict:
+    if db_id:
+        local = check_sql(query, db_id, dialect)
+        if local["status"] == INVALID or (local["status"] == VALID and not needs_semantic_review(query)):
+            return local
 
-    # Try SELECT-fallback pattern
-    match = re.search(r"(SELECT .*?);", content, re.DOTALL | re.IGNORECASE)
-    if match:
-        return match.group(1).strip()
-
-    return None
-
-def validate_sql_with_agent(query: str, schema: str, llm_config: dict) -> dict:
-    validator = QueryValidator(llm_config)
-    prompt = f"""You are given a SQL query and schema. Validate the query.
+    validator = get_agent(QueryValidator, llm_config)
+    prompt = f"""You are given a {get_dialect(dialect).label} query and schema. Validate the query.
 SQL Query:
 ```sql
 {query}
@@ -177,116 +134,659 @@ Respond in JSON:
   "final_query": "...",
   "suggestions": []
 }}"""
-    response = validator.generate_reply(messages=[{"role": "user", "content": prompt}])
-    raw = response if isinstance(response, str) else json.dumps(response)
-    cleaned = re.sub(r"```json|```", "", raw).strip()
-    return json.loads(cleaned)
+    return validator.ask_structured(prompt, parse_validation, VALIDATION_FORMAT).as_dict()
+
+def run_fallback_phase(state, sql_config, llm_config, max_attempts=None):
+    """
+    Repair a query that failed validation in at most `max_attempts` rounds.
 
-def run_fallback_phase(schema, analysis, validation_result, sql_config, llm_config):
+    Each round asks FallbackSQLGenerator for one corrected query, given the
+    previous query and the feedback from its validation, and validates it once
+    (local check first, the LLM validator only when needed). Returns the
+    validated query, or None, and a timing record per attempt.
+    """
     logger.warning("⚠️ Running fallback due to validation failure...")
-    fallback_agent = FallbackSQLGenerator(sql_config)
-    fallback_state = {
-        "schema": schema,
-        "analysis": analysis,
-        "validation_result": validation_result
+    max_attempts = max_attempts or get_fallback_config()["max_attempts"]
+    fallback_agent = get_agent(FallbackSQLGenerator, sql_config)
+    attempt_state = {
+        "question": state.get("question"),
+        "db_id": state.get("db_id"),
+        "schema": state["schema"],
+        "schema_tables": state.get("schema_tables"),
+        "schema_columns": state.get("schema_columns"),
+        "values": state.get("values"),
+        "analysis": state.get("analysis"),
+        "sql_query": state.get("sql_query"),
+        "validation_result": state["validation_result"],
+        "dialect": state.get("dialect"),
+        "generation_dialect": state.get("generation_dialect"),
+        "transpile": state.get("transpile", True)
     }
-    result = fallback_agent.run(fallback_state)
-    fallback_query = result.get("final_query")
-
-    if not fallback_query:
-        logger.error("❌ Fallback failed to generate a valid SQL.")
-        return None
-
-    validation = validate_sql_with_agent(fallback_query, schema, llm_config)
-    if validation.get("is_valid"):
-        logger.info("✅ Fallback query validated successfully.")
-        return validation.get("final_query")
-    else:
-        logger.error("❌ Fallback query also failed validation.")
-        return None
-
-def process_question(question_data, llm_config, sql_config):
-    reset_state()
-    full_schema = load_schema(question_data["db_id"])
-    schema = extract_relevant_schema(full_schema, question_data["question"])
-
-    update_state("question", question_data["question"])
+    # The validator sees the same compact schema as the fallback generator
+    validation_schema = schema_section(attempt_state).text
+    tried = {normalize_sql(attempt_state["sql_query"] or "")}
+    attempts = []
+
+    for attempt in range(1, max_attempts + 1):
+        record = {"attempt": attempt, "sql": None, "is_valid": False, "error": None}
+        start = time.perf_counter()
+        with trace_span("FallbackAttempt"):
+            try:
+                new_sql = fallback_agent.run(attempt_state)["sql_query"]
+                record["sql"] = new_sql
+                record["generation_s"] = time.perf_counter() - start
+                if normalize_sql(new_sql) in tried:
+                    # The same query again; its feedback, and so the next prompt, would not change
+                    record["error"] = "Repeated a query that already failed"
+                    record["repeated"] = True
+                else:
+                    tried.add(normalize_sql(new_sql))
+                    validation = validate_sql_with_agent(new_sql, validation_schema, llm_config, state.get("db_id"),
+                                                         state.get("dialect"))
+                    record["is_valid"] = bool(validation.get("is_valid"))
+                    record["error"] = validation.get("error")
+                    attempt_state.update(sql_query=new_sql, validation_result=validation)
+            except Exception as e:
+                record["error"] = str(e)
+        record["elapsed_s"] = time.perf_counter() - start
+        attempts.append(record)
+
+        if record["is_valid"]:
+            logger.info(f"✅ Fallback query validated on attempt {attempt}.")
+            return validation.get("final_query") or new_sql, attempts
+        if record.get("repeated"):
+            break
+
+    logger.error(f"❌ Fallback failed after {len(attempts)} attempt(s).")
+    return None, attempts
+
+class FallbackPhase:
+    """Adapter that lets the planner run the fallback phase as a conditional step."""
+
+    def __init__(self, llm_config, sql_config):
+        self.llm_config = llm_config
+        self.sql_config = sql_config
+
+    def run(self, state: dict) -> dict:
+        fallback_query, attempts = run_fallback_phase(state, self.sql_config, self.llm_config)
+        return {"fallback_query": fallback_query, "fallback_attempts": attempts}
+
+class CandidateSampling:
+    """
+    Adapter that replaces generation and validation with self-consistency voting.
+
+    The first sample uses the generator's own settings; the rest are drawn at
+    the sampling temperature with distinct seeds.
+    """
+
+    def __init__(self, sql_config, sampling):
+        self.sql_config = sql_config
+        self.sampling = sampling
+
+    def run(self, state: dict) -> dict:
+        generator = get_agent(SQLGenerator, self.sql_config)
+
+        def generate(seed):
+            options = {"temperature": self.sampling["temperature"], "seed": seed} if seed else None
+            return generator.generate(state, options)
+
+        result = self_consistent_sql(generate, state["db_id"], self.sampling.get("evaluator"),
+                                     self.sampling["candidates"], self.sampling["concurrency"],
+                                     self.sampling["budget"], state.get("dialect"), state.get("transpile", True))
+        if result.sql:
+            validation = {"is_valid": True, "final_query": result.sql, "suggestions": [], "status": "voted"}
+            return {"sql_query": result.sql, "validation_result": validation, "self_consistency": result.as_dict()}
+
+        # Nothing ran cleanly; hand the first candidate and its errors to the fallback
+        errors = [c.error for c in result.candidates if c.error] or result.sample_errors or ["No candidate was generated."]
+        first = result.candidates[0].sql if result.candidates else None
+        validation = {"is_valid": False, "final_query": first, "suggestions": errors[:3], "error": errors[0]}
+        return {"sql_query": first, "validation_result": validation, "self_consistency": result.as_dict()}
+
+def generate_final_query(question_data, llm_config, sql_config, sampling=None):
+    """Run the agent pipeline for the current question and return its validated query, or None."""
+    with trace_span("SchemaLinking"):
+        link = link_schema(question_data["db_id"], question_data["question"], question_data.get("evidence", ""))
+        tables = link.tables
+        # The schema is shown in the dialect the generators write
+        schema = get_schema_catalog().get(question_data["db_id"]).render_ddl(
+            tables, get_state("generation_dialect") or get_state("dialect") or DEFAULT_DIALECT)
+    update_state("schema_tables", tables)
+    update_state("schema_columns", link.columns)
     update_state("schema", schema)
-
-    steps = [
-        AgentStep("QuestionAnalysis", QuestionAnalyzer(llm_config), ["question", "schema"], ["analysis"]),
-        AgentStep("SQLGeneration", SQLGenerator(sql_config), ["question", "schema", "analysis"], ["sql_query"]),
-        AgentStep("QueryValidation", QueryValidator(llm_config), ["sql_query", "schema"], ["validation_result"])
-    ]
+    update_state("values", link.values)
+    with trace_span("ExampleRetrieval"):
+        # Examples are in the dialect the generators write; the question's own entry is left out
+        examples = retrieve_examples(question_data["db_id"], question_data["question"], question_data.get("evidence", ""),
+                                     question_data.get("question_id"),
+                                     get_state("generation_dialect") or get_state("dialect") or DEFAULT_DIALECT)
+    update_state("examples", examples)
+
+    router = get_router()
+    complexity = router.estimate(question_data["question"], question_data.get("evidence", ""), link.table_scores,
+                                 question_data.get("difficulty"))
+    update_state("complexity", complexity.as_dict())
+    route, first, taken = router.first_route(complexity), True, []
+    while True:
+        taken.append(route.name)
+        update_state("routes", list(taken))
+        start = time.perf_counter()
+        escalation = router.next_route(route)
+        try:
+            with trace_span(f"{route.name.capitalize()}Route"):
+                final_query = run_route(route, llm_config, sql_config, sampling)
+        except Exception:
+            if escalation is None:
+                router.record(route, False, time.perf_counter() - start, False, first)
+                raise
+            final_query = None
+        escalate = not final_query and escalation is not None
+        router.record(route, bool(final_query), time.perf_counter() - start, escalate, first)
+        if not escalate:
+            return final_query
+        # The next route starts over from the linked schema
+        state = get_state_reference()
+        for key in ROUTE_OUTPUTS:
+            state.pop(key, None)
+        route, first = escalation, False
+
+# State a route writes, cleared before escalating to the next one
+ROUTE_OUTPUTS = ("analysis", "sql_query", "validation_result", "self_consistency", "fallback_query",
+                 "fallback_attempts")
+
+def run_route(route, llm_config, sql_config, sampling=None):
+    """Run one route's agents for the current question and return its validated query, or None."""
+    if route.sql_model == "analysis":
+        sql_config = llm_config
+    elif route.sql_model == "large":
+        sql_config = {**sql_config, "config_list": [{**sql_config["config_list"][0],
+                                                     "model": get_router().large_model}]}
+
+    steps = []
+    if route.skip_analysis:
+        # Every linked table in full stands in for the analyzer's picks
+        update_state("analysis", {table: "keep_all" for table in get_state("schema_tables")})
+    else:
+        steps.append(AgentStep("QuestionAnalysis", get_agent(QuestionAnalyzer, llm_config), ["question", "schema"],
+                               ["analysis"]))
+    if sampling and sampling["candidates"] > 1 and not route.local_validation_only:
+        steps.append(AgentStep("SQLSampling", CandidateSampling(sql_config, sampling), ["question", "schema", "analysis"],
+                               ["sql_query", "validation_result", "self_consistency"]))
+    else:
+        steps += [
+            AgentStep("SQLGeneration", get_agent(SQLGenerator, sql_config), ["question", "schema", "analysis"], ["sql_query"]),
+            AgentStep("QueryValidation", get_agent(QueryValidator, llm_config, local_only=route.local_validation_only),
+                      ["sql_query", "schema"], ["validation_result"])
+        ]
+    if route.repair:
+        inject_fallback_step(steps, AgentStep(
+            "Fallback", FallbackPhase(llm_config, sql_config), ["validation_result", "schema"],
+            ["fallback_query", "fallback_attempts"],
+            condition=lambda state: should_run_fallback(state.get("validation_result"))
+        ))
 
     planner = Planner(steps)
     planner.run(get_state_reference())
 
-    analysis = get_state("analysis")
     sql_query = get_state("sql_query")
-    validation_result = get_state("validation_result")
-    final_query = get_state("final_query")
+    validation_result = get_state("validation_result") or {}
 
-    # Parse validation result
-    final_query = None
-    try:
-        parsed = extract_json_block(validation_result.get("content", ""))
+    if validation_result.get("is_valid"):
+        return validation_result.get("final_query") or sql_query
+    return get_state("fallback_query")
 
-        if parsed.get("is_valid"):
-            final_query = parsed.get("final_query") or sql_query
-        else:
-            final_query = run_fallback_phase(schema, analysis, parsed, sql_config, llm_config)
-    except Exception as e:
-        pass
+def answer_question(question_data, llm_config, sql_config, sampling=None, dialect=None):
+    """
+    The validated query for one question, from the answer cache or the agents, or None.
+
+    Starts a fresh per-question state, which holds everything the agents
+    produced once this returns; gold SQL is not needed.
+    """
+    dialect = dialect or get_dialect_config()
+    reset_state()
+    update_state("question_id", question_data.get("question_id"))
+    update_state("difficulty", question_data.get("difficulty"))
+    update_state("question", question_data["question"])
+    update_state("db_id", question_data["db_id"])
+    update_state("dialect", dialect["dialect"])
+    update_state("generation_dialect", dialect["generation_dialect"])
+    update_state("transpile", dialect["transpile"])
+
+    answer_cache = get_answer_cache()
+    cached = None
+    # Answers are kept per target (and generation) dialect; DDL alone does not tell them apart
+    cache_dialect = dialect_label(dialect["dialect"], dialect["generation_dialect"])
+    if answer_cache is not None:
+        with trace_span("AnswerCache"):
+            cached = answer_cache.get(question_data["db_id"], load_schema(question_data["db_id"], dialect["dialect"]),
+                                      question_data["question"], question_data.get("evidence", ""), cache_dialect)
+
+    if cached is not None:
+        # Seen this question (or a near-identical phrasing) before; skip the agents entirely
+        update_state("answer_cache", {"tier": cached.tier, "similarity": cached.similarity,
+                                      "cached_question": cached.cached_question})
+        final_query = cached.final_query
+    else:
+        final_query = generate_final_query(question_data, llm_config, sql_config, sampling)
+        if answer_cache is not None and final_query:
+            # Only validated queries get here: the validator's or the re-validated fallback's
+            answer_cache.put(question_data["db_id"], load_schema(question_data["db_id"], dialect["dialect"]),
+                             question_data["question"], question_data.get("evidence", ""), final_query, cache_dialect)
+    update_state("final_query", final_query)
+    return final_query
+
+def process_question(question_data, llm_config, sql_config, evaluator=None, sampling=None, dialect=None):
+    dialect = dialect or get_dialect_config()
+    final_query = answer_question(question_data, llm_config, sql_config, sampling, dialect)
 
     # Compare the generated query with the gold SQL
     if final_query:
+        if evaluator is not None and evaluator.has_database(question_data["db_id"]):
+            # Execution accuracy: same result rows as the (SQLite) gold query
+            gold_sql = question_data.get("gold_sql_sqlite") or question_data["gold_sql"]
+            # The databases are SQLite; a query for another dialect is transpiled there when possible
+            predicted_sql = transpile(final_query, "sqlite", dialect["dialect"]) if dialect["transpile"] else final_query
+            with trace_span("Evaluation"):
+                comparison = evaluator.compare(question_data["db_id"], gold_sql, predicted_sql)
+            is_match = comparison["match"]
+            update_state("evaluation", "execution")
+            update_state("comparison", comparison)
+            update_state("match", is_match)
+            errors = [f"{side} error: {comparison[f'{side}_error']}" for side in ("gold", "predicted")
+                      if comparison[f"{side}_error"]]
+
+            logger.info(
+                f"Question {question_data['question_id']}:\n"
+                f"Gold: {gold_sql}\n"
+                f"Generated: {final_query}\n"
+                + "".join(f"{error}\n" for error in errors)
+                + f"Match: {'CORRECT' if is_match else 'INCORRECT'} (execution)"
+            )
+            return is_match
+
         normalized_gold = normalize_sql(question_data['gold_sql'])
         normalized_generated = normalize_sql(final_query)
         is_match = normalized_gold == normalized_generated
+        update_state("evaluation", "string")
+        update_state("match", is_match)
 
-        logger.info(f"Normalized Gold: {normalized_gold}")
-        logger.info(f"Normalized Generated: {normalized_generated}")
-        logger.info(f"Match: {'CORRECT' if is_match else 'INCORRECT'}")
+        # One record per question so concurrent workers do not interleave lines
+        logger.info(
+            f"Question {question_data['question_id']}:\n"
+            f"Normalized Gold: {normalized_gold}\n"
+            f"Normalized Generated: {normalized_generated}\n"
+            f"Match: {'CORRECT' if is_match else 'INCORRECT'}"
+        )
 
         return is_match
     else:
+        update_state("match", False)
         return False
 
+def run_question(question_data, llm_config, sql_config, evaluator=None, sampling=None, dialect=None):
+    """Process one question and return its results-store record, including on failure."""
+    start = time.perf_counter()
+    record = {
+        "question_id": question_data["question_id"],
+        "db_id": question_data["db_id"],
+        "difficulty": question_data.get("difficulty"),
+        "question": question_data["question"],
+        "status": "ok",
+        "error": None
+    }
+    try:
+        process_question(question_data, llm_config, sql_config, evaluator, sampling, dialect)
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    # The state is still this question's own, since we are on the same worker thread
+    state = get_full_state()
+    record.update({
+        "final_sql": state.get("final_query"),
+        "match": bool(state.get("match")),
+        "evaluation": state.get("evaluation"),
+        "state": state,
+        "timings": {"total": time.perf_counter() - start, **get_tracer().question_timings(question_data["question_id"])}
+    })
+    return record
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the SQL multi-agent pipeline over the MINIDEV questions.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of questions processed concurrently (default: 1)")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Per-question timeout in seconds (default: no timeout)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Disable the persistent LLM response cache")
+    parser.add_argument("--cache-bypass", action="append", default=[], metavar="AGENT",
+                        help="Always call the model for this agent (repeatable)")
+    parser.add_argument("--cache-invalidate", action="append", default=[], metavar="AGENT",
+                        help="Drop cached responses for this agent, or 'all' (repeatable)")
+    parser.add_argument("--answer-cache", action="store_true",
+                        help="Replay validated answers from earlier runs and store new ones. Off by default: "
+                             "the cache key has no model, prompt or setting, so a run after changing one would "
+                             "be scored on old answers")
+    parser.add_argument("--answer-cache-invalidate", action="append", default=[], metavar="DB_ID",
+                        help="Drop cached answers for this database, or 'all' (repeatable)")
+    parser.add_argument("--candidates", type=int, default=None, metavar="K",
+                        help="Sample K SQL candidates per question and pick one by execution vote "
+                             "instead of validating a single one (default: SQL_CANDIDATES or 1)")
+    parser.add_argument("--sample-concurrency", type=int, default=None,
+                        help="Candidates sampled at once (default: K)")
+    parser.add_argument("--sample-budget", type=float, default=None, metavar="SECONDS",
+                        help="Time allowed for sampling and voting per question (default: 60)")
+    parser.add_argument("--dialect", choices=sorted(DIALECTS), default=None,
+                        help="Target SQL dialect: picks the question file, schema DDL, prompts and local "
+                             "validation (default: SQL_DIALECT or mysql)")
+    parser.add_argument("--generation-dialect", choices=sorted(DIALECTS), default=None,
+                        help="Prompt the generators in this dialect and transpile their SQL to the target "
+                             "(needs sqlglot; default: the target dialect)")
+    parser.add_argument("--no-transpile", action="store_true",
+                        help="Keep generated SQL exactly as the model wrote it")
+    parser.add_argument("--no-few-shot", action="store_true",
+                        help="Prompt without solved examples from the same database (FEW_SHOT_K sets how many; "
+                             "needs numpy)")
+    parser.add_argument("--no-value-index", action="store_true",
+                        help="Do not look up question literals among the values stored in the --db-root "
+                             "databases (compile the index ahead with python -m catalog.value_index)")
+    parser.add_argument("--route-policy", choices=POLICIES, default=None,
+                        help="Send questions estimated simple down a cheaper chain and escalate on failure "
+                             "(default: ROUTER_POLICY or off)")
+    parser.add_argument("--eval", choices=["exec", "string"], default="exec",
+                        help="Score by execution accuracy when the SQLite databases exist (default), "
+                             "or by normalized string match")
+    parser.add_argument("--db-root", default=DEFAULT_DB_ROOT,
+                        help="Directory holding <db_id>/<db_id>.sqlite files")
+    parser.add_argument("--results", default=None,
+                        help="JSONL results file, appended to per question "
+                             "(default: results/run_<timestamp>.jsonl)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip questions already completed in --results")
+    parser.add_argument("--subset", action="append", default=[], metavar="KEY=VALUE[,VALUE]",
+                        help="Only run matching questions, e.g. db_id=financial or difficulty=simple,moderate "
+                             "(repeatable; all keys must match)")
+    parser.add_argument("--trace", default=None, metavar="PATH",
+                        help="Write per-stage spans as Chrome trace JSON (chrome://tracing, Perfetto)")
+    parser.add_argument("--ollama-url", default=None, metavar="URL",
+                        help="Ollama server for both models (default: OLLAMA_BASE_URL or http://localhost:11434)")
+    queue = parser.add_argument_group("shared queue", "Spread one run over several processes or hosts")
+    queue.add_argument("--queue", default=None, metavar="PATH",
+                       help="SQLite queue file shared by the coordinator and the workers")
+    queue.add_argument("--enqueue", action="store_true",
+                       help="Add the selected questions (see --subset) to the queue, with this run's dialect "
+                            "and scoring")
+    queue.add_argument("--requeue-failed", action="store_true",
+                       help="With --enqueue, give questions that used up their attempts another round")
+    queue.add_argument("--work", action="store_true",
+                       help="Lease questions from the queue and run them with --workers in flight until it is empty")
+    queue.add_argument("--report", action="store_true",
+                       help="Print accuracy and latency over everything the queue has finished "
+                            "(and copy the records to --results if given)")
+    queue.add_argument("--wait", action="store_true",
+                       help="Workers stay until other workers' questions finish or come back; "
+                            "the report waits until the queue is drained")
+    args = parser.parse_args()
+    # Read by configure_answer_cache, which the service shares with the cache on by default
+    args.no_answer_cache = not args.answer_cache
+    if args.resume and not args.results:
+        parser.error("--resume requires --results")
+    if args.queue and not (args.enqueue or args.work or args.report):
+        parser.error("--queue needs at least one of --enqueue, --work and --report")
+    if not args.queue and (args.enqueue or args.work or args.report):
+        parser.error("--enqueue, --work and --report need --queue")
+    return args
+
+def configure_response_cache(args):
+    if args.no_cache:
+        disable_response_cache()
+        return None
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    for agent in args.cache_bypass:
+        cache.bypass(agent)
+    for agent in args.cache_invalidate:
+        removed = cache.invalidate(None if agent == "all" else agent)
+        print(f"Invalidated {removed} cached responses for {agent}")
+    return cache
+
+def configure_sampling(args, evaluator):
+    sampling = get_sampling_config()
+    if args.candidates is not None:
+        sampling["candidates"] = args.candidates
+        sampling["concurrency"] = args.candidates
+    if args.sample_concurrency is not None:
+        sampling["concurrency"] = args.sample_concurrency
+    if args.sample_budget is not None:
+        sampling["budget"] = args.sample_budget
+    # Votes execute candidates even when scoring is by string match
+    sampling["evaluator"] = evaluator or ExecutionEvaluator(args.db_root)
+    return sampling
+
+def configure_dialect(args):
+    dialect = get_dialect_config()
+    if args.dialect:
+        dialect["dialect"] = args.dialect
+    if args.generation_dialect:
+        dialect["generation_dialect"] = args.generation_dialect
+    if args.no_transpile:
+        dialect["transpile"] = False
+    target = get_dialect(dialect["dialect"]).name
+    source = get_dialect(dialect["generation_dialect"] or target).name
+    if source != target and not (dialect["transpile"] and transpile_available()):
+        print(f"Warning: SQL is generated as {source} but not transpiled to {target} "
+              f"(transpiling needs sqlglot and no --no-transpile)")
+    return dialect
+
+def configure_few_shot(args, dialect):
+    if args.no_few_shot:
+        disable_example_index()
+        return
+    # Build or map the index before the workers start, so no question pays for it
+    if get_few_shot_config()["enabled"] and get_example_index(dialect["generation_dialect"] or dialect["dialect"]) is None:
+        print("Warning: few-shot examples need numpy; prompts stay zero-shot")
+
+def configure_value_index(args):
+    if args.no_value_index:
+        disable_value_index()
+        return
+    set_value_index_root(args.db_root)
+    # Map (or build) every database's index before the workers start
+    for db_id in get_schema_catalog().databases:
+        get_value_index(db_id)
+
+def configure_answer_cache(args):
+    if args.no_answer_cache:
+        disable_answer_cache()
+        return None
+    cache = get_answer_cache()
+    if cache is None:
+        return None
+    for db_id in args.answer_cache_invalidate:
+        removed = cache.invalidate(None if db_id == "all" else db_id)
+        print(f"Invalidated {removed} cached answers for {db_id}")
+    return cache
+
+def run_queue(args, llm_config, sql_config):
+    """Coordinator, worker and report roles of a run shared through a queue file."""
+    config = get_queue_config()
+    queue = WorkQueue(args.queue, config["lease_seconds"], config["max_attempts"], config["wal"])
+
+    if args.enqueue:
+        dialect = configure_dialect(args)
+        questions = load_questions(dialect["dialect"])
+        if args.eval == "exec":
+            gold_sqlite = load_execution_gold()
+            for question_data in questions:
+                question_data["gold_sql_sqlite"] = gold_sqlite.get(question_data["question_id"])
+        selected = select_questions(questions, args.subset)
+        # Workers follow the coordinator's settings, so every host scores the same way
+        queue.set_meta("dialect", dialect)
+        queue.set_meta("eval", args.eval)
+        added = queue.enqueue(selected, requeue_failed=args.requeue_failed)
+        print(f"Queued {added} of {len(selected)} selected questions in {args.queue}")
+
+    if args.work:
+        dialect = queue.get_meta("dialect")
+        if dialect is None:
+            raise SystemExit(f"Nothing has been enqueued in {args.queue}")
+        configure_few_shot(args, dialect)
+        configure_value_index(args)
+        evaluator = ExecutionEvaluator(args.db_root) if queue.get_meta("eval") == "exec" else None
+        sampling = configure_sampling(args, evaluator)
+        store = ResultsStore(args.results) if args.results else None
+
+        def report(question_data, record):
+            if store is not None:
+                store.append(record)
+            print(f"\nFinished question {question_data['question_id']} ({record['status']}, "
+                  f"{record['timings']['total']:.1f}s) on {question_data['db_id']}")
+            print("-" * 80)
+            if record["status"] != "ok":
+                logger.info(f"Question {question_data['question_id']}: {record['status'].upper()} - {record['error']}")
+                logger.info("-" * 80)
+
+        ran = run_worker(
+            queue,
+            lambda question_data: run_question(question_data, llm_config, sql_config, evaluator, sampling, dialect),
+            workers=args.workers,
+            timeout=args.timeout,
+            poll_interval=config["poll_interval"],
+            wait=args.wait,
+            on_result=report
+        )
+        logger.info(f"\nWorker ran {ran} questions")
+        for line in format_summary(get_tracer().summary()):
+            logger.info(line)
+        if get_router().policy != "off":
+            for line in format_route_stats(get_router().stats()):
+                logger.info(line)
+
+    if args.report:
+        while args.wait and not queue.drained():
+            time.sleep(config["poll_interval"])
+        records = queue.records()
+        if args.results and not args.work:
+            store = ResultsStore(args.results)
+            for record in records:
+                store.append(record)
+        logger.info("\nQueue Report:")
+        for line in format_report(aggregate_report(records, queue.counts())):
+            print(line)
+            logger.info(line)
+    queue.close()
+
 def main():
+    args = parse_args()
+    cache = configure_response_cache(args)
+    answer_cache = configure_answer_cache(args)
+
     # Get LLM configuration
     llm_config = get_llm_config()
     sql_config = get_sqlcoder_config()
+    if args.ollama_url:
+        for config in (llm_config, sql_config):
+            config["config_list"][0]["base_url"] = args.ollama_url
+    if args.route_policy:
+        get_router().policy = args.route_policy
+    if args.queue:
+        run_queue(args, llm_config, sql_config)
+        return
     
     # Load all questions
-    questions = load_questions()
-    
+    dialect = configure_dialect(args)
+    questions = load_questions(dialect["dialect"])
+    configure_few_shot(args, dialect)
+    configure_value_index(args)
+
+    evaluator = None
+    if args.eval == "exec":
+        evaluator = ExecutionEvaluator(args.db_root)
+        gold_sqlite = load_execution_gold()
+        for question_data in questions:
+            question_data["gold_sql_sqlite"] = gold_sqlite.get(question_data["question_id"])
+    sampling = configure_sampling(args, evaluator)
+
+    store = ResultsStore(args.results or f'results/run_{datetime.now().strftime("%Y%m%d_%H%M%S")}.jsonl')
+    selected = select_questions(questions, args.subset)
+    completed = store.completed_ids() if args.resume else set()
+    pending = [question_data for question_data in selected if question_data["question_id"] not in completed]
+    print(f"Writing results to {store.path}: {len(pending)} of {len(selected)} selected questions to run")
+
     # Track statistics
-    total_questions = len(questions)
-    correct_matches = 0
-    
-    # Process each question sequentially
-    for i, question_data in enumerate(questions, 1):
-        print(f"\nProcessing question {i} of {total_questions}")
+    total_questions = len(selected)
+
+    def report(index, outcome):
+        question_data = pending[index]
+        record = outcome["result"]
+        if record is None:
+            # Timed out or failed outside process_question; no state to keep
+            record = {
+                "question_id": question_data["question_id"],
+                "db_id": question_data["db_id"],
+                "difficulty": question_data.get("difficulty"),
+                "question": question_data["question"],
+                "status": outcome["status"],
+                "error": outcome["error"],
+                "final_sql": None,
+                "match": False,
+                "timings": {"total": outcome["elapsed"]}
+            }
+        store.append(record)
+
+        print(f"\nFinished question {index + 1} of {len(pending)} ({record['status']}, {outcome['elapsed']:.1f}s)")
         print(f"Question: {question_data['question']}")
         print(f"Database: {question_data['db_id']}")
         print("-" * 80)
-        
-        try:
-            is_match = process_question(question_data, llm_config, sql_config)
-            if is_match:
-                correct_matches += 1
-        except Exception as e:
-            logger.info(f"Question {question_data['question_id']}: ERROR - {str(e)}")
+        if record["status"] != "ok":
+            logger.info(f"Question {question_data['question_id']}: {record['status'].upper()} - {record['error']}")
             logger.info("-" * 80)
-            continue
+
+    # Process questions with bounded concurrency; each question gets its own state
+    run_batch(
+        pending,
+        lambda question_data: run_question(question_data, llm_config, sql_config, evaluator, sampling, dialect),
+        workers=args.workers,
+        timeout=args.timeout,
+        on_result=report
+    )
+
+    # Statistics cover resumed results as well as this run's
+    latest = store.latest()
+    records = [latest[q["question_id"]] for q in selected if q["question_id"] in latest]
+    correct_matches = sum(1 for record in records if record.get("match"))
     
     # Log final statistics
-    accuracy = (correct_matches / total_questions) * 100
+    accuracy = (correct_matches / total_questions) * 100 if total_questions else 0.0
     logger.info(f"\nFinal Statistics:")
     logger.info(f"Total Questions: {total_questions}")
     logger.info(f"Correct Matches: {correct_matches}")
+    logger.info(f"Errors: {sum(1 for record in records if record.get('status') == 'error')}")
+    logger.info(f"Timed Out: {sum(1 for record in records if record.get('status') == 'timeout')}")
     logger.info(f"Accuracy: {accuracy:.2f}%")
+    logger.info(f"Results: {store.path}")
+    for line in format_summary(get_tracer().summary()):
+        logger.info(line)
+    if get_router().policy != "off":
+        logger.info(f"Routing ({get_router().policy}):")
+        for line in format_route_stats(get_router().stats()):
+            logger.info(line)
+    if args.trace:
+        get_tracer().export_chrome_trace(args.trace)
+        logger.info(f"Trace: {args.trace}")
+    if cache is not None:
+        stats = cache.stats()
+        logger.info(f"LLM Cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+        for agent, counts in stats["per_agent"].items():
+            logger.info(f"  {agent}: {counts['hits']} hits, {counts['misses']} misses")
+    if answer_cache is not None:
+        stats = answer_cache.stats()
+        logger.info(f"Answer Cache: {stats['exact_hits']} exact hits, {stats['approximate_hits']} approximate hits, "
+                    f"{stats['misses']} misses, {stats['entries']} entries")
+    for base_url, dispatcher in all_dispatchers().items():
+        stats = dispatcher.stats()
+        logger.info(f"Dispatcher {base_url}: {stats['granted']} requests, {stats['model_switches']} model switches, "
+                    f"max queue depth {stats['max_queue_depth']}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,291 @@
+"""
+Resident text-to-SQL service: the agent pipeline behind a local HTTP/JSON API.
+
+    python serve.py --port 8080 --workers 4 --max-queue 32
+
+    POST /v1/sql   {"question": "...", "evidence": "...", "db_id": "financial"}
+    GET  /healthz  liveness, queue depth and capacity
+    GET  /metrics  request counts, latency percentiles, per-stage latencies, cache and dispatcher stats
+
+The schema catalog, linker indexes, few-shot and value indexes and one set of
+agents per worker thread are built at startup and kept warm. Identical requests (same
+database, question and evidence up to case and spacing) that arrive while one
+is being answered share its run. When every worker is busy and `--max-queue`
+requests are waiting, new ones get 503 with Retry-After at once.
+"""
+import argparse
+import json
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+
+from agents.fallback_sql_generator import FallbackSQLGenerator
+from agents.query_validator import QueryValidator
+from agents.question_analyzer import QuestionAnalyzer
+from agents.registry import get_agent, get_agent_registry
+from agents.sql_generator import SQLGenerator
+from catalog.dialects import DIALECTS
+from catalog.schema_catalog import get_schema_catalog
+from catalog.schema_linker import get_schema_linker
+from control.coalescer import CoalescingExecutor, QueueFull
+from evaluation.execution_evaluator import DEFAULT_DB_ROOT, ExecutionEvaluator
+from llm.dispatcher import all_dispatchers
+from llm_config import get_llm_config, get_sqlcoder_config
+from planning.router import POLICIES, get_router
+from planning.tracing import get_tracer, percentile
+from run_pipeline import (answer_question, configure_answer_cache, configure_dialect, configure_few_shot,
+                          configure_response_cache, configure_sampling, configure_value_index)
+from state.answer_cache import get_answer_cache
+from state.response_cache import get_response_cache
+from state.shared_state import get_full_state
+from text_utils import canonical_text
+
+MAX_BODY_BYTES = 64 * 1024
+# Request latencies kept for the percentiles in /metrics
+LATENCY_WINDOW = 10000
+
+
+class SQLService:
+    def __init__(self, llm_config: dict, sql_config: dict, dialect: dict, sampling: dict = None,
+                 workers: int = 4, max_queue: int = 32, timeout: float = 300.0):
+        self.llm_config = llm_config
+        self.sql_config = sql_config
+        self.dialect = dialect
+        self.sampling = sampling
+        self.timeout = timeout
+        self.executor = CoalescingExecutor(workers, max_queue)
+        self.started = time.time()
+        self.counts = {"requests": 0, "ok": 0, "unanswered": 0, "errors": 0, "bad_requests": 0,
+                       "rejected": 0, "timeouts": 0}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._ids = count(1)
+        self._lock = threading.Lock()
+
+    def warm(self) -> None:
+        """Load everything a first request would otherwise pay for."""
+        catalog = get_schema_catalog()
+        linker = get_schema_linker()
+        for db_id in catalog.databases:
+            linker.index(db_id)
+
+        def build_agents():
+            # Agents are kept per thread by the registry, so each worker builds its own
+            get_agent(QuestionAnalyzer, self.llm_config)
+            get_agent(SQLGenerator, self.sql_config)
+            get_agent(QueryValidator, self.llm_config)
+            get_agent(FallbackSQLGenerator, self.sql_config)
+        self.executor.warm(build_agents)
+
+    def _count(self, key: str, elapsed: float = None) -> None:
+        with self._lock:
+            self.counts[key] += 1
+            if elapsed is not None:
+                self.latencies.append(elapsed)
+
+    def _answer(self, question_data: dict) -> dict:
+        start = time.perf_counter()
+        final_query = answer_question(question_data, self.llm_config, self.sql_config, self.sampling, self.dialect)
+        state = get_full_state()
+        return {
+            "request_id": question_data["question_id"],
+            "db_id": question_data["db_id"],
+            "sql": final_query,
+            "valid": bool(final_query),
+            "validation": state.get("validation_result"),
+            "values": state.get("values"),
+            "answer_cache": state.get("answer_cache"),
+            "elapsed_s": time.perf_counter() - start,
+            "timings": get_tracer().question_timings(question_data["question_id"])
+        }
+
+    def handle(self, request: dict):
+        """(HTTP status, response body, extra headers) for one /v1/sql request."""
+        start = time.perf_counter()
+        self._count("requests")
+        question = request.get("question") if isinstance(request, dict) else None
+        db_id = request.get("db_id") if isinstance(request, dict) else None
+        evidence = (request.get("evidence") or "") if isinstance(request, dict) else ""
+        if not isinstance(question, str) or not question.strip() or not isinstance(db_id, str):
+            self._count("bad_requests")
+            return 400, {"error": "Expected a JSON object with string 'question' and 'db_id'"}, {}
+        if db_id not in get_schema_catalog():
+            self._count("bad_requests")
+            return 400, {"error": f"Unknown db_id: {db_id}"}, {}
+
+        question_data = {"question_id": f"req-{next(self._ids)}", "db_id": db_id, "question": question,
+                         "evidence": str(evidence), "difficulty": request.get("difficulty")}
+        key = (db_id, canonical_text(question), canonical_text(str(evidence)))
+        try:
+            future, coalesced = self.executor.submit(key, self._answer, question_data)
+        except QueueFull as e:
+            self._count("rejected")
+            return 503, {"error": f"Service busy: {e}"}, {"Retry-After": "1"}
+        try:
+            result = future.result(self.timeout)
+        except FutureTimeout:
+            # The run goes on; requests for the same question still join it
+            self._count("timeouts")
+            return 504, {"error": f"No answer within {self.timeout}s"}, {}
+        except Exception as e:
+            self._count("errors", time.perf_counter() - start)
+            return 500, {"error": str(e)}, {}
+        self._count("ok" if result["valid"] else "unanswered", time.perf_counter() - start)
+        return 200, {**result, "coalesced": coalesced}, {}
+
+    def health(self) -> dict:
+        stats = self.executor.stats()
+        return {"status": "ok", "uptime_s": time.time() - self.started, "queue_depth": stats["queue_depth"],
+                "running": stats["running"], "capacity": stats["workers"] + stats["max_queue"]}
+
+    def metrics(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+            latencies = sorted(self.latencies)
+        stages = {
+            stage: {key: stats[key] for key in ("count", "errors", "llm_calls", "mean", "p50", "p95", "p99")}
+            for stage, stats in get_tracer().summary()["stages"].items()
+        }
+        response_cache, answer_cache = get_response_cache(), get_answer_cache()
+        registry = get_agent_registry()
+        return {
+            "requests": counts,
+            "executor": self.executor.stats(),
+            "latency_s": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+                          "p99": percentile(latencies, 99), "window": len(latencies)},
+            "stages": stages,
+            "routes": {"policy": get_router().policy, **get_router().stats()},
+            "agents": {"created": registry.created, "reused": registry.reused},
+            "response_cache": response_cache.stats() if response_cache is not None else None,
+            "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+            "dispatchers": {base_url: dispatcher.stats() for base_url, dispatcher in all_dispatchers().items()}
+        }
+
+
+def make_handler(service: SQLService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status: int, body: dict, headers: dict = None) -> None:
+            data = json.dumps(body, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/healthz":
+                self._reply(200, service.health())
+            elif self.path == "/metrics":
+                self._reply(200, service.metrics())
+            else:
+                self._reply(404, {"error": f"Not found: {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/v1/sql":
+                self._reply(404, {"error": f"Not found: {self.path}"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                self.close_connection = True
+                self._reply(413, {"error": f"Body over {MAX_BODY_BYTES} bytes"})
+                return
+            try:
+                request = json.loads(self.rfile.read(length) or b"null")
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                self._reply(400, {"error": "Body is not valid JSON"})
+                return
+            self._reply(*service.handle(request))
+
+    return Handler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the SQL multi-agent pipeline over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Questions answered at once (default: 4)")
+    parser.add_argument("--max-queue", type=int, default=32,
+                        help="Requests that may wait for a worker before new ones get 503 (default: 32)")
+    parser.add_argument("--timeout", type=float, default=300.0,
+                        help="Seconds a request waits for its answer before getting 504 (default: 300)")
+    parser.add_argument("--max-spans", type=int, default=50000,
+                        help="Trace spans kept for the per-stage latencies in /metrics (default: 50000)")
+    parser.add_argument("--ollama-url", default=None, metavar="URL",
+                        help="Ollama server for both models (default: OLLAMA_BASE_URL or http://localhost:11434)")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the persistent LLM response cache")
+    parser.add_argument("--no-answer-cache", action="store_true",
+                        help="Always run the agents, without replaying or storing validated answers")
+    parser.add_argument("--no-few-shot", action="store_true",
+                        help="Prompt without solved examples from the same database")
+    parser.add_argument("--no-value-index", action="store_true",
+                        help="Do not look up question literals among the values stored in the --db-root databases")
+    parser.add_argument("--candidates", type=int, default=None, metavar="K",
+                        help="Sample K SQL candidates per question and pick one by execution vote")
+    parser.add_argument("--route-policy", choices=POLICIES, default=None,
+                        help="Send questions estimated simple down a cheaper chain and escalate on failure "
+                             "(default: ROUTER_POLICY or off)")
+    parser.add_argument("--dialect", choices=sorted(DIALECTS), default=None,
+                        help="Target SQL dialect (default: SQL_DIALECT or mysql)")
+    parser.add_argument("--generation-dialect", choices=sorted(DIALECTS), default=None,
+                        help="Prompt the generators in this dialect and transpile their SQL to the target")
+    parser.add_argument("--no-transpile", action="store_true",
+                        help="Keep generated SQL exactly as the model wrote it")
+    parser.add_argument("--db-root", default=DEFAULT_DB_ROOT,
+                        help="Directory holding <db_id>/<db_id>.sqlite files, for value lookup and candidate voting")
+    args = parser.parse_args()
+    # Settings the shared run_pipeline configure_* helpers read
+    args.cache_bypass, args.cache_invalidate, args.answer_cache_invalidate = [], [], []
+    args.sample_concurrency = args.sample_budget = None
+    return args
+
+
+def main():
+    args = parse_args()
+    configure_response_cache(args)
+    configure_answer_cache(args)
+    llm_config = get_llm_config()
+    sql_config = get_sqlcoder_config()
+    if args.ollama_url:
+        for config in (llm_config, sql_config):
+            config["config_list"][0]["base_url"] = args.ollama_url
+    dialect = configure_dialect(args)
+    configure_few_shot(args, dialect)
+    configure_value_index(args)
+    sampling = None
+    if args.candidates and args.candidates > 1:
+        sampling = configure_sampling(args, ExecutionEvaluator(args.db_root))
+    get_tracer().limit(args.max_spans)
+    if args.route_policy:
+        get_router().policy = args.route_policy
+
+    service = SQLService(llm_config, sql_config, dialect, sampling, args.workers, args.max_queue, args.timeout)
+    start = time.perf_counter()
+    service.warm()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    server.daemon_threads = True
+    print(f"Serving on http://{args.host}:{server.server_address[1]} "
+          f"({args.workers} workers, warm in {time.perf_counter() - start:.1f}s)", flush=True)
+
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
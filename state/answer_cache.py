@@ -0,0 +1,323 @@
+"""
+Answer-level cache: previously validated SQL for a question against a schema.
+
+An exact hit needs the same canonical question, evidence, database, SQL
+dialect and schema fingerprint. The optional approximate tier finds near-duplicate phrasings of a
+cached question with a MinHash/LSH index over question words. A candidate only
+answers when its estimated similarity clears a threshold, its evidence is the
+same, and the two questions have the same words in the same order apart from
+filler ("the", "please", "show me", ...), so a changed name, number, negation
+or argument order is never a hit.
+"""
+import hashlib
+import re
+import sqlite3
+import struct
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from llm_config import get_answer_cache_config
+from text_utils import canonical_text
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+# Fixed permutations so signatures stored in the database stay comparable across runs
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.blake2b(b"a%d" % i, digest_size=8).digest(), "big") % (_PRIME - 1) + 1,
+     int.from_bytes(hashlib.blake2b(b"b%d" % i, digest_size=8).digest(), "big") % _PRIME)
+    for i in range(NUM_PERM)
+]
+
+_WORD = re.compile(r"[a-z0-9]+(?:['.][a-z0-9]+)*")
+# Words that can be added, dropped or swapped without changing what is asked.
+# Negations, comparatives and prepositions are deliberately absent.
+FILLER_WORDS = {
+    "a", "an", "the", "of", "please", "can", "could", "would", "you", "me", "tell", "show", "list", "give",
+    "find", "what", "which", "is", "are", "was", "were", "be", "do", "does", "there", "that", "those",
+    "these", "all", "provide", "identify", "return"
+}
+
+
+def dialect_label(dialect: str, generation_dialect: Optional[str] = None) -> str:
+    """The `dialect` an answer cache entry is kept under: the target, and the generation dialect when it differs."""
+    if generation_dialect and generation_dialect != dialect:
+        return f"{dialect}<{generation_dialect}"
+    return dialect
+
+
+def schema_fingerprint(schema: str) -> str:
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()[:16]
+
+
+def shingles(text: str) -> Set[str]:
+    return set(_WORD.findall(canonical_text(text)))
+
+
+def content_words(text: str) -> List[str]:
+    return [word for word in _WORD.findall(canonical_text(text)) if word not in FILLER_WORDS]
+
+
+def same_content(question_a: str, question_b: str) -> bool:
+    """True when the questions have the same non-filler words in the same order."""
+    return content_words(question_a) == content_words(question_b)
+
+
+def minhash(text: str) -> Tuple[int, ...]:
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+              for s in shingles(text)] or [0]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _bands(signature: Tuple[int, ...]) -> List[Tuple[int, bytes]]:
+    return [(band, struct.pack(f"<{ROWS}Q", *signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+
+@dataclass
+class AnswerHit:
+    final_query: str
+    tier: str  # "exact" or "approximate"
+    similarity: float
+    cached_question: str
+
+
+class _ScopeIndex:
+    """LSH buckets over the cached questions for one (db_id, dialect, schema fingerprint)."""
+
+    def __init__(self):
+        self.buckets: Dict[Tuple[int, bytes], Set[str]] = {}
+        self.signatures: Dict[str, Tuple[int, ...]] = {}
+
+    def add(self, key: str, signature: Tuple[int, ...]) -> None:
+        self.signatures[key] = signature
+        for band in _bands(signature):
+            self.buckets.setdefault(band, set()).add(key)
+
+    def candidates(self, signature: Tuple[int, ...]) -> Set[str]:
+        found: Set[str] = set()
+        for band in _bands(signature):
+            found |= self.buckets.get(band, set())
+        return found
+
+
+class AnswerCache:
+    """
+    Maps (db_id, dialect, schema fingerprint, canonical question, canonical evidence) to a validated final query.
+
+    `dialect` labels the SQL the answers are written in (see `dialect_label`);
+    dialects share a cache file without seeing or evicting each other's
+    answers. Entries expire `ttl` seconds after they were stored (0 keeps them
+    until evicted) and are evicted least-recently-used beyond `max_entries`.
+    Storing an answer for a database and dialect under a new schema
+    fingerprint drops the entries for its old schema in that dialect.
+    """
+
+    def __init__(self, path: str, max_entries: int = 20000, ttl: float = 0, approximate: bool = True,
+                 min_similarity: float = 0.7):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.approximate = approximate
+        self.min_similarity = min_similarity
+        self.hits = {"exact": 0, "approximate": 0}
+        self.misses = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+        self._indexes: Dict[Tuple[str, str, str], _ScopeIndex] = {}
+        self._fingerprints: Dict[Tuple[str, str], str] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                db_id TEXT NOT NULL,
+                schema_hash TEXT NOT NULL,
+                question TEXT NOT NULL,
+                evidence TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                final_query TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(answers)")}
+        if "dialect" not in columns:
+            # Files from before answers were kept per dialect; their rows never match a new key
+            self._conn.execute("ALTER TABLE answers ADD COLUMN dialect TEXT NOT NULL DEFAULT ''")
+            self._conn.execute("DROP INDEX IF EXISTS answers_scope")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_lru ON answers(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_scope ON answers(db_id, dialect, schema_hash)")
+        self._count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    @staticmethod
+    def make_key(db_id: str, schema_hash: str, question: str, evidence: str, dialect: str = "") -> str:
+        payload = "\x1f".join([db_id, dialect, schema_hash, canonical_text(question), canonical_text(evidence)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return bool(self.ttl) and now - created > self.ttl
+
+    def get(self, db_id: str, schema: str, question: str, evidence: str = "",
+            dialect: str = "") -> Optional[AnswerHit]:
+        schema_hash = schema_fingerprint(schema)
+        key = self.make_key(db_id, schema_hash, question, evidence, dialect)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT final_query, created, question FROM answers WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is not None and self._expired(row[1], now):
+                self._delete([key])
+                row = None
+            if row is not None:
+                self._conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (now, key))
+                self.hits["exact"] += 1
+                return AnswerHit(row[0], "exact", 1.0, row[2])
+
+            hit = self._approximate(db_id, dialect, schema_hash, question, evidence, now) if self.approximate else None
+            if hit is None:
+                self.misses += 1
+            else:
+                self.hits["approximate"] += 1
+            return hit
+
+    def _approximate(self, db_id: str, dialect: str, schema_hash: str, question: str, evidence: str,
+                     now: float) -> Optional[AnswerHit]:
+        signature = minhash(question)
+        index = self._scope_index(db_id, dialect, schema_hash)
+        evidence = canonical_text(evidence)
+        scored = []
+        for key in index.candidates(signature):
+            score = similarity(signature, index.signatures[key])
+            if score >= self.min_similarity:
+                scored.append((score, key))
+
+        hit = None
+        expired = []
+        for score, key in sorted(scored, reverse=True):
+            row = self._conn.execute(
+                "SELECT final_query, created, question, evidence FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._expired(row[1], now):
+                # A stale neighbour does not hide the live ones behind it
+                expired.append(key)
+                continue
+            if row[3] == evidence and same_content(row[2], question):
+                self._conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (now, key))
+                hit = AnswerHit(row[0], "approximate", score, row[2])
+                break
+        self._delete(expired)
+        return hit
+
+    def _scope_index(self, db_id: str, dialect: str, schema_hash: str) -> _ScopeIndex:
+        scope = (db_id, dialect, schema_hash)
+        if scope not in self._indexes:
+            index = _ScopeIndex()
+            rows = self._conn.execute(
+                "SELECT key, signature FROM answers WHERE db_id = ? AND dialect = ? AND schema_hash = ?", scope)
+            for key, blob in rows:
+                index.add(key, tuple(array("Q", blob)))
+            self._indexes[scope] = index
+        return self._indexes[scope]
+
+    def put(self, db_id: str, schema: str, question: str, evidence: str, final_query: str,
+            dialect: str = "") -> None:
+        """Remember a validated `final_query`, written in `dialect`, for this question."""
+        schema_hash = schema_fingerprint(schema)
+        key = self.make_key(db_id, schema_hash, question, evidence, dialect)
+        signature = minhash(question)
+        now = time.time()
+        with self._lock:
+            if self._fingerprints.get((db_id, dialect)) != schema_hash:
+                # First answer seen for this schema version; anything cached for another in this dialect is stale
+                self._fingerprints[(db_id, dialect)] = schema_hash
+                stale = self._conn.execute(
+                    "SELECT key FROM answers WHERE db_id = ? AND dialect = ? AND schema_hash != ?",
+                    (db_id, dialect, schema_hash)).fetchall()
+                self._delete([row[0] for row in stale])
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, db_id, dialect, schema_hash, question, evidence, signature, "
+                "final_query, created, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, db_id, dialect, schema_hash, question, canonical_text(evidence),
+                 array("Q", signature).tobytes(), final_query, now, now)
+            )
+            if (db_id, dialect, schema_hash) in self._indexes:
+                self._indexes[(db_id, dialect, schema_hash)].add(key, signature)
+            self.stores += 1
+            self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _delete(self, keys: List[str]) -> None:
+        if not keys:
+            return
+        self._conn.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key in keys])
+        self._count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        # Rebuilt lazily from the table on the next approximate lookup
+        self._indexes.clear()
+
+    def _evict(self) -> None:
+        self._count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if self._count <= self.max_entries:
+            return
+        # Trim 10% below the cap so eviction does not run on every insert
+        excess = self._count - int(self.max_entries * 0.9)
+        keys = [row[0] for row in
+                self._conn.execute("SELECT key FROM answers ORDER BY last_access LIMIT ?", (excess,))]
+        self._delete(keys)
+
+    def invalidate(self, db_id: Optional[str] = None) -> int:
+        """Drop cached answers for one database, or for all databases when `db_id` is None."""
+        with self._lock:
+            if db_id is None:
+                cursor = self._conn.execute("DELETE FROM answers")
+            else:
+                cursor = self._conn.execute("DELETE FROM answers WHERE db_id = ?", (db_id,))
+            self._count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            self._indexes.clear()
+            self._fingerprints.clear()
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        return {
+            "entries": self._count,
+            "exact_hits": self.hits["exact"],
+            "approximate_hits": self.hits["approximate"],
+            "misses": self.misses,
+            "stores": self.stores
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_answer_cache: Optional[AnswerCache] = None
+_answer_cache_disabled = False
+_answer_cache_lock = threading.Lock()
+
+def disable_answer_cache() -> None:
+    """Turn the answer cache off for the rest of the process."""
+    global _answer_cache_disabled
+    _answer_cache_disabled = True
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Return the process-wide answer cache, or None when it is disabled."""
+    global _answer_cache
+    config = get_answer_cache_config()
+    if _answer_cache_disabled or not config["enabled"]:
+        return None
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache(config["path"], config["max_entries"], config["ttl"],
+                                        config["approximate"], config["min_similarity"])
+        return _answer_cache
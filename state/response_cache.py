@@ -0,0 +1,142 @@
+"""
+Persistent, content-addressed cache of LLM responses backed by SQLite.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from llm_config import get_cache_config
+
+
+class ResponseCache:
+    """
+    Maps (model, system message, prompt, temperature) to the model's reply.
+
+    Entries are evicted least-recently-used once `max_entries` is exceeded.
+    Hit and miss counters are kept per agent for the lifetime of the process.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50000, bypass_agents: Iterable[str] = ()):
+        self.path = path
+        self.max_entries = max_entries
+        self.bypass_agents = set(bypass_agents)
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                agent TEXT NOT NULL,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_agent ON responses(agent)")
+        self._count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, system_message: str, prompt: str, temperature: Optional[float],
+                 response_format: Optional[dict] = None, options: Optional[dict] = None) -> str:
+        parts = [model, system_message, prompt, temperature]
+        # Only constrained or sampled calls carry these, so existing keys stay valid
+        if response_format is not None:
+            parts.append(response_format)
+        if options:
+            parts.append({"options": options})
+        payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def is_bypassed(self, agent: str) -> bool:
+        return agent in self.bypass_agents
+
+    def bypass(self, agent: str) -> None:
+        """Send every call from `agent` to the model without reading or writing the cache."""
+        self.bypass_agents.add(agent)
+
+    def get(self, key: str, agent: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses[agent] = self.misses.get(agent, 0) + 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits[agent] = self.hits.get(agent, 0) + 1
+            return row[0]
+
+    def put(self, key: str, agent: str, model: str, response: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, agent, model, response, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, agent, model, response, time.time())
+            )
+            # Upper bound: replacing an existing key (or another process) may skew it
+            self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        self._count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if self._count <= self.max_entries:
+            return
+        # Trim 10% below the cap so eviction does not run on every insert
+        excess = self._count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+            (excess,)
+        )
+        self._count -= excess
+
+    def invalidate(self, agent: Optional[str] = None) -> int:
+        """Drop cached responses for one agent, or for every agent when `agent` is None."""
+        with self._lock:
+            if agent is None:
+                cursor = self._conn.execute("DELETE FROM responses")
+            else:
+                cursor = self._conn.execute("DELETE FROM responses WHERE agent = ?", (agent,))
+            self._count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        agents = sorted(set(self.hits) | set(self.misses))
+        return {
+            "entries": self._count,
+            "hits": sum(self.hits.values()),
+            "misses": sum(self.misses.values()),
+            "per_agent": {
+                agent: {"hits": self.hits.get(agent, 0), "misses": self.misses.get(agent, 0)}
+                for agent in agents
+            }
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_response_cache: Optional[ResponseCache] = None
+_cache_disabled = False
+_cache_lock = threading.Lock()
+
+def disable_response_cache() -> None:
+    """Turn the cache off for the rest of the process, e.g. for a --no-cache run."""
+    global _cache_disabled
+    _cache_disabled = True
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Return the process-wide cache, or None when caching is disabled."""
+    global _response_cache
+    config = get_cache_config()
+    if _cache_disabled or not config["enabled"]:
+        return None
+    with _cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(config["path"], config["max_entries"], config["bypass_agents"])
+        return _response_cache
@@ -0,0 +1,103 @@
+"""
+Append-only JSONL store for per-question benchmark results.
+
+Every finished question is written and flushed immediately, so a run that dies
+part-way keeps everything completed so far and can be resumed from the file.
+A line torn by a crash mid-write is cut off before the next append, so the
+record written after it is not lost with it.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+
+class ResultsStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._tail_checked = False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _truncate_torn_tail(self) -> None:
+        """Drop a last line without its newline, left by a crash while it was being written."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # Walk back to the end of the last complete line
+            end = size
+            while end > 0:
+                start = max(0, end - 65536)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, default=str, ensure_ascii=False)
+        with self._lock:
+            if not self._tail_checked:
+                self._truncate_torn_tail()
+                self._tail_checked = True
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A torn last line not yet cut off by append
+
+    def latest(self) -> Dict[Any, Dict[str, Any]]:
+        """The most recent record per question_id."""
+        return {record.get("question_id"): record for record in self.records()}
+
+    def completed_ids(self) -> Set[Any]:
+        """Questions that finished; errors and timeouts are retried on resume."""
+        return {qid for qid, record in self.latest().items() if record.get("status") == "ok"}
+
+
+def select_questions(questions: List[dict], subset: Optional[List[str]] = None,
+                     skip_ids: Optional[Set[Any]] = None) -> List[dict]:
+    """
+    Filter questions by `KEY=VALUE[,VALUE...]` expressions and drop `skip_ids`.
+
+    Supported keys are db_id, difficulty and question_id. Different keys must
+    all match; values for the same key are alternatives.
+    """
+    filters: Dict[str, Set[str]] = {}
+    for expression in subset or []:
+        key, sep, values = expression.partition("=")
+        key = key.strip()
+        if not sep or key not in ("db_id", "difficulty", "question_id"):
+            raise ValueError(f"Invalid subset '{expression}'; expected db_id=..., difficulty=... or question_id=...")
+        filters.setdefault(key, set()).update(value.strip() for value in values.split(",") if value.strip())
+
+    skip_ids = skip_ids or set()
+    return [
+        question for question in questions
+        if question["question_id"] not in skip_ids
+        and all(str(question.get(key)) in values for key, values in filters.items())
+    ]
@@ -1,20 +1,31 @@
+from contextvars import ContextVar
 from typing import Any, Dict
 
-# Global state dictionary
-_agent_state: Dict[str, Any] = {}
+# Per-question state dictionary. Each thread (and each asyncio task) sees its
+# own dict, so concurrent questions never share or clobber each other's state.
+_agent_state: ContextVar[Dict[str, Any]] = ContextVar("agent_state")
+
+def _current_state() -> Dict[str, Any]:
+    try:
+        return _agent_state.get()
+    except LookupError:
+        state: Dict[str, Any] = {}
+        _agent_state.set(state)
+        return state
 
 def get_state(key: str) -> Any:
-    return _agent_state.get(key)
+    return _current_state().get(key)
 
 def update_state(key: str, value: Any) -> None:
-    _agent_state[key] = value
+    _current_state()[key] = value
 
-def reset_state() -> None:
-    global _agent_state
-    _agent_state = {}
+def reset_state() -> Dict[str, Any]:
+    state: Dict[str, Any] = {}
+    _agent_state.set(state)
+    return state
 
 def get_full_state() -> Dict[str, Any]:
-    return dict(_agent_state)
+    return dict(_current_state())
 
 def get_state_reference():
-    return _agent_state  # the global dict object
\ No newline at end of file
+    return _current_state()  # the dict object for the current question
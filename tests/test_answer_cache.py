@@ -0,0 +1,52 @@
+"""Answer cache lookups, exact and approximate."""
+import time
+
+from state.answer_cache import AnswerCache, minhash, similarity
+
+DB_ID = "debit_card_specializing"
+SCHEMA = "CREATE TABLE customers (CustomerID INTEGER, Currency TEXT)"
+QUESTION = "How many customers pay in EUR?"
+STALE = "Please tell me how many customers pay in EUR"
+LIVE = "Can you show me how many customers pay in EUR"
+
+
+def _cache(tmp_path, ttl=0.0):
+    return AnswerCache(str(tmp_path / "answers.sqlite"), ttl=ttl, min_similarity=0.5)
+
+
+def _age(cache, question, seconds):
+    cache._conn.execute("UPDATE answers SET created = created - ? WHERE question = ?", (seconds, question))
+
+
+def test_exact_and_approximate_hits_stay_within_a_dialect(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put(DB_ID, SCHEMA, QUESTION, "", "SELECT 1", dialect="mysql")
+    assert cache.get(DB_ID, SCHEMA, QUESTION, "", dialect="mysql").tier == "exact"
+    assert cache.get(DB_ID, SCHEMA, "how many customers pay in eur", "", dialect="mysql").tier == "exact"
+    assert cache.get(DB_ID, SCHEMA, LIVE, "", dialect="mysql").tier == "approximate"
+    assert cache.get(DB_ID, SCHEMA, QUESTION, "", dialect="postgresql") is None
+    assert cache.get(DB_ID, SCHEMA, QUESTION, "EUR means euro", dialect="mysql") is None
+
+
+def test_expired_best_candidate_does_not_hide_a_live_one(tmp_path):
+    cache = _cache(tmp_path, ttl=60)
+    cache.put(DB_ID, SCHEMA, STALE, "", "SELECT 'stale'", dialect="mysql")
+    cache.put(DB_ID, SCHEMA, LIVE, "", "SELECT 'live'", dialect="mysql")
+    _age(cache, STALE, 3600)
+    # The stale entry is the nearer neighbour, so it is tried first
+    assert similarity(minhash(QUESTION), minhash(STALE)) > similarity(minhash(QUESTION), minhash(LIVE))
+
+    hit = cache.get(DB_ID, SCHEMA, QUESTION, "", dialect="mysql")
+    assert hit is not None and hit.tier == "approximate"
+    assert hit.final_query == "SELECT 'live'" and hit.cached_question == LIVE
+    # The expired entry is gone, the live one stays
+    questions = [row[0] for row in cache._conn.execute("SELECT question FROM answers")]
+    assert questions == [LIVE]
+
+
+def test_expired_exact_entry_is_a_miss(tmp_path):
+    cache = _cache(tmp_path, ttl=60)
+    cache.put(DB_ID, SCHEMA, QUESTION, "", "SELECT 1", dialect="mysql")
+    _age(cache, QUESTION, time.time())
+    assert cache.get(DB_ID, SCHEMA, QUESTION, "", dialect="mysql") is None
+    assert cache.misses == 1
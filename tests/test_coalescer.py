@@ -0,0 +1,91 @@
+"""CoalescingExecutor: shared runs for identical keys, admission control and cleanup."""
+import threading
+
+import pytest
+
+from control.coalescer import CoalescingExecutor, QueueFull
+
+
+@pytest.fixture()
+def executor():
+    executor = CoalescingExecutor(workers=1, max_queue=1)
+    yield executor
+    executor.shutdown(wait=False)
+
+
+def test_identical_keys_share_one_run(executor):
+    release = threading.Event()
+    calls = []
+
+    def run(value):
+        calls.append(value)
+        release.wait(5)
+        return value * 2
+
+    first, coalesced_first = executor.submit("q", run, 21)
+    second, coalesced_second = executor.submit("q", run, 21)
+    assert (coalesced_first, coalesced_second) == (False, True)
+    assert second is first
+    release.set()
+    assert first.result(5) == 42
+    assert calls == [21]
+    stats = executor.stats()
+    assert (stats["executed"], stats["coalesced"], stats["in_flight_keys"]) == (1, 1, 0)
+
+
+def test_rejects_beyond_workers_plus_queue(executor):
+    release = threading.Event()
+    running = threading.Event()
+
+    def run():
+        running.set()
+        release.wait(5)
+
+    busy, _ = executor.submit("a", run)
+    assert running.wait(5)
+    waiting, _ = executor.submit("b", run)
+    assert executor.queue_depth == 1
+    with pytest.raises(QueueFull):
+        executor.submit("c", run)
+    # A request for a key already in flight still joins it
+    joined, coalesced = executor.submit("b", run)
+    assert coalesced and joined is waiting
+    assert executor.stats()["rejected"] == 1
+
+    release.set()
+    busy.result(5)
+    waiting.result(5)
+    # Capacity is back once the runs finish
+    again, _ = executor.submit("c", lambda: "ok")
+    assert again.result(5) == "ok"
+
+
+def test_failed_run_is_not_kept_in_flight(executor):
+    def fail():
+        raise ValueError("boom")
+
+    future, _ = executor.submit("q", fail)
+    with pytest.raises(ValueError):
+        future.result(5)
+    assert executor.stats()["in_flight_keys"] == 0
+
+    retry, coalesced = executor.submit("q", lambda: "fixed")
+    assert not coalesced
+    assert retry.result(5) == "fixed"
+    assert executor.stats()["executed"] == 2
+
+
+def test_warm_runs_once_per_worker():
+    executor = CoalescingExecutor(workers=3, max_queue=0)
+    threads = set()
+    lock = threading.Lock()
+
+    def build():
+        with lock:
+            threads.add(threading.get_ident())
+
+    try:
+        executor.warm(build)
+        assert len(threads) == 3
+    finally:
+        executor.shutdown(wait=False)
@@ -0,0 +1,116 @@
+"""Per-model dispatching in front of the fake Ollama server."""
+import json
+import threading
+import time
+import urllib.request
+
+from llm.dispatcher import (PRIORITY_ANALYSIS, PRIORITY_DEFAULT, PRIORITY_FALLBACK, PRIORITY_VALIDATION,
+                            LLMDispatcher)
+from llm.fake_ollama_server import FakeOllamaServer
+
+SMALL = "gemma2:2b"
+LARGE = "sqlcoder:7b"
+
+
+def chat(server: FakeOllamaServer, model: str) -> str:
+    payload = {"model": model, "stream": False, "messages": [{"role": "user", "content": "SELECT?"}]}
+    request = urllib.request.Request(server.base_url + "/api/chat", data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())["message"]["content"]
+
+
+def wait_for_queue(dispatcher: LLMDispatcher, model: str, depth: int) -> None:
+    deadline = time.time() + 10
+    while dispatcher.stats()["queue_depth"].get(model, 0) < depth:
+        assert time.time() < deadline, "requests never queued"
+        time.sleep(0.005)
+
+
+def start(target, *args) -> threading.Thread:
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_lower_priority_numbers_are_granted_first():
+    dispatcher = LLMDispatcher(max_in_flight_per_model=1)
+    gate = threading.Event()
+    order = []
+    blocker = start(dispatcher.run, SMALL, gate.wait)
+    threads = []
+    for depth, priority in enumerate([PRIORITY_DEFAULT, PRIORITY_ANALYSIS, PRIORITY_FALLBACK, PRIORITY_VALIDATION], 1):
+        threads.append(start(dispatcher.run, SMALL, lambda p=priority: order.append(p), priority))
+        wait_for_queue(dispatcher, SMALL, depth)
+    gate.set()
+    for thread in [blocker] + threads:
+        thread.join(10)
+    assert order == [PRIORITY_FALLBACK, PRIORITY_VALIDATION, PRIORITY_ANALYSIS, PRIORITY_DEFAULT]
+
+
+def test_interleaved_models_are_grouped_into_one_swap():
+    with FakeOllamaServer(latency=0.02, swap_delay=0.05, parallel=4) as server:
+        # Alternating calls straight to the server reload the model every time
+        for model in [SMALL, LARGE] * 3:
+            chat(server, model)
+        assert server.swaps == 5
+
+    with FakeOllamaServer(latency=0.02, swap_delay=0.05, parallel=4) as server:
+        dispatcher = LLMDispatcher(max_in_flight_per_model=4, max_loaded_models=1)
+        gate = threading.Event()
+        results = []
+        blocker = start(dispatcher.run, SMALL, lambda: (gate.wait(), chat(server, SMALL)))
+        threads = []
+        for model in [LARGE, SMALL] * 4:
+            threads.append(start(lambda m=model: results.append(dispatcher.run(m, lambda: chat(server, m)))))
+        wait_for_queue(dispatcher, LARGE, 4)
+        gate.set()
+        for thread in [blocker] + threads:
+            thread.join(30)
+        assert len(results) == 8
+        # The small model's requests all run before the large model is loaded once
+        assert dispatcher.model_switches == 1 and dispatcher.model_loads == 2
+        assert server.swaps == 1
+        assert server.requests == {SMALL: 5, LARGE: 4}
+
+
+def test_switch_batch_lets_a_waiting_model_in():
+    dispatcher = LLMDispatcher(max_in_flight_per_model=1, max_loaded_models=1, switch_batch=2)
+    gate = threading.Event()
+    order = []
+    blocker = start(dispatcher.run, SMALL, gate.wait)
+    threads = [start(dispatcher.run, SMALL, lambda: order.append(SMALL)) for _ in range(3)]
+    wait_for_queue(dispatcher, SMALL, 3)
+    threads.append(start(dispatcher.run, LARGE, lambda: order.append(LARGE)))
+    wait_for_queue(dispatcher, LARGE, 1)
+    gate.set()
+    for thread in [blocker] + threads:
+        thread.join(10)
+    # Two grants fill the small model's batch; the large model goes before the third
+    assert order == [SMALL, LARGE, SMALL, SMALL]
+    assert dispatcher.model_switches == 2
+
+
+def test_queue_depth_metrics():
+    dispatcher = LLMDispatcher(max_in_flight_per_model=2, max_loaded_models=1)
+    gate = threading.Event()
+    threads = [start(dispatcher.run, SMALL, gate.wait) for _ in range(5)]
+    wait_for_queue(dispatcher, SMALL, 3)
+    threads += [start(dispatcher.run, LARGE, gate.wait) for _ in range(2)]
+    wait_for_queue(dispatcher, LARGE, 2)
+
+    stats = dispatcher.stats()
+    assert stats["queue_depth"] == {SMALL: 3, LARGE: 2}
+    assert stats["in_flight"] == {SMALL: 2}
+    assert stats["loaded_models"] == [SMALL]
+    assert stats["granted"] == 2
+
+    gate.set()
+    for thread in threads:
+        thread.join(10)
+    stats = dispatcher.stats()
+    assert stats["queue_depth"] == {SMALL: 0, LARGE: 0}
+    assert stats["max_queue_depth"][SMALL] >= 3 and stats["max_queue_depth"][LARGE] == 2
+    assert stats["in_flight"] == {SMALL: 0, LARGE: 0}
+    assert stats["granted"] == 7 and stats["model_switches"] == 1
+    assert set(stats["total_wait_s"]) == {SMALL, LARGE}
@@ -0,0 +1,42 @@
+"""Token counts from the Ollama client, including streams stopped early."""
+from llm.fake_ollama_server import FakeOllamaServer
+from llm.ollama_client import OllamaClient
+from llm.tokens import get_token_counter
+from planning.tracing import Tracer, record_llm_call
+
+MODEL = "sqlcoder:7b"
+MESSAGES = [{"role": "system", "content": "You write SQL."},
+            {"role": "user", "content": "How many customers pay in EUR? " * 20}]
+
+
+def _client(server):
+    return OllamaClient(server.base_url, timeout=10)
+
+
+def test_complete_stream_reports_the_server_counts():
+    with FakeOllamaServer(chunk_size=4) as server:
+        result = _client(server).chat_stream(MODEL, MESSAGES)
+    assert not result["stopped_early"]
+    assert result["prompt_eval_count"] == sum(len(m["content"].split()) for m in MESSAGES)
+    assert "prompt_eval_count_estimated" not in result and "eval_count_estimated" not in result
+
+
+def test_early_stop_estimates_prompt_and_completion_tokens():
+    with FakeOllamaServer(chunk_size=4, chunk_delay=0.01) as server:
+        result = _client(server).chat_stream(MODEL, MESSAGES, stop_when=lambda chunk: True)
+    counter = get_token_counter()
+    assert result["stopped_early"]
+    assert result["prompt_eval_count"] == counter.count(MODEL, "".join(m["content"] for m in MESSAGES)) > 0
+    assert result["eval_count"] == counter.count(MODEL, result["message"]["content"]) > 0
+    assert result["prompt_eval_count_estimated"] and result["eval_count_estimated"]
+
+
+def test_estimated_calls_are_counted_in_span_totals():
+    tracer = Tracer()
+    with tracer.span("generation"):
+        record_llm_call(100, 40, 5)
+        record_llm_call(100, 38, 3, estimated=True)
+        record_llm_call(100, cached=True)
+    stage = tracer.summary()["stages"]["generation"]
+    assert stage["prompt_tokens"] == 78 and stage["completion_tokens"] == 8
+    assert stage["estimated_token_calls"] == 1 and stage["cached_calls"] == 1
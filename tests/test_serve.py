@@ -0,0 +1,163 @@
+"""The resident HTTP service against the fake Ollama server."""
+import http.client
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from llm.fake_ollama_server import FakeOllamaServer
+
+
+@pytest.fixture(scope="module")
+def serve(tmp_path_factory):
+    # run_pipeline opens its log file in the working directory on import; keep it out of the checkout
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("logs"))
+    try:
+        import serve
+    finally:
+        os.chdir(cwd)
+    from catalog.example_index import disable_example_index
+    from catalog.value_index import disable_value_index
+    from state.answer_cache import disable_answer_cache
+    from state.response_cache import disable_response_cache
+    # Every request reaches the fake server and nothing is written next to the data
+    disable_response_cache()
+    disable_answer_cache()
+    disable_example_index()
+    disable_value_index()
+    return serve
+
+
+@contextmanager
+def running_service(serve, latency=0.0, workers=2, max_queue=4, timeout=30.0):
+    from llm_config import get_dialect_config, get_llm_config, get_sqlcoder_config
+
+    with FakeOllamaServer(latency=latency, parallel=8) as model_server:
+        configs = []
+        for config in (get_llm_config(), get_sqlcoder_config()):
+            config["config_list"] = [{**entry, "base_url": model_server.base_url, "api_type": "ollama"}
+                                     for entry in config["config_list"]]
+            configs.append(config)
+        service = serve.SQLService(configs[0], configs[1], get_dialect_config(), None, workers, max_queue, timeout)
+        http_server = ThreadingHTTPServer(("127.0.0.1", 0), serve.make_handler(service))
+        http_server.daemon_threads = True
+        thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield service, http_server.server_address[1]
+        finally:
+            http_server.shutdown()
+            http_server.server_close()
+            service.executor.shutdown(wait=False)
+
+
+def request(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        data = body if isinstance(body, bytes) or body is None else json.dumps(body).encode("utf-8")
+        conn.request(method, path, body=data, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b"null"), dict(response.getheaders())
+    finally:
+        conn.close()
+
+
+QUESTION = {"db_id": "debit_card_specializing", "question": "How many customers are there?", "evidence": ""}
+
+
+def test_answers_a_question(serve):
+    with running_service(serve) as (service, port):
+        status, body, _ = request(port, "POST", "/v1/sql", QUESTION)
+        assert status == 200
+        assert body["db_id"] == QUESTION["db_id"] and body["coalesced"] is False
+        assert "sql" in body and "timings" in body
+        status, health, _ = request(port, "GET", "/healthz")
+        assert status == 200 and health["status"] == "ok"
+        status, metrics, _ = request(port, "GET", "/metrics")
+        assert status == 200 and metrics["requests"]["requests"] == 1
+
+
+def test_identical_requests_share_a_run(serve):
+    with running_service(serve, latency=0.3, workers=2) as (service, port):
+        results = []
+
+        def ask():
+            results.append(request(port, "POST", "/v1/sql", QUESTION))
+
+        threads = [threading.Thread(target=ask) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        assert [status for status, _, _ in results] == [200] * 4
+        assert sorted(body["coalesced"] for _, body, _ in results) == [False, True, True, True]
+        assert service.executor.stats()["executed"] == 1
+
+
+def test_busy_service_answers_503_with_retry_after(serve):
+    with running_service(serve, latency=1.0, workers=1, max_queue=0) as (service, port):
+        first = threading.Thread(target=request, args=(port, "POST", "/v1/sql", QUESTION))
+        first.start()
+        deadline = time.time() + 10
+        while service.executor.stats()["running"] < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        other = {**QUESTION, "question": "How many gas stations are there?"}
+        status, body, headers = request(port, "POST", "/v1/sql", other)
+        assert status == 503
+        assert headers.get("Retry-After") == "1"
+        assert "busy" in body["error"]
+        first.join(30)
+        assert service.counts["rejected"] == 1
+
+
+def test_slow_answer_times_out_with_504(serve):
+    with running_service(serve, latency=1.0, timeout=0.2) as (service, port):
+        status, body, _ = request(port, "POST", "/v1/sql", QUESTION)
+        assert status == 504
+        assert "0.2" in body["error"]
+        assert service.counts["timeouts"] == 1
+
+
+@pytest.mark.parametrize("body", [
+    {"db_id": "debit_card_specializing"},
+    {"db_id": "debit_card_specializing", "question": "   "},
+    {"db_id": 7, "question": "How many?"},
+    {"db_id": "no_such_db", "question": "How many?"},
+    ["not", "an", "object"],
+])
+def test_malformed_requests_get_400(serve, body):
+    with running_service(serve) as (service, port):
+        status, reply, _ = request(port, "POST", "/v1/sql", body)
+        assert status == 400 and reply["error"]
+        assert service.executor.stats()["executed"] == 0
+
+
+def test_invalid_json_gets_400(serve):
+    with running_service(serve) as (_, port):
+        status, reply, _ = request(port, "POST", "/v1/sql", b"{not json", {"Content-Type": "application/json"})
+        assert status == 400 and "JSON" in reply["error"]
+
+
+def test_oversized_body_gets_413(serve):
+    with running_service(serve) as (_, port):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        try:
+            conn.putrequest("POST", "/v1/sql")
+            conn.putheader("Content-Length", str(serve.MAX_BODY_BYTES + 1))
+            conn.endheaders()
+            response = conn.getresponse()
+            assert response.status == 413
+            assert json.loads(response.read())["error"].startswith("Body over")
+        finally:
+            conn.close()
+
+
+def test_unknown_paths_get_404(serve):
+    with running_service(serve) as (_, port):
+        assert request(port, "GET", "/nope")[0] == 404
+        assert request(port, "POST", "/v2/sql", QUESTION)[0] == 404
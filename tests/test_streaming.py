@@ -0,0 +1,55 @@
+"""Incremental SQL extraction from streamed replies."""
+import pytest
+
+from llm.parsing import extract_sql
+from llm.streaming import SQLStreamExtractor
+
+SQL = "SELECT name FROM customers WHERE segment = 'SME'"
+
+
+def stream(text: str, size: int):
+    """Feed `text` in chunks of `size`; return the extractor and how much of the text was read."""
+    extractor = SQLStreamExtractor()
+    for start in range(0, len(text), size):
+        if extractor.feed(text[start:start + size]):
+            return extractor, start + size
+    return extractor, len(text)
+
+
+@pytest.mark.parametrize("size", [1, 3, 8, 1000])
+@pytest.mark.parametrize("prose", [
+    "Here is the corrected query, with comments:\n",
+    "I will select the rows:\n",
+    "WITH the feedback applied, the query becomes:\n",
+])
+def test_prose_before_a_fence_is_not_sql(prose, size):
+    reply = prose + "```sql\n" + SQL + "\n```\nThis keeps only SME customers."
+    extractor, read = stream(reply, size)
+    assert extractor.sql == SQL
+    # Stopped at the closing fence, not at the opening one
+    assert read >= reply.index("\n```\n") + 1
+    assert extract_sql(reply) == SQL
+
+
+@pytest.mark.parametrize("size", [1, 5, 1000])
+def test_bare_statement_after_the_primed_fence(size):
+    # The generator prompt ends in an open ```sql block, so replies start with the statement itself
+    extractor, read = stream(SQL + ";\n```\nThis query selects SME customers.", size)
+    assert extractor.sql == SQL
+    assert read <= len(SQL) + size
+
+
+def test_statement_keyword_must_start_a_line():
+    extractor, _ = stream("We select the rows with a filter and stop.", 4)
+    assert extractor.finish() is None
+
+
+def test_semicolons_in_literals_do_not_end_the_statement():
+    sql = "SELECT a FROM t WHERE b = 'x;y' -- not; the end\nAND c = 1"
+    extractor, _ = stream(sql + ";\nDone.", 2)
+    assert extractor.sql == sql
+
+
+def test_empty_fence_is_skipped():
+    extractor, _ = stream("```sql\n```\n```sql\n" + SQL + "\n```", 4)
+    assert extractor.sql == SQL
@@ -0,0 +1,52 @@
+"""Synthetic databases never replace existing ones unless forced."""
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from evaluation.execution_evaluator import database_path
+from evaluation.synthetic_db import build_all
+
+DB_ID = "debit_card_specializing"
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _mark(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE marker (x INTEGER)")
+    conn.commit()
+    conn.close()
+
+
+def _has_marker(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT count(*) FROM sqlite_master WHERE name = 'marker'").fetchone()[0] == 1
+    finally:
+        conn.close()
+
+
+def test_existing_databases_are_kept_without_force(tmp_path):
+    root = str(tmp_path)
+    built = build_all(root, rows_per_table=5)
+    assert os.path.exists(built[DB_ID])
+    _mark(built[DB_ID])
+    with pytest.raises(FileExistsError):
+        build_all(root, rows_per_table=5)
+    assert _has_marker(database_path(DB_ID, root))
+
+    build_all(root, rows_per_table=5, force=True)
+    assert not _has_marker(database_path(DB_ID, root))
+
+
+def test_command_line_needs_an_explicit_root(tmp_path):
+    run = lambda *args: subprocess.run([sys.executable, "-m", "evaluation.synthetic_db", *args], cwd=REPO_ROOT,
+                                       capture_output=True, text=True)
+    assert run().returncode == 2
+    root = str(tmp_path)
+    assert run("--root", root, "--rows", "2").returncode == 0
+    refused = run("--root", root, "--rows", "2")
+    assert refused.returncode == 1 and "Refusing to overwrite" in refused.stderr
+    assert run("--root", root, "--rows", "2", "--force").returncode == 0
@@ -0,0 +1,112 @@
+"""Value index against synthetic SQLite databases generated from dev_tables.json."""
+import os
+import sqlite3
+
+import pytest
+
+from catalog.schema_catalog import get_schema_catalog
+from catalog.value_index import (MIN_FUZZY_LENGTH, ValueIndex, build_value_index, compiled_index_path,
+                                 load_or_build_index)
+from evaluation.execution_evaluator import database_path
+from evaluation.synthetic_db import build_all
+
+DB_ID = "debit_card_specializing"
+
+
+def _execute(root, *statements):
+    conn = sqlite3.connect(database_path(DB_ID, root))
+    for statement in statements:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture()
+def root(tmp_path):
+    root = str(tmp_path / "dbs")
+    build_all(root, rows_per_table=30, seed=0)
+    # Values the synthetic generator never produces, each in a single column
+    _execute(root,
+             "UPDATE customers SET Segment = 'Premium Fleet' WHERE CustomerID = 1",
+             "UPDATE OR IGNORE yearmonth SET Date = '201201' WHERE rowid = 1")
+    return root
+
+
+def _hits(matches):
+    return {(match.table, match.column, match.value): match.score for match in matches}
+
+
+def test_save_and_mapped_load_round_trip(root, tmp_path):
+    built = build_value_index(get_schema_catalog().get(DB_ID), root)
+    path = str(tmp_path / "index" / "values")
+    os.makedirs(os.path.dirname(path))
+    built.save(path)
+    loaded = ValueIndex.load(path)
+
+    assert isinstance(loaded.postings, memoryview)
+    assert len(loaded) == len(built) > 0
+    assert loaded.columns == built.columns
+    assert loaded.grams == built.grams
+    assert [loaded.value(i) for i in range(len(loaded))] == [built.value(i) for i in range(len(built))]
+    assert list(loaded.postings) == list(built.postings)
+    question = "Which Premium Fleet customers paid in EUR in 201201?"
+    assert loaded.lookup(question, k=10) == built.lookup(question, k=10)
+
+
+def test_exact_literals_map_to_their_columns(root):
+    index = build_value_index(get_schema_catalog().get(DB_ID), root)
+    hits = _hits(index.lookup("How many customers are in the premium fleet segment?", k=3))
+    assert hits[("customers", "Segment", "Premium Fleet")] == 1.0
+
+    hits = _hits(index.lookup("Total consumption", "Date = '201201'", k=3))
+    assert hits[("yearmonth", "Date", "201201")] == 1.0
+
+
+def test_misspelled_literal_is_a_fuzzy_hit(root):
+    index = build_value_index(get_schema_catalog().get(DB_ID), root)
+    matches = index.lookup("How many customers are in the Premium Flet segment?", k=3, min_similarity=0.6)
+    assert matches[0].table == "customers" and matches[0].column == "Segment"
+    assert matches[0].value == "Premium Fleet"
+    assert 0.6 <= matches[0].score < 1.0
+
+
+def test_short_values_only_match_exactly(root):
+    index = build_value_index(get_schema_catalog().get(DB_ID), root)
+    assert len("EUR") < MIN_FUZZY_LENGTH
+
+    exact = index.lookup("Customers paying in EUR", k=20)
+    assert any(match.value == "EUR" and match.score == 1.0 for match in exact)
+
+    # 'EURO' shares most trigrams with 'EUR' but is neither equal to it nor long enough on both sides
+    fuzzy = index.lookup("Customers paying in EURO", k=20, min_similarity=0.3)
+    assert all(match.value != "EUR" for match in fuzzy)
+
+
+def test_columns_over_the_distinct_limit_are_skipped(root):
+    index = build_value_index(get_schema_catalog().get(DB_ID), root, max_distinct=3)
+    conn = sqlite3.connect(database_path(DB_ID, root))
+    for table, column in index.columns:
+        distinct = conn.execute(f'SELECT COUNT(DISTINCT "{column}") FROM "{table}"').fetchone()[0]
+        assert distinct <= 3
+    conn.close()
+
+
+def test_rebuilt_when_the_database_changes(root):
+    first = load_or_build_index(DB_ID, root)
+    assert os.path.exists(compiled_index_path(DB_ID, root) + ".bin")
+    assert not _hits(first.lookup("Customers in the Zeta Lounge segment"))
+
+    reloaded = load_or_build_index(DB_ID, root)
+    assert isinstance(reloaded.postings, memoryview)  # Mapped from the compiled file, not rebuilt
+    assert reloaded.source == first.source
+
+    _execute(root, "UPDATE customers SET Segment = 'Zeta Lounge' WHERE CustomerID = 2")
+    path = database_path(DB_ID, root)
+    stat = os.stat(path)
+    # A signature change even when the write lands in the same mtime tick
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    rebuilt = load_or_build_index(DB_ID, root)
+    assert rebuilt.source != first.source
+    assert _hits(rebuilt.lookup("Customers in the Zeta Lounge segment"))[("customers", "Segment", "Zeta Lounge")] == 1.0
+    assert isinstance(load_or_build_index(DB_ID, root).postings, memoryview)
@@ -0,0 +1,62 @@
+"""Workers leasing questions from a shared queue file."""
+import threading
+import time
+
+from control.work_queue import DONE, WorkQueue, run_worker
+
+
+def _queue(tmp_path, count, max_attempts=3):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), lease_seconds=30, max_attempts=max_attempts)
+    queue.enqueue([{"question_id": i, "question": f"q{i}"} for i in range(count)])
+    return queue
+
+
+class _Calls:
+    """A question function that records concurrency and is slow for chosen first attempts."""
+
+    def __init__(self, slow=(), delay=0.0, slow_delay=1.0):
+        self.slow = set(slow)
+        self.delay = delay
+        self.slow_delay = slow_delay
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, question):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            slow = question["question_id"] in self.slow
+            self.slow.discard(question["question_id"])
+        try:
+            time.sleep(self.slow_delay if slow else self.delay)
+            return {"status": "ok", "final_sql": "SELECT 1"}
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_questions_behind_a_straggler_still_run(tmp_path):
+    queue = _queue(tmp_path, 4)
+    calls = _Calls(slow=[0], delay=0.05)
+    ran = run_worker(queue, calls, workers=1, timeout=0.3, poll_interval=0.05)
+    records = {record["question_id"]: record for record in queue.records()}
+
+    assert queue.counts()[DONE] == 4
+    # The straggler times out once and is retried; the questions queued behind it never time out
+    assert records[0]["attempts"] == 2
+    assert all(records[i]["status"] == "ok" and records[i]["attempts"] == 1 for i in (1, 2, 3))
+    assert ran == 5
+    # Its thread is not replaced while it runs on past the timeout
+    assert calls.peak == 1
+    queue.close()
+
+
+def test_timed_out_calls_count_against_workers(tmp_path):
+    queue = _queue(tmp_path, 6)
+    calls = _Calls(slow=[0, 1], delay=0.05, slow_delay=0.5)
+    run_worker(queue, calls, workers=2, timeout=0.1, poll_interval=0.05)
+
+    assert queue.counts()[DONE] == 6
+    assert calls.peak == 2
+    queue.close()
@@ -0,0 +1,13 @@
+"""
+Text normalisation shared by the caches and the catalog indexes.
+"""
+import re
+import unicodedata
+
+
+def canonical_text(text: str) -> str:
+    """Case, whitespace, quote-style and trailing punctuation differences do not change the answer."""
+    text = unicodedata.normalize("NFKC", text or "")
+    text = text.replace("‘", "'").replace("’", "'").replace("“", '"').replace("”", '"')
+    text = re.sub(r"\s+", " ", text).strip().lower()
+    return text.rstrip("?.!; ").strip()